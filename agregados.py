@@ -0,0 +1,395 @@
+import argparse
+import sqlite3
+import time
+
+import alteracoes
+import particoes
+from consultas import filtros_ativos, renderizar
+
+# Tabelas de origem cujo conteúdo alimenta os rollups
+TABELAS_ORIGEM = ['Medicao', 'ETA', 'Municipio', 'Estado', 'Regiao', 'Parametro']
+
+# Rollup da tabela fato, chaveado por (região, UF, ETA, parâmetro, campo, ano, mês).
+# Os LEFT JOINs preservam medições órfãs com chaves nulas, de modo que cada
+# consulta reescrita aplica os mesmos filtros que seus INNER JOINs originais.
+# {periodo} restringe a agregação a um único (ano, mês) na atualização incremental.
+SQL_ROLLUP = '''
+SELECT
+    r.id_regiao,
+    e.id_estado,
+    mun.id_municipio,
+    eta.id_eta,
+    p.id_parametro,
+    med.id_campo,
+    med.ano_referencia,
+    med.mes_referencia,
+    COUNT(med.id_medicao) AS total_medicoes,
+    SUM(med.valor_medido) AS soma_valor
+FROM Medicao med
+LEFT JOIN ETA eta ON eta.id_eta = med.id_eta
+LEFT JOIN Municipio mun ON mun.id_municipio = eta.id_municipio
+LEFT JOIN Estado e ON e.id_estado = mun.id_estado
+LEFT JOIN Regiao r ON r.id_regiao = e.id_regiao
+LEFT JOIN Parametro p ON p.id_parametro = med.id_parametro
+{periodo}
+GROUP BY
+    r.id_regiao, e.id_estado, mun.id_municipio, eta.id_eta,
+    p.id_parametro, med.id_campo, med.ano_referencia, med.mes_referencia
+'''
+
+FILTRO_PERIODO = 'WHERE med.ano_referencia IS :ano AND med.mes_referencia IS :mes'
+
+# Chaves que o rollup percorre: (tabela referenciada, coluna, tabela que referencia).
+# Um membro novo numa dimensão só invalida o que já foi agregado se alguma linha
+# antiga o referenciava (até então ela era órfã e tinha chaves nulas no rollup).
+REFERENCIAS_ROLLUP = [
+    ('ETA', 'id_eta', 'Medicao'),
+    ('Parametro', 'id_parametro', 'Medicao'),
+    ('Municipio', 'id_municipio', 'ETA'),
+    ('Estado', 'id_estado', 'Municipio'),
+    ('Regiao', 'id_regiao', 'Estado'),
+]
+
+# Mesmos filtros de consultas.FILTROS, aplicados às chaves do rollup (alias ru)
+FILTROS_ROLLUP = {
+    'ano': 'ru.ano_referencia = :ano',
+    'mes_inicio': 'ru.mes_referencia >= :mes_inicio',
+    'mes_fim': 'ru.mes_referencia <= :mes_fim',
+    'regiao': 'ru.id_regiao IN (SELECT id_regiao FROM Regiao WHERE nome_regiao = :regiao)',
+    'uf': 'ru.id_estado IN (SELECT id_estado FROM Estado WHERE uf = :uf)',
+    'tecnologia': 'ru.id_eta IN (SELECT id_eta FROM ETA WHERE tipo_filtracao = :tecnologia)',
+    'parametro': 'ru.id_parametro IN (SELECT id_parametro FROM Parametro WHERE nome_parametro = :parametro)',
+}
+
+# Versões das consultas de get_consultas() respondidas a partir do rollup
+CONSULTAS_ROLLUP = {
+    'metricas_gerais': '''
+        SELECT
+            'Estados Monitorados' as tipo, COUNT(DISTINCT e.nome_estado) as valor
+        FROM Estado e
+        INNER JOIN Municipio m ON e.id_estado = m.id_estado
+        INNER JOIN ETA eta ON m.id_municipio = eta.id_municipio
+        UNION ALL
+        SELECT 'ETAs Ativas', COUNT(*) FROM ETA
+        UNION ALL
+        SELECT 'Total de Medições', COALESCE(SUM(total_medicoes), 0) FROM rollup_medicao
+        UNION ALL
+        SELECT 'Parâmetros Monitorados', COUNT(*) FROM Parametro
+        UNION ALL
+        SELECT 'Municípios Atendidos', COUNT(DISTINCT m.id_municipio)
+        FROM Municipio m
+        INNER JOIN ETA eta ON m.id_municipio = eta.id_municipio
+        ''',
+
+    'analise_geografica': '''
+        SELECT
+            r.nome_regiao as "Região",
+            e.uf as "UF",
+            COUNT(DISTINCT ru.id_municipio) as "Municípios",
+            COUNT(DISTINCT ru.id_eta) as "ETAs Ativas",
+            SUM(ru.total_medicoes) as "Total Medições",
+            ROUND(SUM(ru.total_medicoes) * 1.0 / COUNT(DISTINCT ru.id_eta), 0) as "Medições/ETA"
+        FROM rollup_medicao ru
+        INNER JOIN Regiao r ON r.id_regiao = ru.id_regiao
+        INNER JOIN Estado e ON e.id_estado = ru.id_estado
+        WHERE 1 = 1{filtros}
+        GROUP BY r.nome_regiao, e.uf
+        HAVING SUM(ru.total_medicoes) > 0
+        ORDER BY SUM(ru.total_medicoes) DESC
+        ''',
+
+    'performance_instituicao': '''
+        SELECT
+            i.nome_instituicao as "Instituição",
+            i.tipo_instituicao as "Tipo",
+            COUNT(DISTINCT ru.id_eta) as "ETAs",
+            COUNT(DISTINCT ru.id_parametro) as "Parâmetros",
+            SUM(ru.total_medicoes) as "Medições",
+            ROUND(SUM(ru.total_medicoes) * 1.0 / COUNT(DISTINCT ru.id_eta), 0) as "Med/ETA"
+        FROM rollup_medicao ru
+        INNER JOIN ETA eta ON eta.id_eta = ru.id_eta
+        INNER JOIN Escritorio_Regional er ON er.id_escritorio = eta.id_escritorio
+        INNER JOIN Instituicao i ON i.id_instituicao = er.id_instituicao
+        WHERE ru.id_parametro IS NOT NULL{filtros}
+        GROUP BY i.nome_instituicao, i.tipo_instituicao
+        HAVING SUM(ru.total_medicoes) > 1000
+        ORDER BY COUNT(DISTINCT ru.id_eta) DESC
+        ''',
+
+    'ranking_estados': '''
+        SELECT
+            e.nome_estado as "Estado",
+            COUNT(DISTINCT ru.id_eta) as "ETAs",
+            COUNT(DISTINCT ru.id_parametro) as "Parâmetros",
+            SUM(ru.total_medicoes) as "Medições"
+        FROM rollup_medicao ru
+        INNER JOIN Estado e ON e.id_estado = ru.id_estado
+        WHERE ru.id_parametro IS NOT NULL{filtros}
+        GROUP BY e.nome_estado
+        HAVING COUNT(DISTINCT ru.id_eta) >= 5
+        ORDER BY COUNT(DISTINCT ru.id_parametro) DESC, SUM(ru.total_medicoes) DESC
+        ''',
+
+    'evolucao_temporal': '''
+        SELECT
+            r.nome_regiao as "Região",
+            ru.mes_referencia as "Mês",
+            SUM(ru.total_medicoes) as "Total de Registros",
+            COUNT(DISTINCT ru.id_eta) as "ETAs Ativas",
+            COUNT(DISTINCT ru.id_parametro) as "Parâmetros Distintos",
+            ROUND(SUM(ru.total_medicoes) * 1.0 / COUNT(DISTINCT ru.id_eta), 1) as "Intensidade (Reg/ETA)",
+            ROUND(COUNT(DISTINCT ru.id_parametro) * 1.0 / COUNT(DISTINCT ru.id_eta), 2) as "Diversidade (Par/ETA)",
+            CASE
+                WHEN ru.mes_referencia <= 2 THEN 'Início do Ano'
+                WHEN ru.mes_referencia <= 4 THEN 'Meio do Ano'
+                ELSE 'Segundo Semestre'
+            END as "Período"
+        FROM rollup_medicao ru
+        INNER JOIN Regiao r ON r.id_regiao = ru.id_regiao
+        WHERE ru.id_parametro IS NOT NULL{filtros}
+        GROUP BY r.nome_regiao, ru.mes_referencia
+        HAVING SUM(ru.total_medicoes) >= 100
+        ORDER BY r.nome_regiao, ru.mes_referencia
+        ''',
+
+    'parametros_categoria': '''
+        SELECT
+            p.categoria_parametro as "Categoria",
+            p.nome_parametro as "Parâmetro",
+            SUM(ru.total_medicoes) as "Total Medições",
+            ROUND(SUM(ru.total_medicoes) * 100.0 / (SELECT SUM(total_medicoes) FROM rollup_medicao ru WHERE 1 = 1{filtros}), 2) as "% do Total"
+        FROM Parametro p
+        INNER JOIN rollup_medicao ru ON p.id_parametro = ru.id_parametro
+        WHERE 1 = 1{filtros}
+        GROUP BY p.categoria_parametro, p.nome_parametro
+        ORDER BY p.categoria_parametro, SUM(ru.total_medicoes) DESC
+        ''',
+}
+
+
+def assinatura_origem(conn):
+    """Retorna (tabela, linhas, maior rowid, alterações) de cada tabela de origem.
+
+    Só o banco principal entra na assinatura: as partições anuais da Medicao
+    (particoes.py) são imutáveis, e fechar um ano aparece aqui como linhas
+    apagadas, o que força uma reconstrução completa. As alterações são os
+    UPDATEs e DELETEs contados pelos gatilhos de alteracoes.py.
+    """
+    contadas = alteracoes.contagens(conn)
+    assinatura = []
+    for tabela in TABELAS_ORIGEM:
+        linhas, max_rowid = conn.execute(
+            f'SELECT COUNT(*), COALESCE(MAX(rowid), 0) FROM main.{tabela}'
+        ).fetchone()
+        assinatura.append((tabela, linhas, max_rowid, contadas.get(tabela, 0)))
+    return assinatura
+
+
+def _assinatura_gravada(conn):
+    existe = conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' "
+        "AND name IN ('rollup_controle', 'rollup_medicao')"
+    ).fetchone()[0]
+    if existe < 2:
+        return None
+    # Controles gravados antes do contador de alterações têm três colunas e
+    # nunca são iguais à assinatura atual
+    return conn.execute('SELECT * FROM rollup_controle ORDER BY tabela').fetchall()
+
+
+def rollups_desatualizados(conn):
+    gravada = _assinatura_gravada(conn)
+    return gravada is None or sorted(gravada) != sorted(assinatura_origem(conn))
+
+
+def _gravar_assinatura(conn, assinatura):
+    conn.execute('DROP TABLE IF EXISTS rollup_controle')
+    conn.execute(
+        'CREATE TABLE rollup_controle ('
+        'tabela TEXT PRIMARY KEY, linhas INTEGER, max_rowid INTEGER, alteracoes INTEGER)'
+    )
+    conn.executemany('INSERT INTO rollup_controle VALUES (?, ?, ?, ?)', assinatura)
+
+
+# Estruturas derivadas do rollup (cubo.py, esbocos.py) guardam uma cópia do
+# rollup_controle de quando foram atualizadas: se ela ainda é igual à atual,
+# nada mudou desde então
+def assinatura_controle(conn, tabela='rollup_controle'):
+    """Assinatura gravada em `tabela` (ordenada), ou None se a tabela não existe."""
+    existe = conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = ?", (tabela,)
+    ).fetchone()[0]
+    if not existe:
+        return None
+    return sorted(conn.execute(f'SELECT * FROM {tabela}').fetchall())
+
+
+def copiar_controle(conn, tabela):
+    """Grava em `tabela` a assinatura atual do rollup_controle."""
+    conn.execute(f'DROP TABLE IF EXISTS {tabela}')
+    conn.execute(f'CREATE TABLE {tabela} AS SELECT * FROM rollup_controle')
+
+
+def totais_rollup(conn, *colunas):
+    """{período: (linhas, total de medições)} do rollup_medicao agrupado por `colunas`.
+
+    Com uma coluna, o período é o valor dela; com várias, a tupla dos valores.
+    Só os períodos que mudaram entre duas leituras precisam ser refeitos.
+    """
+    grupo = ', '.join(colunas)
+    nao_nulos = ' AND '.join(f'{coluna} IS NOT NULL' for coluna in colunas)
+    return {
+        (tuple(linha[:-2]) if len(colunas) > 1 else linha[0]): (linha[-2], linha[-1])
+        for linha in conn.execute(
+            f'SELECT {grupo}, COUNT(*), SUM(total_medicoes) FROM rollup_medicao '
+            f'WHERE {nao_nulos} GROUP BY {grupo}'
+        )
+    }
+
+
+def periodos_novos(conn, gravada=None, atual=None):
+    """(ano, mês) que receberam linhas desde a última construção dos rollups.
+
+    Retorna None quando a mudança não é um simples acréscimo de linhas (linhas
+    apagadas ou alteradas, assinatura ausente, membro novo referenciado por
+    linhas antigas), caso em que os rollups precisam ser reconstruídos por completo.
+    """
+    gravada = gravada if gravada is not None else _assinatura_gravada(conn)
+    atual = atual if atual is not None else assinatura_origem(conn)
+    if gravada is None or any(len(linha) != 4 for linha in gravada):
+        return None
+    antes = {tabela: (linhas, max_rowid, alteradas) for tabela, linhas, max_rowid, alteradas in gravada}
+    agora = {tabela: (linhas, max_rowid, alteradas) for tabela, linhas, max_rowid, alteradas in atual}
+    if set(antes) != set(agora):
+        return None
+    for tabela, (linhas, max_rowid, alteradas) in agora.items():
+        linhas_antes, max_antes, alteradas_antes = antes[tabela]
+        if alteradas != alteradas_antes:
+            return None
+        if (linhas, max_rowid) == (linhas_antes, max_antes):
+            continue
+        if linhas < linhas_antes or max_rowid < max_antes:
+            return None
+        acrescentadas = conn.execute(
+            f'SELECT COUNT(*) FROM main.{tabela} WHERE rowid > ?', (max_antes,)
+        ).fetchone()[0]
+        if linhas - linhas_antes != acrescentadas:
+            return None
+    for referenciada, coluna, origem in REFERENCIAS_ROLLUP:
+        if agora[referenciada] == antes[referenciada]:
+            continue
+        novos = f'(SELECT {coluna} FROM main.{referenciada} WHERE rowid > :novos)'
+        anteriores = [f'SELECT 1 FROM main.{origem} WHERE rowid <= :antes AND {coluna} IN {novos}']
+        if origem == 'Medicao':
+            # Todas as linhas das partições anuais são anteriores
+            anteriores += [f'SELECT 1 FROM {esquema}.Medicao WHERE {coluna} IN {novos}'
+                           for esquema in particoes.esquemas_anexados(conn)]
+        limites = {'antes': antes[origem][1], 'novos': antes[referenciada][1]}
+        for sql in anteriores:
+            if conn.execute(f'{sql} LIMIT 1', limites).fetchone():
+                return None
+    return conn.execute(
+        'SELECT DISTINCT ano_referencia, mes_referencia FROM main.Medicao WHERE rowid > ? '
+        'ORDER BY ano_referencia, mes_referencia',
+        (antes['Medicao'][1],),
+    ).fetchall()
+
+
+def construir_rollups(conn):
+    """(Re)constrói rollup_medicao e grava a assinatura das tabelas de origem."""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        alteracoes.instalar(conn)
+        conn.execute('DROP TABLE IF EXISTS rollup_medicao')
+        conn.execute(f'CREATE TABLE rollup_medicao AS {SQL_ROLLUP.format(periodo="")}')
+        conn.execute(
+            'CREATE INDEX idx_rollup_medicao_periodo '
+            'ON rollup_medicao (ano_referencia, mes_referencia)'
+        )
+        _gravar_assinatura(conn, assinatura_origem(conn))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def atualizar_rollups(conn, forcar=False):
+    """Atualiza os rollups pelo caminho mais barato possível.
+
+    Quando só houve acréscimo de linhas, apenas os períodos (ano, mês) que as
+    receberam são reagregados, e o custo acompanha o volume novo e não a
+    tabela inteira. Retorna {'modo': 'atual' | 'incremental' | 'completo',
+    'periodos': [...]}.
+    """
+    if not forcar:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            alteracoes.instalar(conn)
+            gravada, atual = _assinatura_gravada(conn), assinatura_origem(conn)
+            if gravada is not None and sorted(gravada) == sorted(atual):
+                conn.rollback()
+                return {'modo': 'atual', 'periodos': []}
+            periodos = periodos_novos(conn, gravada, atual)
+            if periodos is not None:
+                sql_periodo = f'INSERT INTO rollup_medicao {SQL_ROLLUP.format(periodo=FILTRO_PERIODO)}'
+                for ano, mes in periodos:
+                    conn.execute(
+                        'DELETE FROM rollup_medicao '
+                        'WHERE ano_referencia IS :ano AND mes_referencia IS :mes',
+                        {'ano': ano, 'mes': mes},
+                    )
+                    conn.execute(sql_periodo, {'ano': ano, 'mes': mes})
+                _gravar_assinatura(conn, atual)
+                conn.commit()
+                return {'modo': 'incremental', 'periodos': periodos}
+            conn.rollback()
+        except Exception:
+            conn.rollback()
+            raise
+    construir_rollups(conn)
+    return {'modo': 'completo', 'periodos': []}
+
+
+def garantir_rollups(conn, forcar=False):
+    """Atualiza os rollups quando estão desatualizados.
+
+    Retorna True se os rollups estão prontos para uso; False se não puderam
+    ser construídos (ex.: banco somente leitura), caso em que as consultas
+    originais continuam sendo usadas.
+    """
+    try:
+        atualizar_rollups(conn, forcar=forcar)
+        return True
+    except sqlite3.Error:
+        return False
+
+
+def montar_consulta(nome, filtros=None):
+    """Retorna (sql, parâmetros) da versão sobre o rollup, ou None se não houver."""
+    template = CONSULTAS_ROLLUP.get(nome)
+    if template is None:
+        return None
+    ativos = filtros_ativos(nome, filtros, template)
+    return renderizar(template, FILTROS_ROLLUP, ativos), ativos
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Atualiza os rollups do sisagua.db')
+    parser.add_argument('banco', nargs='?', default='sisagua.db')
+    parser.add_argument('--forcar', action='store_true',
+                        help='reconstrói mesmo que os rollups estejam atualizados')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.banco)
+    particoes.anexar(conn, args.banco)
+    inicio = time.perf_counter()
+    resultado = atualizar_rollups(conn, forcar=args.forcar)
+    decorrido = time.perf_counter() - inicio
+    if resultado['modo'] == 'atual':
+        print('Rollups já estão atualizados.')
+    elif resultado['modo'] == 'incremental':
+        periodos = ', '.join(f'{mes:02}/{ano}' for ano, mes in resultado['periodos']) or 'nenhum'
+        print(f'Rollups atualizados incrementalmente em {decorrido:.2f}s (períodos: {periodos}).')
+    else:
+        total = conn.execute('SELECT COUNT(*) FROM rollup_medicao').fetchone()[0]
+        print(f'Rollups reconstruídos em {decorrido:.2f}s: {total:,} linhas em rollup_medicao.')
@@ -0,0 +1,44 @@
+# Contador de UPDATEs e DELETEs nas tabelas do sisagua.db, mantido por gatilhos.
+# COUNT(*) e MAX(rowid) só detectam acréscimos: apagar as últimas linhas e
+# inserir outras tantas (carga.py --substituir do último mês) ou corrigir um
+# valor no lugar deixam os dois iguais. As assinaturas de versão (rollups,
+# snapshot colunar, partições fechadas) incluem este contador.
+TABELA = 'alteracoes_origem'
+
+# Tabelas do esquema de carga.py; as derivadas (rollup_*, esboco_*, cubo_*) não contam
+TABELAS = ['Regiao', 'Estado', 'Municipio', 'Instituicao', 'Escritorio_Regional', 'ETA',
+           'Parametro', 'Campo', 'Ponto_Monitoramento', 'Medicao']
+
+
+def _existentes(conn):
+    return [nome for (nome,) in conn.execute(
+        "SELECT name FROM main.sqlite_master WHERE type = 'table' AND name IN "
+        f"({', '.join('?' * len(TABELAS))})", TABELAS
+    )]
+
+
+def instalar(conn):
+    """Cria o contador e os gatilhos que o mantêm (idempotente; precisa de escrita).
+
+    Não faz commit: roda dentro da transação de quem chamou, se houver uma.
+    """
+    conn.execute(f'CREATE TABLE IF NOT EXISTS main.{TABELA} ('
+                 'tabela TEXT PRIMARY KEY, alteracoes INTEGER NOT NULL)')
+    for tabela in _existentes(conn):
+        conn.execute(f'INSERT OR IGNORE INTO main.{TABELA} VALUES (?, 0)', (tabela,))
+        for evento in ('UPDATE', 'DELETE'):
+            conn.execute(
+                f'CREATE TRIGGER IF NOT EXISTS main.{TABELA}_{tabela}_{evento.lower()} '
+                f'AFTER {evento} ON {tabela} BEGIN '
+                f"UPDATE {TABELA} SET alteracoes = alteracoes + 1 WHERE tabela = '{tabela}'; END"
+            )
+
+
+def contagens(conn):
+    """{tabela: UPDATEs e DELETEs contados}; tabelas sem contador valem 0."""
+    existe = conn.execute(
+        "SELECT COUNT(*) FROM main.sqlite_master WHERE type = 'table' AND name = ?", (TABELA,)
+    ).fetchone()[0]
+    if not existe:
+        return {}
+    return dict(conn.execute(f'SELECT tabela, alteracoes FROM main.{TABELA}'))
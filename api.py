@@ -0,0 +1,319 @@
+import argparse
+import hashlib
+import io
+import json
+import os
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+import pyarrow as pa
+
+import agregados
+import cache_resultados
+import conexoes
+import particoes
+import tipos
+from consultas import FILTROS, filtros_aceitos, filtros_ignorados, get_consultas, montar_consulta
+
+PORTA = 8502
+TIPO_ARROW = 'application/vnd.apache.arrow.stream'
+# Mesmo padrão do painel (SISAGUA_ORCAMENTO_S); 0 desliga
+ORCAMENTO_S = float(os.environ.get('SISAGUA_ORCAMENTO_S', 15))
+FILTROS_INTEIROS = {'ano', 'mes_inicio', 'mes_fim'}
+
+
+class FiltroInvalido(ValueError):
+    pass
+
+
+def ler_filtros(parametros, nome=None):
+    """{filtro: valor} a partir da query string; só aceita os filtros de consultas.FILTROS
+    e, com `nome`, só os que essa consulta aplica (os demais seriam ignorados em silêncio)."""
+    filtros = {}
+    for chave, valores in parametros.items():
+        if chave == 'formato':
+            continue
+        if chave not in FILTROS:
+            raise FiltroInvalido(f'filtro desconhecido: {chave}')
+        valor = valores[-1]
+        if chave in FILTROS_INTEIROS:
+            try:
+                valor = int(valor)
+            except ValueError:
+                raise FiltroInvalido(f'{chave} deve ser inteiro') from None
+        filtros[chave] = valor
+    ignorados = filtros_ignorados(nome, filtros) if nome else []
+    if ignorados:
+        raise FiltroInvalido(f'{nome} não aplica o(s) filtro(s): {", ".join(ignorados)}')
+    return filtros
+
+
+def como_json(df):
+    return df.to_json(orient='records', force_ascii=False, date_format='iso')
+
+
+def como_arrow(df):
+    tabela = pa.Table.from_pandas(df, preserve_index=False)
+    destino = io.BytesIO()
+    with pa.ipc.new_stream(destino, tabela.schema) as writer:
+        writer.write_table(tabela)
+    return destino.getvalue()
+
+
+class CamadaConsultas:
+    """As consultas de get_consultas() executadas como o painel as executa.
+
+    Usa os rollups quando estão prontos, o cache em disco com as mesmas chaves
+    do painel (um resultado calculado por um serve ao outro), conexões do pool
+    somente leitura e o mesmo orçamento de tempo. Pedidos iguais simultâneos
+    esperam uma única execução. Dentro do processo do painel, recebe o pool, o
+    cache e a verificação dos rollups do próprio painel.
+    """
+
+    def __init__(self, banco='sisagua.db', pool=None, cache=None, rollups_prontos=None,
+                 orcamento_s=ORCAMENTO_S):
+        self.banco = banco
+        self.pool = pool or conexoes.PoolConexoes(banco)
+        self.cache = cache or cache_resultados.CacheResultados()
+        self.orcamento_s = orcamento_s
+        self._rollups_prontos = rollups_prontos
+        self._rollups = (None, False)
+        self._particoes = (None, ({}, frozenset(), {}))
+        self._lock = threading.Lock()
+        self._em_andamento = {}
+        self.pedidos = 0
+        self.execucoes = 0
+
+    def versao(self):
+        return cache_resultados.impressao_digital(self.banco)
+
+    def rollups_prontos(self, impressao):
+        if self._rollups_prontos is not None:
+            return self._rollups_prontos()
+        # Fora do painel, a API não constrói rollups; só os usa se estão em dia
+        with self._lock:
+            if self._rollups[0] == impressao:
+                return self._rollups[1]
+        with self.pool.conexao() as conn:
+            prontos = not agregados.rollups_desatualizados(conn)
+        with self._lock:
+            self._rollups = (impressao, prontos)
+        return prontos
+
+    def particoes(self, impressao):
+        """({ano: arquivo}, anos fechados, {ano fechado: versão}) das partições da Medicao."""
+        with self._lock:
+            if self._particoes[0] == impressao:
+                return self._particoes[1]
+        with self.pool.conexao() as conn:
+            fechados = particoes.anos_fechados(conn)
+            atuais = (particoes.particoes(conn), fechados,
+                      {ano: particoes.impressao_fechada(conn, self.banco, ano) for ano in fechados})
+        with self._lock:
+            self._particoes = (impressao, atuais)
+        return atuais
+
+    def versao_resultado(self, filtros, impressao):
+        """Versão de um resultado: a da partição quando os filtros se restringem a um ano fechado."""
+        return particoes.versao(filtros, self.particoes(impressao)[2], impressao)
+
+    def montar(self, nome, filtros, impressao):
+        montada = agregados.montar_consulta(nome, filtros) if self.rollups_prontos(impressao) else None
+        return montada or montar_consulta(nome, filtros)
+
+    def consultar(self, nome, filtros, impressao=None):
+        """DataFrame (compacto) da consulta nomeada para a versão `impressao` dos dados."""
+        impressao = impressao or self.versao()
+        query, params = self.montar(nome, filtros, impressao)
+        registradas, fechados, versoes = self.particoes(impressao)
+        query = particoes.podar(query, params, fechados, registradas)
+        impressao = particoes.versao(params, versoes, impressao)
+        # Mesma chave de _executar_consulta no painel
+        chave = ('consulta', query, tuple(sorted(params.items())))
+        with self._lock:
+            self.pedidos += 1
+        df = self.cache.obter(chave, impressao)
+        if df is None:
+            df = self._uma_vez((chave, impressao), lambda: self._executar(chave, impressao, query, params))
+        return df
+
+    def _executar(self, chave, impressao, query, params):
+        # Outro pedido pode ter acabado de gravar o resultado
+        df = self.cache.obter(chave, impressao)
+        if df is not None:
+            return df
+        with conexoes.orcamento(self.orcamento_s):
+            with self.pool.conexao() as conn:
+                df = tipos.compactar(pd.read_sql_query(query, conn, params=params))
+        with self._lock:
+            self.execucoes += 1
+        self.cache.guardar(chave, impressao, df)
+        return df
+
+    def _uma_vez(self, chave, funcao):
+        with self._lock:
+            chamada = self._em_andamento.get(chave)
+            lider = chamada is None
+            if lider:
+                chamada = self._em_andamento[chave] = {'pronto': threading.Event()}
+        if not lider:
+            chamada['pronto'].wait()
+            if 'erro' in chamada:
+                raise chamada['erro']
+            return chamada['resultado']
+        try:
+            chamada['resultado'] = funcao()
+            return chamada['resultado']
+        except Exception as e:
+            chamada['erro'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._em_andamento[chave]
+            chamada['pronto'].set()
+
+    def estatisticas(self):
+        with self._lock:
+            return {'pedidos': self.pedidos, 'execucoes': self.execucoes}
+
+
+def etag(impressao, nome, filtros, formato):
+    """Muda com a versão dos dados e com o pedido (consulta, filtros, formato)."""
+    pedido = hashlib.sha1(repr((nome, sorted(filtros.items()), formato)).encode()).hexdigest()[:16]
+    return f'"{impressao}-{pedido}"'
+
+
+def _etag_confere(cabecalho, atual):
+    if not cabecalho:
+        return False
+    if cabecalho.strip() == '*':
+        return True
+    return atual in {valor.strip().removeprefix('W/') for valor in cabecalho.split(',')}
+
+
+class ManipuladorAPI(BaseHTTPRequestHandler):
+    """GET /consultas, GET /consultas/<nome>?<filtros>[&formato=json|arrow] e GET /saude."""
+
+    server_version = 'SISAGUA-API/1'
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        partes = [parte for parte in url.path.split('/') if parte]
+        camada = self.server.camada
+        if partes == ['saude']:
+            # Empréstimos e espera de conexão do processo inteiro (no painel, de todas as
+            # sessões): o teste de carga do benchmark.py lê daqui as consultas do servidor
+            return self._json(HTTPStatus.OK, {'versao': camada.versao(), **camada.estatisticas(),
+                                              **conexoes.uso_pools()})
+        if partes == ['consultas']:
+            return self._json(HTTPStatus.OK, {
+                'versao': camada.versao(),
+                'consultas': list(get_consultas()),
+                'filtros': list(FILTROS),
+                'filtros_por_consulta': {nome: sorted(filtros_aceitos(nome)) for nome in get_consultas()},
+                'formatos': ['json', 'arrow'],
+            })
+        if len(partes) == 2 and partes[0] == 'consultas':
+            return self._consulta(partes[1], parse_qs(url.query))
+        self._erro(HTTPStatus.NOT_FOUND, 'caminho desconhecido')
+
+    def _consulta(self, nome, parametros):
+        camada = self.server.camada
+        if nome not in get_consultas():
+            return self._erro(HTTPStatus.NOT_FOUND, f'consulta desconhecida: {nome}')
+        try:
+            filtros = ler_filtros(parametros, nome)
+        except FiltroInvalido as e:
+            return self._erro(HTTPStatus.BAD_REQUEST, str(e))
+        formato = parametros.get('formato', [None])[-1]
+        if formato is None:
+            formato = 'arrow' if TIPO_ARROW in self.headers.get('Accept', '') else 'json'
+        if formato not in ('json', 'arrow'):
+            return self._erro(HTTPStatus.BAD_REQUEST, 'formato deve ser json ou arrow')
+
+        impressao = camada.versao()
+        versao = camada.versao_resultado(filtros, impressao)
+        atual = etag(versao, nome, filtros, formato)
+        # Mesma versão dos dados, mesmo resultado: responde sem tocar no banco
+        if _etag_confere(self.headers.get('If-None-Match'), atual):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header('ETag', atual)
+            self.end_headers()
+            return
+        try:
+            df = camada.consultar(nome, filtros, impressao)
+        except conexoes.ConsultaInterrompida as e:
+            return self._erro(HTTPStatus.SERVICE_UNAVAILABLE, str(e), {'Retry-After': '30'})
+        except Exception as e:
+            return self._erro(HTTPStatus.INTERNAL_SERVER_ERROR, f'erro na consulta: {e}')
+        if formato == 'arrow':
+            corpo, tipo = como_arrow(df), TIPO_ARROW
+        else:
+            dados = como_json(df)
+            corpo = (f'{{"consulta": {json.dumps(nome)}, "versao": "{versao}", '
+                     f'"filtros": {json.dumps(filtros, ensure_ascii=False)}, "dados": {dados}}}').encode()
+            tipo = 'application/json; charset=utf-8'
+        self._responder(HTTPStatus.OK, corpo, tipo, {'ETag': atual, 'Cache-Control': 'no-cache'})
+
+    def _responder(self, status, corpo, tipo, cabecalhos=None):
+        self.send_response(status)
+        self.send_header('Content-Type', tipo)
+        self.send_header('Content-Length', str(len(corpo)))
+        for chave, valor in (cabecalhos or {}).items():
+            self.send_header(chave, valor)
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def _json(self, status, dados, cabecalhos=None):
+        corpo = json.dumps(dados, ensure_ascii=False).encode()
+        self._responder(status, corpo, 'application/json; charset=utf-8', cabecalhos)
+
+    def _erro(self, status, mensagem, cabecalhos=None):
+        self._json(status, {'erro': mensagem}, cabecalhos)
+
+    def log_message(self, formato, *args):
+        if not self.server.silencioso:
+            super().log_message(formato, *args)
+
+
+class ServidorAPI(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, endereco, camada, silencioso=False):
+        super().__init__(endereco, ManipuladorAPI)
+        self.camada = camada
+        self.silencioso = silencioso
+
+
+def iniciar_em_segundo_plano(camada, porta=PORTA, host='127.0.0.1'):
+    """Sobe a API numa thread de fundo (usado pelo painel) e retorna o servidor."""
+    servidor = ServidorAPI((host, porta), camada, silencioso=True)
+    threading.Thread(target=servidor.serve_forever, name='sisagua-api', daemon=True).start()
+    return servidor
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='API HTTP local com as consultas do painel em JSON ou Arrow IPC')
+    parser.add_argument('--banco', default=os.environ.get('SISAGUA_BANCO', 'sisagua.db'))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--porta', type=int, default=PORTA)
+    parser.add_argument('--cache-dir', default=os.environ.get('SISAGUA_CACHE_DIR', cache_resultados.DIRETORIO_PADRAO),
+                        help='diretório do cache em disco (o mesmo do painel, para compartilhar resultados)')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.banco):
+        raise SystemExit(f'Erro: {args.banco} não existe.')
+    limite_mb = int(os.environ.get('SISAGUA_CACHE_MB', cache_resultados.LIMITE_MB))
+    cache = cache_resultados.CacheResultados(args.cache_dir, limite_mb * 1024 ** 2)
+    camada = CamadaConsultas(args.banco, cache=cache)
+    servidor = ServidorAPI((args.host, args.porta), camada)
+    print(f'API em http://{args.host}:{args.porta}/consultas (banco: {args.banco})')
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
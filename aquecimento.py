@@ -0,0 +1,80 @@
+import queue
+import threading
+from collections import deque
+
+# Marca a thread de aquecimento. Fica neste módulo, importado uma única vez, e
+# não no script do painel, que o Streamlit reexecuta num módulo novo a cada
+# interação: uma marca guardada lá só valeria para a primeira execução.
+_local = threading.local()
+
+
+def em_segundo_plano():
+    """A thread atual é a de aquecimento de algum Aquecedor?"""
+    return getattr(_local, 'segundo_plano', False)
+
+
+class Aquecedor:
+    """Executa tarefas de aquecimento de cache numa thread de fundo.
+
+    Tarefas com a mesma chave não são enfileiradas duas vezes enquanto
+    estiverem pendentes; a fila é limitada para que a pré-busca nunca acumule
+    mais trabalho do que consegue fazer.
+    """
+
+    def __init__(self, inicializar=None, max_pendentes=64):
+        self.max_pendentes = max_pendentes
+        self.impressao = None
+        self.executadas = 0
+        self.erros = deque(maxlen=20)
+        self._inicializar = inicializar
+        self._fila = queue.Queue()
+        self._pendentes = set()
+        self._em_execucao = None
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._rodar, name='sisagua-aquecimento', daemon=True)
+        self._thread.start()
+
+    def agendar(self, chave, funcao, *args):
+        """Enfileira funcao(*args); retorna False se a chave já está pendente ou a fila está cheia."""
+        with self._lock:
+            if chave in self._pendentes or len(self._pendentes) >= self.max_pendentes:
+                return False
+            self._pendentes.add(chave)
+        self._fila.put((chave, funcao, args))
+        return True
+
+    def _rodar(self):
+        _local.segundo_plano = True
+        if self._inicializar is not None:
+            self._inicializar()
+        while True:
+            chave, funcao, args = self._fila.get()
+            self._em_execucao = chave
+            try:
+                funcao(*args)
+            except Exception as e:
+                self.erros.append(f'{chave}: {e}')
+            finally:
+                with self._lock:
+                    self._pendentes.discard(chave)
+                    self.executadas += 1
+                self._em_execucao = None
+
+    def pendente(self, chave):
+        """A tarefa `chave` ainda está na fila ou em execução?"""
+        with self._lock:
+            return chave in self._pendentes
+
+    def ocioso(self):
+        with self._lock:
+            return not self._pendentes
+
+    def estado(self):
+        with self._lock:
+            pendentes = len(self._pendentes)
+        return {
+            'pendentes': pendentes,
+            'executadas': self.executadas,
+            'em_execucao': self._em_execucao,
+            'erros': list(self.erros),
+        }
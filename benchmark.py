@@ -0,0 +1,622 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+import streamlit as st
+import websockets
+from streamlit import logger as streamlit_logger
+from streamlit.proto.Alert_pb2 import Alert
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.testing.v1 import AppTest
+
+import agregados
+import cache_resultados
+import conexoes
+from consultas import get_consultas, montar_consulta
+
+DASHBOARD = Path(__file__).with_name('dashboard.py')
+REPETICOES = 5
+# Diferenças abaixo disso são ruído de medição e nunca contam como regressão
+TOLERANCIA = 0.20
+PISO_MS = 5.0
+# O teste de carga conecta N clientes websocket a um único `streamlit run`:
+# as sessões disputam o pool, o executor e os caches do servidor
+MODELO_CARGA = ('um servidor, N sessões: clientes websocket simultâneos num único processo `streamlit run`, '
+                'que compartilha pool, executor e caches entre as sessões; os clientes rodam na mesma '
+                'máquina e não guardam mensagens em cache (o servidor sempre manda os elementos inteiros)')
+# Raízes do delta_path nas mensagens do servidor: área principal e barra lateral
+PRINCIPAL, LATERAL = 0, 1
+# Segundos para o `streamlit run` do teste de carga responder
+SUBIDA_S = 60
+# Teste de carga: peso de cada interação na navegação simulada e chance de um
+# filtro voltar para "Todos"/"Todas" em vez de ir para um valor específico
+INTERACOES = {'pagina': 0.35, 'aba': 0.30, 'filtro': 0.20, 'selecao': 0.15}
+VOLTAR_TODOS = 0.4
+PERCENTIS = (50, 95, 99)
+
+
+def _ms(inicio):
+    return round((time.perf_counter() - inicio) * 1000, 2)
+
+
+def _coluna_ms(valor, largura=9):
+    """Milissegundos alinhados para a tabela do terminal; '-' quando não há medida."""
+    return f'{valor:>{largura}.0f}' if valor is not None else f'{"-":>{largura}}'
+
+
+def _executar(conn, query, params):
+    inicio = time.perf_counter()
+    df = pd.read_sql_query(query, conn, params=params)
+    return _ms(inicio), len(df)
+
+
+def medir_consultas(banco, repeticoes=REPETICOES, rollups=False):
+    """Tempo de cada consulta de get_consultas() a frio e a quente.
+
+    A frio é a primeira execução numa conexão nova (cache de páginas do SQLite
+    vazio; o cache do sistema operacional não é controlado). A quente é a
+    mediana das `repeticoes` execuções seguintes na mesma conexão. Com
+    rollups=True, mede as versões sobre rollup_medicao no lugar das originais.
+    """
+    resultados = {}
+    for nome in get_consultas():
+        if rollups:
+            montada = agregados.montar_consulta(nome)
+            if montada is None:
+                continue
+            query, params = montada
+        else:
+            query, params = montar_consulta(nome)
+        conn = conexoes.abrir_somente_leitura(banco)
+        try:
+            frio_ms, linhas = _executar(conn, query, params)
+            quentes = [_executar(conn, query, params)[0] for _ in range(repeticoes)]
+        finally:
+            conn.close()
+        resultados[nome] = {'frio_ms': frio_ms, 'quente_ms': statistics.median(quentes), 'linhas': linhas}
+    return resultados
+
+
+def _abas(bloco):
+    """(chave, rótulos) de cada st.tabs com estado encontrado na árvore do AppTest."""
+    encontradas = []
+    for filho in getattr(bloco, 'children', {}).values():
+        if filho.type == 'tab_container' and filho.proto.id:
+            chave = filho.proto.id.rsplit('-', 1)[-1]
+            encontradas.append((chave, [aba.label for aba in filho.children.values()]))
+        encontradas.extend(_abas(filho))
+    return encontradas
+
+
+def _erros(at):
+    return [str(e.value)[:300] for e in at.exception] + [str(e.value)[:300] for e in at.error]
+
+
+def medir_paginas(banco, repeticoes=REPETICOES, timeout=600):
+    """Renderização completa de cada página (e de cada aba) pelo AppTest do Streamlit.
+
+    A frio, os caches de resultados (st.cache_data e o cache em disco) são
+    esvaziados antes da renderização; a quente é a mediana de `repeticoes`
+    reexecuções em seguida. A pré-busca em segundo plano fica desligada para
+    não competir com a medição.
+    """
+    # Sem contexto de servidor o Streamlit avisa a cada chamada; só os erros interessam
+    streamlit_logger.set_log_level('error')
+    diretorio_cache = tempfile.mkdtemp(prefix='sisagua_bench_')
+    os.environ.update({
+        'SISAGUA_BANCO': str(Path(banco).resolve()),
+        'SISAGUA_CACHE_DIR': diretorio_cache,
+        'SISAGUA_PREFETCH': '0',
+    })
+    cache_disco = cache_resultados.CacheResultados(diretorio_cache, limite_bytes=0)
+
+    def esvaziar_caches():
+        st.cache_data.clear()
+        cache_disco.limpar()
+
+    def rodar(estado):
+        for chave, valor in estado.items():
+            at.session_state[chave] = valor
+        inicio = time.perf_counter()
+        at.run()
+        return _ms(inicio)
+
+    at = AppTest.from_file(str(DASHBOARD), default_timeout=timeout)
+    inicio = time.perf_counter()
+    at.run()
+    resultado = {'inicializacao_ms': _ms(inicio), 'paginas': {}}
+    if at.exception:
+        resultado['erros'] = _erros(at)
+        return resultado
+
+    for pagina in at.sidebar.selectbox[0].options:
+        at.sidebar.selectbox[0].set_value(pagina)
+        esvaziar_caches()
+        inicio = time.perf_counter()
+        at.run()
+        frio_ms = _ms(inicio)
+        # Páginas com abas: cada aba é renderizada (e medida) separadamente
+        variantes = [(f'{pagina} › {rotulo}', {chave: rotulo}, i == 0)
+                     for chave, rotulos in _abas(at.main) for i, rotulo in enumerate(rotulos)]
+        for nome, estado, primeira in variantes or [(pagina, {}, True)]:
+            if not primeira:
+                esvaziar_caches()
+                frio_ms = rodar(estado)
+            quentes = [rodar(estado) for _ in range(repeticoes)]
+            resultado['paginas'][nome] = {
+                'frio_ms': frio_ms,
+                'quente_ms': statistics.median(quentes),
+                'bytes_graficos': sum(len(grafico.proto.spec) for grafico in at.get('plotly_chart')),
+                'erros': _erros(at),
+            }
+    return resultado
+
+
+def _rss_mb(pid):
+    """(RSS atual, pico de RSS) de um processo, em MB; (None, None) sem /proc."""
+    try:
+        status = Path(f'/proc/{pid}/status').read_text()
+    except OSError:
+        return None, None
+    campos = dict(linha.split(':', 1) for linha in status.splitlines() if ':' in linha)
+    # VmRSS e VmHWM (pico) vêm em kB
+    return tuple(round(int(campos[campo].split()[0]) / 1024, 1) if campo in campos else None
+                 for campo in ('VmRSS', 'VmHWM'))
+
+
+def _porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _subir_servidor(porta, ambiente, log, timeout=SUBIDA_S):
+    """`streamlit run dashboard.py` sem navegador; retorna o processo quando ele responde."""
+    processo = subprocess.Popen(
+        [sys.executable, '-m', 'streamlit', 'run', str(DASHBOARD), '--server.headless', 'true',
+         '--server.address', '127.0.0.1', '--server.port', str(porta), '--server.fileWatcherType', 'none',
+         '--browser.gatherUsageStats', 'false', '--logger.level', 'error'],
+        env=ambiente, cwd=DASHBOARD.parent, stdout=log, stderr=subprocess.STDOUT,
+    )
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite and processo.poll() is None:
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{porta}/_stcore/health', timeout=1):
+                return processo
+        except OSError:
+            time.sleep(0.2)
+    processo.kill()
+    processo.wait()
+    raise RuntimeError(f'o painel não respondeu em {timeout}s (log em {log.name})')
+
+
+def _saude(porta_api):
+    """Contadores do servidor (GET /saude da API embutida no painel), ou None."""
+    try:
+        with urllib.request.urlopen(f'http://127.0.0.1:{porta_api}/saude', timeout=5) as resposta:
+            return json.load(resposta)
+    except OSError:
+        return None
+
+
+class _Tela:
+    """Uma execução do painel como o navegador a recebe: elementos e blocos por delta_path."""
+
+    def __init__(self):
+        self.elementos = {}
+        self.blocos = {}
+
+    def receber(self, delta, caminho):
+        if delta.HasField('new_element'):
+            self.elementos[caminho] = delta.new_element
+        elif delta.HasField('add_block'):
+            self.blocos[caminho] = delta.add_block
+
+    def caixas(self, raiz):
+        return [elemento.selectbox for caminho, elemento in sorted(self.elementos.items())
+                if caminho[0] == raiz and elemento.HasField('selectbox')]
+
+    def abas(self):
+        """(id, rótulos) de cada st.tabs com estado."""
+        return [(bloco.id, [self.blocos[filho].tab.label for filho in sorted(self.blocos)
+                            if filho[:-1] == caminho and self.blocos[filho].HasField('tab')])
+                for caminho, bloco in sorted(self.blocos.items()) if bloco.HasField('tab_container') and bloco.id]
+
+    def ids(self):
+        return {caixa.id for raiz in (PRINCIPAL, LATERAL) for caixa in self.caixas(raiz)} | {
+            chave for chave, _ in self.abas()}
+
+    def excecoes(self):
+        return [f'{e.exception.type}: {e.exception.message}'[:300]
+                for e in self.elementos.values() if e.HasField('exception')]
+
+    def erros(self):
+        return self.excecoes() + [e.alert.body[:300] for e in self.elementos.values()
+                                  if e.HasField('alert') and e.alert.format == Alert.ERROR]
+
+    def valor(self, caixa, estados):
+        if caixa.id in estados:
+            return estados[caixa.id]
+        if caixa.set_value and caixa.HasField('raw_value'):
+            return caixa.raw_value
+        return caixa.options[caixa.default] if caixa.HasField('default') else None
+
+    def pagina(self, estados):
+        laterais = self.caixas(LATERAL)
+        return self.valor(laterais[0], estados) if laterais else None
+
+
+def _escolher(caixa, estados, sorteio):
+    if len(caixa.options) < 2:
+        return None
+    indice = 0 if sorteio.random() < VOLTAR_TODOS else sorteio.randrange(len(caixa.options))
+    estados[caixa.id] = caixa.options[indice]
+    return f'{caixa.label} {caixa.options[indice]}'
+
+
+def _interagir(tela, estados, sorteio):
+    """Sorteia uma interação de usuário e a grava em `estados`; retorna (tipo, alvo).
+
+    Sem abas ou caixas de seleção na página atual, a interação vira uma troca
+    de página.
+    """
+    tipo = sorteio.choices(list(INTERACOES), weights=list(INTERACOES.values()))[0]
+    laterais, principais = tela.caixas(LATERAL), tela.caixas(PRINCIPAL)
+    if not laterais:
+        # A execução anterior falhou antes de montar a barra lateral
+        return 'reexecucao', None
+    if tipo == 'aba' and (abas := tela.abas()):
+        chave, rotulos = sorteio.choice(abas)
+        rotulo = sorteio.choice(rotulos)
+        estados[chave] = rotulo
+        return tipo, rotulo
+    if tipo == 'filtro' and len(laterais) > 1 and (alvo := _escolher(sorteio.choice(laterais[1:]), estados, sorteio)):
+        return tipo, alvo
+    if tipo == 'selecao' and principais and (alvo := _escolher(sorteio.choice(principais), estados, sorteio)):
+        return tipo, alvo
+    navegacao = laterais[0]
+    atual = tela.valor(navegacao, estados)
+    destino = sorteio.choice([opcao for opcao in navegacao.options if opcao != atual])
+    estados[navegacao.id] = destino
+    return 'pagina', destino
+
+
+async def _rodar(ws, estados, tela, timeout):
+    """Pede uma reexecução com o estado dos widgets na tela e espera o fim dela.
+
+    Como o navegador, só manda widgets que estão na tela; os que não mudaram
+    mantêm no servidor o valor da execução anterior.
+    """
+    mensagem = BackMsg()
+    mensagem.rerun_script.query_string = ''
+    na_tela = tela.ids() if tela else set()
+    for chave in list(estados):
+        if chave in na_tela:
+            mensagem.rerun_script.widget_states.widgets.add(id=chave, string_value=estados[chave])
+        else:
+            del estados[chave]
+    await ws.send(mensagem.SerializeToString())
+    return await asyncio.wait_for(_receber_execucao(ws), timeout)
+
+
+async def _receber_execucao(ws):
+    tela = _Tela()
+    while True:
+        resposta = ForwardMsg.FromString(await ws.recv())
+        if resposta.HasField('new_session'):
+            tela = _Tela()
+        elif resposta.HasField('delta'):
+            tela.receber(resposta.delta, tuple(resposta.metadata.delta_path))
+        elif resposta.HasField('script_finished') and resposta.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+            return tela
+
+
+async def _cliente(url, indice, acoes, pausa, semente, atraso, timeout, abrir_janela):
+    """Uma sessão simulada: um cliente websocket navegando pelo painel."""
+    sorteio = random.Random(semente * 1000 + indice)
+    sessao = {'sessao': indice, 'inicializacao_ms': None, 'interacoes': [], 'erros_inicializacao': [], 'falha': None}
+    estados = {}
+    await asyncio.sleep(atraso)
+    try:
+        async with websockets.connect(url, subprotocols=['streamlit'], max_size=None) as ws:
+            inicio = time.perf_counter()
+            tela = await _rodar(ws, estados, None, timeout)
+            sessao['inicializacao_ms'] = _ms(inicio)
+            await abrir_janela()
+            for _ in range(acoes if not tela.excecoes() else 0):
+                tipo, alvo = _interagir(tela, estados, sorteio)
+                inicio = time.perf_counter()
+                tela = await _rodar(ws, estados, tela, timeout)
+                sessao['interacoes'].append({
+                    'tipo': tipo,
+                    'alvo': alvo,
+                    'pagina': tela.pagina(estados),
+                    'ms': _ms(inicio),
+                    'erros': tela.erros(),
+                })
+                if pausa:
+                    # Tempo de leitura entre uma interação e a seguinte
+                    await asyncio.sleep(sorteio.expovariate(1 / pausa))
+            if not sessao['interacoes']:
+                sessao['erros_inicializacao'] = tela.erros()
+    except (OSError, asyncio.TimeoutError, websockets.exceptions.WebSocketException) as e:
+        # Uma sessão que cai não derruba as outras
+        sessao['falha'] = f'{type(e).__name__}: {e}'[:300]
+    sessao['fim'] = time.time()
+    return sessao
+
+
+async def _clientes(url, porta_api, sessoes, acoes, pausa, rampa, semente, timeout):
+    """Roda as sessões juntas; retorna (sessões, /saude e instante na abertura e no fechamento da janela)."""
+    janela = {}
+
+    async def abrir_janela():
+        # A janela de medição abre quando a primeira sessão termina de carregar o painel
+        if 'inicio' not in janela:
+            janela['inicio'] = time.time()
+            janela['saude'] = await asyncio.to_thread(_saude, porta_api)
+
+    resultados = await asyncio.gather(*(
+        _cliente(url, i, acoes, pausa, semente, rampa * i / sessoes, timeout, abrir_janela) for i in range(sessoes)
+    ))
+    fim = time.time()
+    saude_fim = await asyncio.to_thread(_saude, porta_api)
+    return list(resultados), (janela.get('inicio'), janela.get('saude')), (fim, saude_fim)
+
+
+def _percentis(valores):
+    valores = sorted(valores)
+    if len(valores) < 2:
+        return {f'p{p}': valores[0] if valores else None for p in PERCENTIS}
+    cortes = statistics.quantiles(valores, n=100, method='inclusive')
+    return {f'p{p}': round(cortes[p - 1], 1) for p in PERCENTIS}
+
+
+def _latencias(interacoes):
+    tempos = [interacao['ms'] for interacao in interacoes]
+    return {'n': len(tempos), **_percentis(tempos), 'max': max(tempos, default=None)}
+
+
+def medir_sessoes(banco, sessoes=4, acoes=30, pausa=0.0, rampa=0.0, semente=0, cache_dir=None,
+                  prefetch=True, timeout=600):
+    """Teste de carga: `sessoes` usuários simultâneos num único servidor do painel.
+
+    Sobe um `streamlit run dashboard.py` sem navegador e conecta nele
+    `sessoes` clientes websocket (/_stcore/stream) que falam o protocolo do
+    navegador: pedem uma reexecução com o estado dos widgets e recebem os
+    elementos até o fim dela. Pool de conexões, executor e st.cache_* são os
+    do servidor, disputados pelas sessões. Cada sessão sorteia `acoes`
+    interações (trocar de página, de aba, de filtro ou de seleção na página)
+    com `pausa` segundos médios entre elas, e as sessões começam espalhadas
+    ao longo de `rampa` segundos. Mede a latência de cada interação até o fim
+    da execução e, no servidor, as consultas ao banco por segundo
+    (empréstimos de conexão do pool, lidos em /saude da API embutida) e a
+    memória do processo.
+    """
+    cache_dir = Path(cache_dir or tempfile.mkdtemp(prefix='sisagua_carga_'))
+    porta, porta_api = _porta_livre(), _porta_livre()
+    ambiente = {
+        **os.environ,
+        'SISAGUA_BANCO': str(Path(banco).resolve()),
+        'SISAGUA_CACHE_DIR': str(cache_dir),
+        'SISAGUA_API_PORTA': str(porta_api),
+    }
+    if not prefetch:
+        ambiente['SISAGUA_PREFETCH'] = '0'
+    with open(cache_dir / 'servidor.log', 'w') as log:
+        servidor = _subir_servidor(porta, ambiente, log)
+        try:
+            rss_inicial, _ = _rss_mb(servidor.pid)
+            resultados, (inicio, saude_inicio), (fim, saude_fim) = asyncio.run(_clientes(
+                f'ws://127.0.0.1:{porta}/_stcore/stream', porta_api, sessoes, acoes, pausa, rampa, semente, timeout))
+            rss, rss_pico = _rss_mb(servidor.pid)
+        finally:
+            servidor.terminate()
+            try:
+                servidor.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                servidor.kill()
+                servidor.wait()
+
+    interacoes = [interacao for sessao in resultados for interacao in sessao['interacoes']]
+    duracao = fim - inicio if inicio else 0
+    uso = ({chave: saude_fim[chave] - saude_inicio[chave] for chave in ('emprestimos', 'espera_s')}
+           if saude_inicio and saude_fim else None)
+    por_tipo, por_pagina = {}, {}
+    for interacao in interacoes:
+        por_tipo.setdefault(interacao['tipo'], []).append(interacao)
+        por_pagina.setdefault(interacao['pagina'], []).append(interacao)
+    return {
+        'modelo': MODELO_CARGA,
+        'sessoes': sessoes,
+        'acoes': acoes,
+        'pausa_s': pausa,
+        'rampa_s': rampa,
+        'semente': semente,
+        'prefetch': prefetch,
+        'pool': int(os.environ.get('SISAGUA_POOL', 0)) or os.cpu_count(),
+        'respondidas': sum(sessao['falha'] is None for sessao in resultados),
+        'duracao_s': round(duracao, 2),
+        'interacoes_por_s': round(len(interacoes) / duracao, 2) if duracao else None,
+        'consultas_por_s': round(uso['emprestimos'] / duracao, 2) if uso and duracao else None,
+        'consultas': uso and uso['emprestimos'],
+        'espera_conexao_s': uso and round(uso['espera_s'], 3),
+        'inicializacao_ms': _percentis([sessao['inicializacao_ms'] for sessao in resultados
+                                        if sessao['inicializacao_ms'] is not None]),
+        'latencia_ms': _latencias(interacoes),
+        'por_tipo': {tipo: _latencias(lista) for tipo, lista in sorted(por_tipo.items())},
+        'por_pagina': {str(pagina): _latencias(lista) for pagina, lista in sorted(por_pagina.items(), key=str)},
+        'erros': [{'sessao': sessao['sessao'], 'alvo': interacao['alvo'], 'erros': interacao['erros']}
+                  for sessao in resultados for interacao in sessao['interacoes'] if interacao['erros']]
+                 + [{'sessao': sessao['sessao'], 'alvo': None, 'erros': sessao['erros_inicializacao']}
+                    for sessao in resultados if sessao['erros_inicializacao']]
+                 + [{'sessao': sessao['sessao'], 'alvo': None, 'erros': [sessao['falha']]}
+                    for sessao in resultados if sessao['falha']],
+        'servidor': {'pid': servidor.pid, 'rss_inicial_mb': rss_inicial, 'rss_mb': rss, 'rss_pico_mb': rss_pico,
+                     'log': str(cache_dir / 'servidor.log')},
+    }
+
+
+def _ambiente():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=DASHBOARD.parent,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'backend': os.environ.get('SISAGUA_BACKEND', 'sqlite'),
+    }
+
+
+def _descrever_banco(banco):
+    conn = conexoes.abrir_somente_leitura(banco)
+    try:
+        medicoes = conn.execute('SELECT COUNT(*) FROM Medicao').fetchone()[0]
+        anos = conn.execute('SELECT MIN(ano_referencia), MAX(ano_referencia) FROM Medicao').fetchone()
+    finally:
+        conn.close()
+    return {'caminho': str(banco), 'medicoes': medicoes, 'anos': list(anos), 'bytes': Path(banco).stat().st_size}
+
+
+def executar_benchmark(banco, repeticoes=REPETICOES, paginas=True, rollups=True, carga=None):
+    relatorio = {
+        'versao': 1,
+        'instante': datetime.now().isoformat(timespec='seconds'),
+        'ambiente': _ambiente(),
+        'banco': _descrever_banco(banco),
+        'repeticoes': repeticoes,
+        'consultas': medir_consultas(banco, repeticoes),
+    }
+    if rollups:
+        relatorio['consultas_rollup'] = medir_consultas(banco, repeticoes, rollups=True)
+    if carga:
+        # Antes das páginas, que desligam a pré-busca no ambiente do processo
+        relatorio['carga'] = medir_sessoes(banco, **carga)
+    if paginas:
+        relatorio['renderizacao'] = medir_paginas(banco, repeticoes)
+    return relatorio
+
+
+def _tempos(relatorio):
+    """{(seção, nome, medida): ms} de todas as medições comparáveis do relatório."""
+    tempos = {}
+    for secao in ('consultas', 'consultas_rollup'):
+        for nome, medidas in relatorio.get(secao, {}).items():
+            for medida in ('frio_ms', 'quente_ms'):
+                tempos[secao, nome, medida] = medidas[medida]
+    for nome, medidas in relatorio.get('renderizacao', {}).get('paginas', {}).items():
+        for medida in ('frio_ms', 'quente_ms'):
+            tempos['paginas', nome, medida] = medidas[medida]
+    # Percentis do teste de carga (comparáveis entre relatórios com as mesmas sessões e semente)
+    carga = relatorio.get('carga', {})
+    for nome, medidas in [('geral', carga.get('latencia_ms', {})), *carga.get('por_tipo', {}).items()]:
+        for medida in (f'p{p}' for p in PERCENTIS):
+            if medidas.get(medida) is not None:
+                tempos['carga', nome, medida] = medidas[medida]
+    return tempos
+
+
+def comparar(relatorio, base, tolerancia=TOLERANCIA, piso_ms=PISO_MS):
+    """Medições que ficaram mais de `tolerancia` (e mais de piso_ms) mais lentas que na base."""
+    atuais, anteriores = _tempos(relatorio), _tempos(base)
+    regressoes = []
+    for chave in sorted(atuais.keys() & anteriores.keys()):
+        atual, anterior = atuais[chave], anteriores[chave]
+        if atual > anterior * (1 + tolerancia) and atual - anterior > piso_ms:
+            secao, nome, medida = chave
+            regressoes.append({'secao': secao, 'nome': nome, 'medida': medida,
+                               'base_ms': anterior, 'atual_ms': atual, 'razao': round(atual / anterior, 2)})
+    return regressoes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Mede consultas e páginas do painel e grava um relatório JSON')
+    parser.add_argument('--banco', default='sisagua.db')
+    parser.add_argument('--saida', default='benchmark.json')
+    parser.add_argument('--repeticoes', type=int, default=REPETICOES)
+    parser.add_argument('--sem-paginas', action='store_true', help='mede só as consultas (sem AppTest)')
+    parser.add_argument('--sem-rollups', action='store_true', help='não mede as consultas sobre os rollups')
+    parser.add_argument('--sessoes', type=int, default=0,
+                        help='teste de carga com N sessões simultâneas (clientes websocket) num único '
+                             'servidor `streamlit run` do painel (padrão: não executa)')
+    parser.add_argument('--acoes', type=int, default=30, help='interações por sessão no teste de carga')
+    parser.add_argument('--pausa', type=float, default=0.0,
+                        help='segundos médios entre as interações de uma sessão (padrão: nenhum)')
+    parser.add_argument('--rampa', type=float, default=0.0,
+                        help='segundos ao longo dos quais as sessões começam (padrão: todas juntas)')
+    parser.add_argument('--semente', type=int, default=0, help='semente da navegação sorteada')
+    parser.add_argument('--sem-prefetch', action='store_true',
+                        help='desliga a pré-busca em segundo plano durante o teste de carga')
+    parser.add_argument('--comparar', metavar='BASE.json',
+                        help='relatório anterior; sai com código 1 se houver regressões')
+    parser.add_argument('--tolerancia', type=float, default=TOLERANCIA,
+                        help='piora relativa aceita antes de acusar regressão (padrão: 0.20)')
+    args = parser.parse_args()
+
+    if not Path(args.banco).exists():
+        raise SystemExit(f'Erro: {args.banco} não existe.')
+    carga = args.sessoes and {'sessoes': args.sessoes, 'acoes': args.acoes, 'pausa': args.pausa,
+                              'rampa': args.rampa, 'semente': args.semente, 'prefetch': not args.sem_prefetch}
+    relatorio = executar_benchmark(args.banco, args.repeticoes, paginas=not args.sem_paginas,
+                                   rollups=not args.sem_rollups, carga=carga)
+    Path(args.saida).write_text(json.dumps(relatorio, ensure_ascii=False, indent=2), encoding='utf-8')
+
+    print(f"{relatorio['banco']['medicoes']:,} medições; relatório em {args.saida}")
+    print(f"{'consulta':<28} {'frio (ms)':>10} {'quente (ms)':>12} {'linhas':>8}")
+    for nome, medidas in relatorio['consultas'].items():
+        print(f"{nome:<28} {medidas['frio_ms']:>10.1f} {medidas['quente_ms']:>12.1f} {medidas['linhas']:>8,}")
+    if 'renderizacao' in relatorio:
+        renderizacao = relatorio['renderizacao']
+        print(f"\nInicialização do painel: {renderizacao['inicializacao_ms']:.0f} ms")
+        for nome, medidas in renderizacao['paginas'].items():
+            erro = '  ERRO' if medidas['erros'] else ''
+            print(f"{nome:<60} {medidas['frio_ms']:>9.0f} {medidas['quente_ms']:>9.0f}{erro}")
+        for erro in renderizacao.get('erros', []):
+            print(f'Erro: {erro}')
+    if 'carga' in relatorio:
+        carga = relatorio['carga']
+        latencia = carga['latencia_ms']
+        print(f"\nCarga ({carga['modelo']})")
+        print(f"{carga['respondidas']}/{carga['sessoes']} sessões, {latencia['n']} interações em "
+              f"{carga['duracao_s']:.1f}s ({carga['interacoes_por_s']} interações/s, "
+              f"{carga['consultas_por_s']} consultas/s no servidor; pool de {carga['pool']}, "
+              f"{carga['espera_conexao_s'] or 0:.1f}s de espera por conexão)")
+        print(f"{'interação':<32} {'n':>5} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9}")
+        for nome, medidas in [('todas', latencia), *carga['por_tipo'].items(), *carga['por_pagina'].items()]:
+            print(f"{nome:<32} {medidas['n']:>5} {_coluna_ms(medidas['p50'])} {_coluna_ms(medidas['p95'])} "
+                  f"{_coluna_ms(medidas['p99'])}")
+        servidor = carga['servidor']
+        print(f"servidor (pid {servidor['pid']}): RSS {servidor['rss_inicial_mb']} MB antes das sessões, "
+              f"{servidor['rss_mb']} MB ao fim, pico {servidor['rss_pico_mb']} MB")
+        for erro in carga['erros'][:10]:
+            print(f"Erro na sessão {erro['sessao']} ({erro['alvo']}): {erro['erros'][0]}")
+
+    if args.comparar:
+        base = json.loads(Path(args.comparar).read_text(encoding='utf-8'))
+        regressoes = comparar(relatorio, base, args.tolerancia)
+        for r in regressoes:
+            print(f"Regressão: {r['secao']}/{r['nome']} {r['medida']}: "
+                  f"{r['base_ms']:.1f} -> {r['atual_ms']:.1f} ms ({r['razao']}x)")
+        if regressoes:
+            sys.exit(1)
+        print(f'Sem regressões em relação a {args.comparar}.')
@@ -0,0 +1,187 @@
+import argparse
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+
+import pyarrow as pa
+
+DIRETORIO_PADRAO = '.cache_consultas'
+# Tamanho máximo do diretório de cache; os resultados menos usados saem primeiro
+LIMITE_MB = 512
+EXTENSAO = '.arrow'
+# Versões com este prefixo (anos fechados, ver particoes.py) não mudam com as
+# escritas no banco: suas entradas só saem do cache pelo limite de tamanho
+PREFIXO_PERMANENTE = 'fechada'
+# Últimos resultados guardados em memória para servir quando uma consulta é interrompida
+MAX_ANTERIORES = 256
+
+
+def impressao_digital(caminho='sisagua.db'):
+    """Identifica a versão dos dados pelo mtime/tamanho do banco e do seu WAL.
+
+    Qualquer escrita (inclusive a reconstrução dos rollups) muda a impressão e,
+    com ela, todas as chaves do cache.
+    """
+    partes = []
+    for arquivo in (Path(caminho), Path(f'{caminho}-wal')):
+        try:
+            info = arquivo.stat()
+        except FileNotFoundError:
+            continue
+        partes.append(f'{arquivo.name}:{info.st_mtime_ns}:{info.st_size}')
+    return hashlib.sha1('|'.join(partes).encode()).hexdigest()[:16]
+
+
+def _chave(partes):
+    return hashlib.sha256(repr(partes).encode()).hexdigest()
+
+
+class CacheResultados:
+    """Cache de DataFrames em disco (Arrow IPC com zstd), compartilhado entre processos.
+
+    Cada arquivo se chama <impressão>_<hash da consulta>.arrow: quando os dados
+    mudam, as entradas antigas deixam de ser encontradas e são as primeiras a
+    sair na limpeza. O mtime dos arquivos registra o último uso (LRU).
+    """
+
+    def __init__(self, diretorio=DIRETORIO_PADRAO, limite_bytes=LIMITE_MB * 1024 ** 2):
+        self.diretorio = Path(diretorio)
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        self.limite_bytes = limite_bytes
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.faltas = 0
+
+    def _arquivo(self, partes, impressao):
+        return self.diretorio / f'{impressao}_{_chave(partes)}{EXTENSAO}'
+
+    def obter(self, partes, impressao):
+        """DataFrame guardado para a chave, ou None."""
+        arquivo = self._arquivo(partes, impressao)
+        try:
+            with pa.OSFile(str(arquivo)) as origem:
+                tabela = pa.ipc.open_file(origem).read_all()
+            os.utime(arquivo)
+        except (FileNotFoundError, pa.ArrowInvalid):
+            with self._lock:
+                self.faltas += 1
+            return None
+        with self._lock:
+            self.acertos += 1
+        return tabela.to_pandas()
+
+    def guardar(self, partes, impressao, df):
+        tabela = pa.Table.from_pandas(df, preserve_index=False)
+        opcoes = pa.ipc.IpcWriteOptions(compression='zstd')
+        # Grava num temporário e renomeia: leitores de outros processos nunca
+        # veem um arquivo pela metade
+        descritor, temporario = tempfile.mkstemp(dir=self.diretorio, suffix='.tmp')
+        try:
+            with os.fdopen(descritor, 'wb') as destino:
+                with pa.ipc.new_file(destino, tabela.schema, options=opcoes) as writer:
+                    writer.write_table(tabela)
+            os.replace(temporario, self._arquivo(partes, impressao))
+        except BaseException:
+            Path(temporario).unlink(missing_ok=True)
+            raise
+        self.limpar(impressao)
+
+    def _entradas(self):
+        entradas = []
+        for entrada in os.scandir(self.diretorio):
+            if not entrada.name.endswith(EXTENSAO):
+                continue
+            try:
+                info = entrada.stat()
+            except FileNotFoundError:
+                continue
+            entradas.append((entrada.path, entrada.name, info.st_mtime_ns, info.st_size))
+        return entradas
+
+    def limpar(self, impressao=None):
+        """Remove entradas de outras versões dos dados (exceto as permanentes) e as menos usadas acima do limite."""
+        entradas = self._entradas()
+        removidas = 0
+        if impressao is not None:
+            obsoletas = [e for e in entradas
+                         if not e[1].startswith((f'{impressao}_', PREFIXO_PERMANENTE))]
+            for entrada in obsoletas:
+                Path(entrada[0]).unlink(missing_ok=True)
+                entradas.remove(entrada)
+                removidas += 1
+        total = sum(tamanho for _, _, _, tamanho in entradas)
+        for caminho, _, _, tamanho in sorted(entradas, key=lambda e: e[2]):
+            if total <= self.limite_bytes:
+                break
+            Path(caminho).unlink(missing_ok=True)
+            total -= tamanho
+            removidas += 1
+        return removidas
+
+    def estatisticas(self):
+        entradas = self._entradas()
+        consultas = self.acertos + self.faltas
+        return {
+            'entradas': len(entradas),
+            'bytes': sum(tamanho for _, _, _, tamanho in entradas),
+            'limite_bytes': self.limite_bytes,
+            'acertos': self.acertos,
+            'faltas': self.faltas,
+            'taxa_acerto': self.acertos / consultas if consultas else 0.0,
+        }
+
+
+
+class ResultadosAnteriores:
+    """Último resultado bem-sucedido de cada consulta, de qualquer versão dos dados.
+
+    É a reserva de quando uma consulta estoura o orçamento: melhor mostrar o
+    resultado anterior, marcado como desatualizado, do que nada. Guarda no
+    máximo `max_entradas` consultas, descartando as menos usadas.
+    """
+
+    def __init__(self, max_entradas=MAX_ANTERIORES):
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def guardar(self, partes, impressao, df):
+        with self._lock:
+            self._entradas[partes] = {'impressao': impressao, 'instante': datetime.now(), 'df': df}
+            self._entradas.move_to_end(partes)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def obter(self, partes):
+        """{'impressao', 'instante', 'df'} do último resultado da chave, ou None."""
+        with self._lock:
+            entrada = self._entradas.get(partes)
+            if entrada is not None:
+                self._entradas.move_to_end(partes)
+            return entrada
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entradas)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inspeciona ou esvazia o cache de resultados em disco')
+    parser.add_argument('--diretorio', default=DIRETORIO_PADRAO)
+    parser.add_argument('--banco', default='sisagua.db')
+    parser.add_argument('--esvaziar', action='store_true', help='remove todas as entradas')
+    args = parser.parse_args()
+
+    cache = CacheResultados(args.diretorio)
+    if args.esvaziar:
+        cache.limite_bytes = 0
+        print(f'{cache.limpar()} entradas removidas.')
+    else:
+        removidas = cache.limpar(impressao_digital(args.banco))
+        stats = cache.estatisticas()
+        print(f"{stats['entradas']} entradas, {stats['bytes'] / 1024 ** 2:.1f} MB "
+              f"(limite {stats['limite_bytes'] / 1024 ** 2:.0f} MB); {removidas} obsoletas removidas.")
@@ -0,0 +1,426 @@
+import argparse
+import csv
+import itertools
+import re
+import sqlite3
+import time
+import unicodedata
+
+import alteracoes
+import conexoes
+import particoes
+
+# Esquema do sisagua.db (criado apenas se as tabelas ainda não existirem)
+ESQUEMA = '''
+CREATE TABLE IF NOT EXISTS Regiao (
+    id_regiao INTEGER PRIMARY KEY,
+    nome_regiao TEXT
+);
+CREATE TABLE IF NOT EXISTS Estado (
+    id_estado INTEGER PRIMARY KEY,
+    uf TEXT,
+    nome_estado TEXT,
+    id_regiao INTEGER REFERENCES Regiao (id_regiao)
+);
+CREATE TABLE IF NOT EXISTS Municipio (
+    id_municipio INTEGER PRIMARY KEY,
+    nome_municipio TEXT,
+    id_estado INTEGER REFERENCES Estado (id_estado)
+);
+CREATE TABLE IF NOT EXISTS Instituicao (
+    id_instituicao INTEGER PRIMARY KEY,
+    nome_instituicao TEXT,
+    tipo_instituicao TEXT
+);
+CREATE TABLE IF NOT EXISTS Escritorio_Regional (
+    id_escritorio INTEGER PRIMARY KEY,
+    nome_escritorio TEXT,
+    id_instituicao INTEGER REFERENCES Instituicao (id_instituicao)
+);
+CREATE TABLE IF NOT EXISTS ETA (
+    id_eta INTEGER PRIMARY KEY,
+    nome_eta TEXT,
+    tipo_filtracao TEXT,
+    id_municipio INTEGER REFERENCES Municipio (id_municipio),
+    id_escritorio INTEGER REFERENCES Escritorio_Regional (id_escritorio)
+);
+CREATE TABLE IF NOT EXISTS Parametro (
+    id_parametro INTEGER PRIMARY KEY,
+    nome_parametro TEXT,
+    unidade_medida TEXT,
+    categoria_parametro TEXT
+);
+CREATE TABLE IF NOT EXISTS Campo (
+    id_campo INTEGER PRIMARY KEY,
+    nome_campo TEXT
+);
+CREATE TABLE IF NOT EXISTS Ponto_Monitoramento (
+    id_ponto INTEGER PRIMARY KEY,
+    tipo_ponto TEXT,
+    nome_ponto TEXT
+);
+CREATE TABLE IF NOT EXISTS Medicao (
+    id_medicao INTEGER PRIMARY KEY,
+    id_eta INTEGER REFERENCES ETA (id_eta),
+    id_parametro INTEGER REFERENCES Parametro (id_parametro),
+    id_ponto INTEGER REFERENCES Ponto_Monitoramento (id_ponto),
+    id_campo INTEGER REFERENCES Campo (id_campo),
+    ano_referencia INTEGER,
+    mes_referencia INTEGER,
+    valor_medido REAL
+);
+'''
+
+# Cabeçalhos da extração "Controle mensal" do SISAGUA para cada campo da carga.
+# A comparação ignora acentos, maiúsculas e espaços extras.
+COLUNAS_CSV = {
+    'regiao': 'Região Geográfica',
+    'uf': 'UF',
+    'municipio': 'Município',
+    'eta': 'Nome da ETA / UTA',
+    'tipo_filtracao': 'Tipo de Filtração',
+    'instituicao': 'Nome da Instituição',
+    'tipo_instituicao': 'Tipo da Instituição',
+    'escritorio': 'Nome do Escritório Regional',
+    'ano': 'Ano de referência',
+    'mes': 'Mês de referência',
+    'ponto': 'Ponto de monitoramento',
+    'tipo_ponto': 'Tipo do ponto de monitoramento',
+    'parametro': 'Parâmetro',
+    'unidade': 'Unidade',
+    'categoria_parametro': 'Categoria do parâmetro',
+    'campo': 'Campo',
+    'valor': 'Valor',
+}
+OBRIGATORIAS = ['uf', 'municipio', 'eta', 'parametro', 'campo', 'ano', 'mes', 'valor']
+
+NOMES_ESTADOS = {
+    'AC': 'Acre', 'AL': 'Alagoas', 'AP': 'Amapá', 'AM': 'Amazonas', 'BA': 'Bahia',
+    'CE': 'Ceará', 'DF': 'Distrito Federal', 'ES': 'Espírito Santo', 'GO': 'Goiás',
+    'MA': 'Maranhão', 'MT': 'Mato Grosso', 'MS': 'Mato Grosso do Sul', 'MG': 'Minas Gerais',
+    'PA': 'Pará', 'PB': 'Paraíba', 'PR': 'Paraná', 'PE': 'Pernambuco', 'PI': 'Piauí',
+    'RJ': 'Rio de Janeiro', 'RN': 'Rio Grande do Norte', 'RS': 'Rio Grande do Sul',
+    'RO': 'Rondônia', 'RR': 'Roraima', 'SC': 'Santa Catarina', 'SP': 'São Paulo',
+    'SE': 'Sergipe', 'TO': 'Tocantins',
+}
+MESES = {
+    'janeiro': 1, 'fevereiro': 2, 'marco': 3, 'abril': 4, 'maio': 5, 'junho': 6,
+    'julho': 7, 'agosto': 8, 'setembro': 9, 'outubro': 10, 'novembro': 11, 'dezembro': 12,
+}
+
+# Categoria dos parâmetros quando a extração não traz a coluna: o painel agrupa
+# por categoria e não aceita valores nulos
+CATEGORIAS_PARAMETROS = [
+    ('Microbiológico', ('coliforme', 'escherichia', 'e. coli', 'bacteria')),
+    ('Físico', ('cor', 'turbidez')),
+    ('Químico', ('cloro', 'fluor', 'ph', 'dioxido', 'cloramina')),
+]
+CATEGORIA_PADRAO = 'Outros'
+
+# Linhas por executemany e por transação: lotes grandes amortizam o custo do
+# commit sem deixar a memória crescer com o tamanho do arquivo
+LINHAS_POR_LOTE = 50000
+LINHAS_POR_TRANSACAO = 1000000
+
+SQL_MEDICAO = '''
+    INSERT INTO Medicao (id_eta, id_parametro, id_ponto, id_campo,
+                         ano_referencia, mes_referencia, valor_medido)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+def _normalizar(texto):
+    texto = unicodedata.normalize('NFKD', texto or '').encode('ascii', 'ignore').decode()
+    return re.sub(r'\s+', ' ', texto).strip().lower()
+
+
+def _texto(valor):
+    valor = (valor or '').strip()
+    return valor or None
+
+
+def _numero(valor):
+    """Converte '1.234,5' / '1234.5' em float; vazio ou inválido vira None."""
+    valor = (valor or '').strip()
+    if not valor:
+        return None
+    if ',' in valor:
+        valor = valor.replace('.', '').replace(',', '.')
+    try:
+        return float(valor)
+    except ValueError:
+        return None
+
+
+def _mes(valor):
+    valor = (valor or '').strip()
+    if valor.isdigit():
+        return int(valor)
+    return MESES.get(_normalizar(valor))
+
+
+def categoria_parametro(nome):
+    normalizado = _normalizar(nome)
+    palavras = set(re.findall(r'[\w.]+', normalizado))
+    for categoria, termos in CATEGORIAS_PARAMETROS:
+        if any(termo in palavras or (len(termo) > 3 and termo in normalizado) for termo in termos):
+            return categoria
+    return CATEGORIA_PADRAO
+
+
+def mapear_cabecalho(cabecalho, colunas=COLUNAS_CSV):
+    """Posição de cada campo da carga no cabeçalho do CSV; erro se faltar um obrigatório."""
+    posicoes = {_normalizar(nome): i for i, nome in enumerate(cabecalho)}
+    mapa = {campo: posicoes.get(_normalizar(nome)) for campo, nome in colunas.items()}
+    faltantes = [colunas[campo] for campo in OBRIGATORIAS if mapa[campo] is None]
+    if faltantes:
+        raise ValueError(f'Colunas obrigatórias ausentes no CSV: {", ".join(faltantes)}')
+    return mapa
+
+
+class Dimensoes:
+    """Dicionários chave natural -> id de cada dimensão, carregados do banco.
+
+    Membros novos são inseridos na hora (dentro da transação da carga), de modo
+    que cada linha do CSV custa apenas buscas em dicionário.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.novos = 0
+        self.regiao = dict(conn.execute('SELECT nome_regiao, id_regiao FROM Regiao'))
+        self.estado = dict(conn.execute('SELECT uf, id_estado FROM Estado'))
+        self.municipio = {(e, n): i for i, n, e in conn.execute(
+            'SELECT id_municipio, nome_municipio, id_estado FROM Municipio')}
+        self.instituicao = dict(conn.execute('SELECT nome_instituicao, id_instituicao FROM Instituicao'))
+        self.escritorio = {(inst, n): i for i, n, inst in conn.execute(
+            'SELECT id_escritorio, nome_escritorio, id_instituicao FROM Escritorio_Regional')}
+        self.eta = {(m, n): i for i, n, m in conn.execute('SELECT id_eta, nome_eta, id_municipio FROM ETA')}
+        self.parametro = dict(conn.execute('SELECT nome_parametro, id_parametro FROM Parametro'))
+        self.campo = dict(conn.execute('SELECT nome_campo, id_campo FROM Campo'))
+        self.ponto = dict(conn.execute('SELECT nome_ponto, id_ponto FROM Ponto_Monitoramento'))
+
+    def _inserir(self, sql, valores):
+        self.novos += 1
+        return self.conn.execute(sql, valores).lastrowid
+
+    def id_regiao(self, nome):
+        if nome is None:
+            return None
+        if nome not in self.regiao:
+            self.regiao[nome] = self._inserir('INSERT INTO Regiao (nome_regiao) VALUES (?)', (nome,))
+        return self.regiao[nome]
+
+    def id_estado(self, uf, regiao):
+        if uf not in self.estado:
+            self.estado[uf] = self._inserir(
+                'INSERT INTO Estado (uf, nome_estado, id_regiao) VALUES (?, ?, ?)',
+                (uf, NOMES_ESTADOS.get(uf, uf), self.id_regiao(regiao)),
+            )
+        return self.estado[uf]
+
+    def id_municipio(self, id_estado, nome):
+        chave = (id_estado, nome)
+        if chave not in self.municipio:
+            self.municipio[chave] = self._inserir(
+                'INSERT INTO Municipio (nome_municipio, id_estado) VALUES (?, ?)', (nome, id_estado))
+        return self.municipio[chave]
+
+    def id_instituicao(self, nome, tipo):
+        if nome is None:
+            return None
+        if nome not in self.instituicao:
+            self.instituicao[nome] = self._inserir(
+                'INSERT INTO Instituicao (nome_instituicao, tipo_instituicao) VALUES (?, ?)', (nome, tipo))
+        return self.instituicao[nome]
+
+    def id_escritorio(self, id_instituicao, nome):
+        if nome is None:
+            return None
+        chave = (id_instituicao, nome)
+        if chave not in self.escritorio:
+            self.escritorio[chave] = self._inserir(
+                'INSERT INTO Escritorio_Regional (nome_escritorio, id_instituicao) VALUES (?, ?)',
+                (nome, id_instituicao))
+        return self.escritorio[chave]
+
+    def id_eta(self, id_municipio, nome, tipo_filtracao, id_escritorio):
+        chave = (id_municipio, nome)
+        if chave not in self.eta:
+            self.eta[chave] = self._inserir(
+                'INSERT INTO ETA (nome_eta, tipo_filtracao, id_municipio, id_escritorio) VALUES (?, ?, ?, ?)',
+                (nome, tipo_filtracao, id_municipio, id_escritorio))
+        return self.eta[chave]
+
+    def id_parametro(self, nome, unidade, categoria):
+        if nome not in self.parametro:
+            self.parametro[nome] = self._inserir(
+                'INSERT INTO Parametro (nome_parametro, unidade_medida, categoria_parametro) VALUES (?, ?, ?)',
+                (nome, unidade, categoria or categoria_parametro(nome)))
+        return self.parametro[nome]
+
+    def id_campo(self, nome):
+        if nome not in self.campo:
+            self.campo[nome] = self._inserir('INSERT INTO Campo (nome_campo) VALUES (?)', (nome,))
+        return self.campo[nome]
+
+    def id_ponto(self, nome, tipo):
+        if nome is None:
+            return None
+        if nome not in self.ponto:
+            self.ponto[nome] = self._inserir(
+                'INSERT INTO Ponto_Monitoramento (tipo_ponto, nome_ponto) VALUES (?, ?)', (tipo, nome))
+        return self.ponto[nome]
+
+
+def _medicoes(leitor, mapa, dimensoes, rejeitadas):
+    """Converte as linhas do CSV em tuplas de Medicao, resolvendo as dimensões."""
+    def campo(linha, nome):
+        posicao = mapa[nome]
+        return _texto(linha[posicao]) if posicao is not None and posicao < len(linha) else None
+
+    etas = {}
+    for linha in leitor:
+        uf, municipio, eta = campo(linha, 'uf'), campo(linha, 'municipio'), campo(linha, 'eta')
+        parametro, nome_campo = campo(linha, 'parametro'), campo(linha, 'campo')
+        ano, mes = campo(linha, 'ano'), _mes(campo(linha, 'mes'))
+        if not (uf and municipio and eta and parametro and nome_campo and ano and ano.isdigit() and mes):
+            rejeitadas[0] += 1
+            continue
+        # A hierarquia geográfica/institucional de uma ETA se repete em todas as
+        # suas linhas: resolve uma vez por combinação de textos
+        chave_eta = (uf, municipio, eta)
+        id_eta = etas.get(chave_eta)
+        if id_eta is None:
+            id_estado = dimensoes.id_estado(uf.upper(), campo(linha, 'regiao'))
+            id_municipio = dimensoes.id_municipio(id_estado, municipio)
+            id_instituicao = dimensoes.id_instituicao(campo(linha, 'instituicao'), campo(linha, 'tipo_instituicao'))
+            id_escritorio = dimensoes.id_escritorio(id_instituicao, campo(linha, 'escritorio'))
+            id_eta = etas[chave_eta] = dimensoes.id_eta(
+                id_municipio, eta, campo(linha, 'tipo_filtracao'), id_escritorio)
+        yield (
+            id_eta,
+            dimensoes.id_parametro(parametro, campo(linha, 'unidade'), campo(linha, 'categoria_parametro')),
+            dimensoes.id_ponto(campo(linha, 'ponto'), campo(linha, 'tipo_ponto')),
+            dimensoes.id_campo(nome_campo),
+            int(ano),
+            mes,
+            _numero(campo(linha, 'valor')),
+        )
+
+
+def _adiar_indices(conn):
+    """Remove os índices da Medicao e devolve o SQL para recriá-los depois da carga."""
+    indices = conn.execute(
+        "SELECT name, sql FROM sqlite_master "
+        "WHERE type = 'index' AND tbl_name = 'Medicao' AND sql IS NOT NULL"
+    ).fetchall()
+    for nome, _ in indices:
+        conn.execute(f'DROP INDEX {nome}')
+    return [sql for _, sql in indices]
+
+
+def carregar_csv(conn, arquivos, encoding='latin-1', separador=';', substituir=False,
+                 linhas_por_lote=LINHAS_POR_LOTE, linhas_por_transacao=LINHAS_POR_TRANSACAO,
+                 adiar_indices=True, progresso=print):
+    """Carrega extrações CSV do SISAGUA em streaming no sisagua.db.
+
+    Com substituir=True, as medições de cada (ano, mês) encontrado nos arquivos
+    são apagadas antes de serem recarregadas, tornando a recarga mensal
+    idempotente. Retorna um resumo com as linhas inseridas e a vazão.
+    """
+    conn.executescript(ESQUEMA)
+    conexoes.ativar_wal(conn)
+    # Apagar os meses substituídos precisa aparecer nas assinaturas de versão
+    alteracoes.instalar(conn)
+    conn.commit()
+    # A carga pode ser refeita do zero se falhar, então o fsync de cada commit é dispensável
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA cache_size = -262144')
+
+    inicio = time.perf_counter()
+    indices = _adiar_indices(conn) if adiar_indices else []
+    conn.commit()
+    dimensoes = Dimensoes(conn)
+    periodos = set()
+    fechados = particoes.particoes(conn)
+    inseridas, na_transacao, rejeitadas = 0, 0, [0]
+    try:
+        for arquivo in arquivos:
+            with open(arquivo, newline='', encoding=encoding) as origem:
+                leitor = csv.reader(origem, delimiter=separador)
+                mapa = mapear_cabecalho(next(leitor))
+                linhas = _medicoes(leitor, mapa, dimensoes, rejeitadas)
+                while True:
+                    lote = list(itertools.islice(linhas, linhas_por_lote))
+                    if not lote:
+                        break
+                    if substituir:
+                        for periodo in {(ano, mes) for _, _, _, _, ano, mes, _ in lote} - periodos:
+                            if periodo[0] in fechados:
+                                # A partição do ano é somente leitura: recarregar duplicaria as medições
+                                raise ValueError(f'{periodo[0]} é um ano fechado ({fechados[periodo[0]]}); '
+                                                 'não é possível substituir suas medições')
+                            conn.execute(
+                                'DELETE FROM Medicao WHERE ano_referencia = ? AND mes_referencia = ?', periodo)
+                            periodos.add(periodo)
+                    conn.executemany(SQL_MEDICAO, lote)
+                    inseridas += len(lote)
+                    na_transacao += len(lote)
+                    if na_transacao >= linhas_por_transacao:
+                        conn.commit()
+                        na_transacao = 0
+                    if progresso:
+                        decorrido = time.perf_counter() - inicio
+                        progresso(f'{inseridas:,} linhas ({inseridas / decorrido:,.0f} linhas/s)')
+        conn.commit()
+    finally:
+        # Os índices são recriados mesmo se a carga falhar no meio
+        if conn.in_transaction:
+            conn.rollback()
+        inicio_indices = time.perf_counter()
+        for sql in indices:
+            conn.execute(sql)
+        if indices:
+            conn.execute('ANALYZE Medicao')
+        conn.commit()
+        conn.execute('PRAGMA synchronous = FULL')
+
+    decorrido = time.perf_counter() - inicio
+    return {
+        'inseridas': inseridas,
+        'rejeitadas': rejeitadas[0],
+        'dimensoes_novas': dimensoes.novos,
+        'periodos_substituidos': sorted(periodos),
+        'segundos': decorrido,
+        'segundos_indices': time.perf_counter() - inicio_indices,
+        'linhas_por_segundo': inseridas / decorrido if decorrido else 0.0,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Carrega extrações CSV do SISAGUA no sisagua.db')
+    parser.add_argument('arquivos', nargs='+', help='arquivos CSV do controle mensal')
+    parser.add_argument('--banco', default='sisagua.db')
+    parser.add_argument('--encoding', default='latin-1')
+    parser.add_argument('--separador', default=';')
+    parser.add_argument('--substituir', action='store_true',
+                        help='apaga as medições dos meses presentes nos arquivos antes de carregá-los')
+    parser.add_argument('--manter-indices', action='store_true',
+                        help='não remove os índices da Medicao durante a carga')
+    parser.add_argument('--lote', type=int, default=LINHAS_POR_LOTE, help='linhas por executemany')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.banco)
+    try:
+        resumo = carregar_csv(conn, args.arquivos, encoding=args.encoding, separador=args.separador,
+                              substituir=args.substituir, linhas_por_lote=args.lote,
+                              adiar_indices=not args.manter_indices)
+    except (ValueError, OSError, csv.Error) as e:
+        raise SystemExit(f'Erro: {e}')
+    print(f"{resumo['inseridas']:,} medições inseridas em {resumo['segundos']:.1f}s "
+          f"({resumo['linhas_por_segundo']:,.0f} linhas/s; índices: {resumo['segundos_indices']:.1f}s).")
+    if resumo['rejeitadas']:
+        print(f"{resumo['rejeitadas']:,} linhas rejeitadas por campos obrigatórios vazios.")
+    if resumo['dimensoes_novas']:
+        print(f"{resumo['dimensoes_novas']:,} membros novos nas dimensões.")
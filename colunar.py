@@ -0,0 +1,413 @@
+import argparse
+import functools
+import json
+import operator
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+import particoes
+from agregados import assinatura_origem
+from consultas import filtros_ativos, get_consultas
+
+# Tabelas exportadas para o snapshot colunar
+TABELAS = [
+    'Regiao', 'Estado', 'Municipio', 'Instituicao', 'Escritorio_Regional',
+    'ETA', 'Parametro', 'Campo', 'Ponto_Monitoramento', 'Medicao',
+]
+
+DIRETORIO_PADRAO = 'snapshot_parquet'
+LINHAS_POR_LOTE = 500000
+
+# Faixas de valores consideradas em analise_filtracao (mesmo predicado do SQL)
+FAIXAS_FILTRACAO = {
+    'Cloro Residual Livre (mg/L)': [
+        'Número de dados >= 2,0 mg/L e <= 5,0mg/L',
+        'Número de dados < 0,2 mg/L',
+        'Número de dados > 5,0 mg/L',
+    ],
+    'Cor (uH)': [
+        'Número de dados <= 15,0 uH',
+        'Número de dados > 15,0 uH',
+    ],
+    'pH': [
+        'Número de dados >= 6,0 e <= 9,0',
+        'Número de dados < 6,0',
+        'Número de dados > 9,0',
+    ],
+}
+
+
+def _tipo_arrow(tipo_declarado, dicionario=True):
+    tipo = (tipo_declarado or '').upper()
+    if 'INT' in tipo:
+        return pa.int64()
+    if any(t in tipo for t in ('REAL', 'FLOA', 'DOUB', 'NUM', 'DEC')):
+        return pa.float64()
+    # Textos são gravados com codificação de dicionário (viram category no pandas)
+    return pa.dictionary(pa.int32(), pa.string()) if dicionario else pa.string()
+
+
+def esquema_arrow(conn, tabela, dicionario=True):
+    """Esquema Arrow derivado dos tipos declarados da tabela no SQLite.
+
+    Colunas sem tipo declarado (ex.: agregações de um CREATE TABLE AS) usam o
+    tipo do primeiro valor não nulo.
+    """
+    campos = []
+    for coluna in conn.execute(f'PRAGMA table_info({tabela})').fetchall():
+        tipo = coluna[2]
+        if not tipo:
+            linha = conn.execute(
+                f'SELECT typeof({coluna[1]}) FROM {tabela} WHERE {coluna[1]} IS NOT NULL LIMIT 1'
+            ).fetchone()
+            tipo = linha[0] if linha else ''
+        campos.append((coluna[1], _tipo_arrow(tipo, dicionario)))
+    return pa.schema(campos)
+
+
+def ler_em_lotes(conn, tabela, esquema, linhas_por_lote=LINHAS_POR_LOTE):
+    """Lê uma tabela do SQLite como RecordBatches Arrow de tamanho limitado."""
+    cursor = conn.execute(f'SELECT {", ".join(esquema.names)} FROM {tabela}')
+    while True:
+        linhas = cursor.fetchmany(linhas_por_lote)
+        if not linhas:
+            break
+        arrays = []
+        for campo, valores in zip(esquema, zip(*linhas)):
+            if pa.types.is_dictionary(campo.type):
+                arrays.append(pa.array(valores, pa.string()).dictionary_encode())
+            else:
+                arrays.append(pa.array(valores, campo.type))
+        yield pa.record_batch(arrays, schema=esquema)
+
+
+def exportar_snapshot(conn, diretorio=DIRETORIO_PADRAO, linhas_por_lote=LINHAS_POR_LOTE):
+    """Exporta as tabelas do SISAGUA para Parquet, em lotes de memória constante."""
+    diretorio = Path(diretorio)
+    diretorio.mkdir(parents=True, exist_ok=True)
+    for tabela in TABELAS:
+        esquema = esquema_arrow(conn, tabela)
+        destino = diretorio / f'{tabela}.parquet'
+        temporario = destino.with_suffix('.parquet.tmp')
+        with pq.ParquetWriter(temporario, esquema, compression='zstd') as writer:
+            for lote in ler_em_lotes(conn, tabela, esquema, linhas_por_lote):
+                writer.write_batch(lote)
+        temporario.replace(destino)
+    manifesto = {'assinatura': assinatura_origem(conn)}
+    (diretorio / 'manifesto.json').write_text(json.dumps(manifesto))
+
+
+def snapshot_desatualizado(conn, diretorio=DIRETORIO_PADRAO):
+    manifesto = Path(diretorio) / 'manifesto.json'
+    if not manifesto.exists():
+        return True
+    gravada = [tuple(item) for item in json.loads(manifesto.read_text())['assinatura']]
+    return sorted(gravada) != sorted(assinatura_origem(conn))
+
+
+def _arredondar(valores, casas):
+    """ROUND(x, n) com a mesma regra do SQLite (metade para longe do zero)."""
+    valores = np.asarray(valores, dtype=np.float64)
+    if casas == 0:
+        return np.where(valores >= 0, np.floor(valores + 0.5), -np.floor(-valores + 0.5))
+    fator = 10.0 ** casas
+    ajustados = np.abs(valores).astype(np.longdouble) + np.longdouble(0.5) / np.longdouble(fator)
+    return np.sign(valores) * (np.floor(ajustados * np.longdouble(fator)).astype(np.float64) / fator)
+
+
+def _texto(serie):
+    """Converte categorias de volta para o tipo de texto que o read_sql produziria."""
+    serie = serie.astype(object)
+    return serie.where(serie.notna(), None).infer_objects()
+
+
+def _finalizar(df):
+    if df.empty:
+        # O read_sql não tem como inferir tipos de um resultado vazio
+        return df.astype(object).reset_index(drop=True)
+    for coluna in df.columns:
+        if isinstance(df[coluna].dtype, pd.CategoricalDtype) or df[coluna].dtype == object:
+            df[coluna] = _texto(df[coluna])
+    return df.reset_index(drop=True)
+
+
+class SnapshotColunar:
+    """Executa as consultas de get_consultas() sobre o snapshot Parquet.
+
+    As dimensões (pequenas) ficam em memória como DataFrames; a Medicao continua
+    em Parquet e cada consulta varre só as colunas de que precisa, com os filtros
+    aplicados na própria leitura.
+    """
+
+    def __init__(self, diretorio=DIRETORIO_PADRAO):
+        self.diretorio = Path(diretorio)
+        self.tabelas = {tabela: self._carregar(tabela) for tabela in TABELAS if tabela != 'Medicao'}
+        self.medicao = ds.dataset(self.diretorio / 'Medicao.parquet', format='parquet')
+        self._eta_geo = self._montar_eta_geo()
+
+    def _carregar(self, tabela):
+        df = pq.read_table(self.diretorio / f'{tabela}.parquet', memory_map=True).to_pandas()
+        for coluna in df.columns:
+            if isinstance(df[coluna].dtype, pd.CategoricalDtype):
+                # Categorias em ordem lexicográfica para que ORDER BY coincida com o SQLite
+                df[coluna] = df[coluna].cat.set_categories(sorted(df[coluna].cat.categories))
+        return df
+
+    def _montar_eta_geo(self):
+        # Cadeia ETA -> Município -> Estado -> Região com LEFT JOINs; as colunas
+        # *_ok marcam se a linha da dimensão existe (equivalente aos INNER JOINs)
+        t = self.tabelas
+        geo = t['ETA'][['id_eta', 'id_municipio', 'id_escritorio', 'tipo_filtracao']].copy()
+        municipios = t['Municipio'].set_index('id_municipio')['id_estado']
+        estados = t['Estado'].set_index('id_estado')
+        regioes = t['Regiao'].set_index('id_regiao')['nome_regiao']
+        geo['mun_ok'] = geo['id_municipio'].isin(municipios.index)
+        geo['id_estado'] = geo['id_municipio'].map(municipios).where(geo['mun_ok'])
+        geo['est_ok'] = geo['id_estado'].isin(estados.index)
+        geo['uf'] = geo['id_estado'].map(estados['uf'])
+        geo['nome_estado'] = geo['id_estado'].map(estados['nome_estado'])
+        geo['id_regiao'] = geo['id_estado'].map(estados['id_regiao']).where(geo['est_ok'])
+        geo['reg_ok'] = geo['id_regiao'].isin(regioes.index)
+        geo['nome_regiao'] = geo['id_regiao'].map(regioes)
+        return geo
+
+    def _medicoes(self, filtros, colunas):
+        """Colunas `colunas` da Medicao com os filtros da barra lateral aplicados
+        na varredura do Parquet (mesma semântica de FILTROS)."""
+        campo = pc.field
+        condicoes = []
+        if 'ano' in filtros:
+            condicoes.append(campo('ano_referencia') == filtros['ano'])
+        if 'mes_inicio' in filtros:
+            condicoes.append(campo('mes_referencia') >= filtros['mes_inicio'])
+        if 'mes_fim' in filtros:
+            condicoes.append(campo('mes_referencia') <= filtros['mes_fim'])
+        geo = self._eta_geo
+        if 'regiao' in filtros:
+            etas = geo.loc[geo['reg_ok'] & (geo['nome_regiao'] == filtros['regiao']), 'id_eta']
+            condicoes.append(campo('id_eta').isin(pa.array(etas.to_numpy(), pa.int64())))
+        if 'uf' in filtros:
+            etas = geo.loc[geo['est_ok'] & (geo['uf'] == filtros['uf']), 'id_eta']
+            condicoes.append(campo('id_eta').isin(pa.array(etas.to_numpy(), pa.int64())))
+        if 'tecnologia' in filtros:
+            etas = geo.loc[geo['tipo_filtracao'] == filtros['tecnologia'], 'id_eta']
+            condicoes.append(campo('id_eta').isin(pa.array(etas.to_numpy(), pa.int64())))
+        if 'parametro' in filtros:
+            parametros = self.tabelas['Parametro']
+            ids = parametros.loc[parametros['nome_parametro'] == filtros['parametro'], 'id_parametro']
+            condicoes.append(campo('id_parametro').isin(pa.array(ids.to_numpy(), pa.int64())))
+        filtro = functools.reduce(operator.and_, condicoes) if condicoes else None
+        return self.medicao.to_table(columns=colunas, filter=filtro).to_pandas()
+
+    def _medicoes_geo(self, filtros, colunas):
+        med = self._medicoes(filtros, ['id_eta', *colunas])
+        return med.merge(self._eta_geo, on='id_eta', how='inner')
+
+    def _parametros_validos(self, med):
+        return med[med['id_parametro'].isin(self.tabelas['Parametro']['id_parametro'])]
+
+    def executar(self, nome, filtros=None):
+        """Retorna o mesmo DataFrame que a consulta SQL de get_consultas() retornaria."""
+        filtros = filtros_ativos(nome, filtros)
+        return _finalizar(getattr(self, f'_{nome}')(filtros))
+
+    def _etas_tecnologia(self, filtros):
+        eta = self.tabelas['ETA']
+        tipos = eta['tipo_filtracao']
+        validas = eta[tipos.notna() & (tipos != '')]
+        df = validas.groupby('tipo_filtracao', observed=True).size().reset_index(name='Qtd ETAs')
+        df['Percentual'] = _arredondar(df['Qtd ETAs'] * 100.0 / len(eta), 2)
+        df = df.sort_values('Qtd ETAs', ascending=False, kind='mergesort')
+        return df.rename(columns={'tipo_filtracao': 'Tecnologia de Tratamento'})
+
+    def _parametros_qualidade(self, filtros):
+        param = self.tabelas['Parametro']
+        param = param[param['nome_parametro'].notna() & (param['nome_parametro'] != '')]
+        nomes = param['nome_parametro'].astype(str).str.lower()
+        finalidade = np.select(
+            [nomes.str.contains('turbidez', regex=False), nomes.str.contains('cor', regex=False),
+             nomes.str.contains('cloro', regex=False), nomes.str.contains('ph', regex=False),
+             nomes.str.contains('fluoreto', regex=False), nomes.str.contains('coli', regex=False),
+             nomes.str.contains('coliforme', regex=False)],
+            ['Aspecto Físico', 'Aspecto Físico', 'Desinfecção', 'Equilíbrio Químico',
+             'Saúde Pública', 'Segurança Microbiológica', 'Segurança Microbiológica'],
+            'Outros Indicadores',
+        )
+        ordem = np.select(
+            [nomes.str.contains('turbidez', regex=False), nomes.str.contains('cloro', regex=False),
+             nomes.str.contains('ph', regex=False), nomes.str.contains('coli', regex=False)],
+            [1, 2, 3, 4], 5,
+        )
+        df = pd.DataFrame({
+            'Parâmetro de Qualidade': param['nome_parametro'].astype(object).to_numpy(),
+            'Unidade': param['unidade_medida'].astype(object).to_numpy(),
+            'Finalidade do Monitoramento': finalidade,
+            '_ordem': ordem,
+        })
+        df = df.sort_values(['_ordem', 'Parâmetro de Qualidade'], kind='mergesort')
+        return df.drop(columns='_ordem')
+
+    def _etas_estado(self, filtros):
+        geo = self._eta_geo[self._eta_geo['est_ok']]
+        df = geo.groupby(['uf', 'nome_estado'], observed=True, dropna=False).agg(
+            total=('id_eta', 'nunique'), municipios=('id_municipio', 'nunique'),
+        ).reset_index()
+        df = df[df['total'] > 0]
+        df['ETAs por Município'] = _arredondar(df['total'] / df['municipios'], 2)
+        df = df.sort_values('total', ascending=False, kind='mergesort')
+        return df.rename(columns={
+            'uf': 'UF', 'nome_estado': 'Estado',
+            'total': 'Total ETAs', 'municipios': 'Municípios com ETA',
+        })
+
+    def _medicoes_ponto(self, filtros):
+        med = self._medicoes(filtros, ['id_ponto'])
+        pontos = self.tabelas['Ponto_Monitoramento']
+        df = med.merge(pontos, on='id_ponto', how='inner')
+        df = df.groupby(['tipo_ponto', 'nome_ponto'], observed=True, dropna=False).size()
+        df = df.reset_index(name='Total Medições')
+        df['% do Total'] = _arredondar(df['Total Medições'] * 100.0 / len(med), 2)
+        df = df.sort_values('Total Medições', ascending=False, kind='mergesort')
+        return df.rename(columns={'tipo_ponto': 'Tipo', 'nome_ponto': 'Ponto de Monitoramento'})
+
+    def _parametros_categoria(self, filtros):
+        med = self._medicoes(filtros, ['id_parametro'])
+        df = med.merge(self.tabelas['Parametro'], on='id_parametro', how='inner')
+        df = df.groupby(['categoria_parametro', 'nome_parametro'], observed=True, dropna=False).size()
+        df = df.reset_index(name='Total Medições')
+        df['% do Total'] = _arredondar(df['Total Medições'] * 100.0 / len(med), 2)
+        df = df.sort_values(['categoria_parametro', 'Total Medições'], ascending=[True, False],
+                            kind='mergesort', na_position='first')
+        return df.rename(columns={'categoria_parametro': 'Categoria', 'nome_parametro': 'Parâmetro'})
+
+    def _analise_geografica(self, filtros):
+        med = self._medicoes_geo(filtros, ['id_medicao'])
+        med = med[med['reg_ok']]
+        df = med.groupby(['nome_regiao', 'uf'], observed=True, dropna=False).agg(
+            municipios=('id_municipio', 'nunique'), etas=('id_eta', 'nunique'),
+            medicoes=('id_medicao', 'count'),
+        ).reset_index()
+        df = df[df['medicoes'] > 0]
+        df['Medições/ETA'] = _arredondar(df['medicoes'] / df['etas'], 0)
+        df = df.sort_values('medicoes', ascending=False, kind='mergesort')
+        return df.rename(columns={
+            'nome_regiao': 'Região', 'uf': 'UF', 'municipios': 'Municípios',
+            'etas': 'ETAs Ativas', 'medicoes': 'Total Medições',
+        })
+
+    def _performance_instituicao(self, filtros):
+        med = self._parametros_validos(self._medicoes_geo(filtros, ['id_parametro', 'id_medicao']))
+        escritorios = self.tabelas['Escritorio_Regional'][['id_escritorio', 'id_instituicao']]
+        instituicoes = self.tabelas['Instituicao'][['id_instituicao', 'nome_instituicao', 'tipo_instituicao']]
+        med = med.merge(escritorios, on='id_escritorio', how='inner')
+        med = med.merge(instituicoes, on='id_instituicao', how='inner')
+        df = med.groupby(['nome_instituicao', 'tipo_instituicao'], observed=True, dropna=False).agg(
+            etas=('id_eta', 'nunique'), parametros=('id_parametro', 'nunique'),
+            medicoes=('id_medicao', 'count'),
+        ).reset_index()
+        df = df[df['medicoes'] > 1000]
+        df['Med/ETA'] = _arredondar(df['medicoes'] / df['etas'], 0)
+        df = df.sort_values('etas', ascending=False, kind='mergesort')
+        return df.rename(columns={
+            'nome_instituicao': 'Instituição', 'tipo_instituicao': 'Tipo',
+            'etas': 'ETAs', 'parametros': 'Parâmetros', 'medicoes': 'Medições',
+        })
+
+    def _analise_filtracao(self, filtros):
+        med = self._medicoes_geo(filtros, ['id_parametro', 'id_campo', 'valor_medido', 'id_medicao'])
+        med = med[med['tipo_filtracao'].notna()]
+        med = med.merge(self.tabelas['Parametro'][['id_parametro', 'nome_parametro']], on='id_parametro')
+        med = med.merge(self.tabelas['Campo'][['id_campo', 'nome_campo']], on='id_campo')
+        nome_parametro = med['nome_parametro'].astype(object)
+        nome_campo = med['nome_campo'].astype(object)
+        selecionadas = np.zeros(len(med), dtype=bool)
+        for parametro, faixas in FAIXAS_FILTRACAO.items():
+            selecionadas |= ((nome_parametro == parametro) & nome_campo.isin(faixas)).to_numpy()
+        med = med[selecionadas]
+        df = med.groupby(['tipo_filtracao', 'nome_parametro', 'nome_campo'], observed=True).agg(
+            analises=('valor_medido', 'sum'), etas=('id_eta', 'nunique'),
+            medicoes=('id_medicao', 'count'),
+        ).reset_index()
+        total = df.groupby(['tipo_filtracao', 'nome_parametro'], observed=True)['analises'].transform('sum')
+        df['Porcentagem'] = _arredondar(df['analises'] * 100.0 / total, 2)
+        df = df[df['medicoes'] >= 10].drop(columns='medicoes')
+        for coluna in ['tipo_filtracao', 'nome_parametro', 'nome_campo']:
+            df[coluna] = df[coluna].astype(object)
+        df = df.sort_values(['tipo_filtracao', 'nome_parametro', 'nome_campo'],
+                            ascending=[True, True, False], kind='mergesort')
+        return df.rename(columns={
+            'tipo_filtracao': 'Tipo Filtração', 'nome_parametro': 'Parâmetro',
+            'nome_campo': 'Faixa de Valores', 'analises': 'Análises', 'etas': 'ETAs',
+        })[['Tipo Filtração', 'Parâmetro', 'Faixa de Valores', 'Análises', 'ETAs', 'Porcentagem']]
+
+    def _ranking_estados(self, filtros):
+        med = self._parametros_validos(self._medicoes_geo(filtros, ['id_parametro', 'id_medicao']))
+        med = med[med['est_ok']]
+        df = med.groupby('nome_estado', observed=True, dropna=False).agg(
+            etas=('id_eta', 'nunique'), parametros=('id_parametro', 'nunique'),
+            medicoes=('id_medicao', 'count'),
+        ).reset_index()
+        df = df[df['etas'] >= 5]
+        df = df.sort_values(['parametros', 'medicoes'], ascending=False, kind='mergesort')
+        return df.rename(columns={
+            'nome_estado': 'Estado', 'etas': 'ETAs', 'parametros': 'Parâmetros', 'medicoes': 'Medições',
+        })
+
+    def _evolucao_temporal(self, filtros):
+        med = self._parametros_validos(
+            self._medicoes_geo(filtros, ['id_parametro', 'mes_referencia', 'id_medicao']))
+        med = med[med['reg_ok']]
+        df = med.groupby(['nome_regiao', 'mes_referencia'], observed=True, dropna=False).agg(
+            registros=('id_medicao', 'count'), etas=('id_eta', 'nunique'),
+            parametros=('id_parametro', 'nunique'),
+        ).reset_index()
+        df = df[df['registros'] >= 100]
+        df['Intensidade (Reg/ETA)'] = _arredondar(df['registros'] / df['etas'], 1)
+        df['Diversidade (Par/ETA)'] = _arredondar(df['parametros'] / df['etas'], 2)
+        df['Período'] = np.select(
+            [df['mes_referencia'] <= 2, df['mes_referencia'] <= 4],
+            ['Início do Ano', 'Meio do Ano'], 'Segundo Semestre',
+        )
+        df = df.sort_values(['nome_regiao', 'mes_referencia'], kind='mergesort')
+        return df.rename(columns={
+            'nome_regiao': 'Região', 'mes_referencia': 'Mês', 'registros': 'Total de Registros',
+            'etas': 'ETAs Ativas', 'parametros': 'Parâmetros Distintos',
+        })
+
+    def _metricas_gerais(self, filtros):
+        t = self.tabelas
+        geo = self._eta_geo[self._eta_geo['mun_ok']]
+        return pd.DataFrame({
+            'tipo': ['Estados Monitorados', 'ETAs Ativas', 'Total de Medições',
+                     'Parâmetros Monitorados', 'Municípios Atendidos'],
+            'valor': [
+                geo.loc[geo['est_ok'], 'nome_estado'].nunique(),
+                len(t['ETA']),
+                self.medicao.count_rows(),
+                len(t['Parametro']),
+                geo['id_municipio'].nunique(),
+            ],
+        })
+
+
+# Consultas que o backend colunar sabe responder
+CONSULTAS = [nome for nome in get_consultas() if hasattr(SnapshotColunar, f'_{nome}')]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Exporta o sisagua.db para um snapshot Parquet')
+    parser.add_argument('banco', nargs='?', default='sisagua.db')
+    parser.add_argument('--destino', default=DIRETORIO_PADRAO)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.banco)
+    particoes.anexar(conn, args.banco)
+    exportar_snapshot(conn, args.destino)
+    print(f'Snapshot exportado para {args.destino}/')
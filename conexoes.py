@@ -0,0 +1,218 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import particoes
+
+# Intervalo, em instruções da máquina virtual do SQLite, entre as verificações
+# de prazo e cancelamento
+PASSOS_VERIFICACAO = 10000
+
+# Prazo e cancelamento valem para as consultas da thread que os definiu
+_limites = threading.local()
+
+# Empréstimos de conexão (uma consulta ou um lote) e espera por conexão livre,
+# somados sobre todos os pools do processo
+_uso = {'emprestimos': 0, 'espera_s': 0.0}
+_uso_lock = threading.Lock()
+
+
+def uso_pools():
+    """{'emprestimos', 'espera_s'} acumulados pelos pools do processo até agora."""
+    with _uso_lock:
+        return dict(_uso)
+
+
+class ConsultaInterrompida(Exception):
+    """Consulta abortada por ter estourado o prazo ('tempo') ou sido cancelada ('cancelada')."""
+
+    def __init__(self, motivo, segundos):
+        super().__init__(f'consulta {"cancelada" if motivo == "cancelada" else "interrompida por tempo"} '
+                         f'após {segundos:.1f}s')
+        self.motivo = motivo
+        self.segundos = segundos
+
+    def __reduce__(self):
+        # Volta inteira dos processos trabalhadores (motores.MotorProcessos)
+        return ConsultaInterrompida, (self.motivo, self.segundos)
+
+
+def ativar_wal(conn):
+    """Coloca o banco em modo WAL, permitindo leitores concorrentes a um escritor.
+
+    O modo WAL é persistente no arquivo, então basta uma conexão de escrita
+    executá-lo uma vez. Retorna o modo de journal resultante.
+    """
+    try:
+        return conn.execute('PRAGMA journal_mode = WAL').fetchone()[0]
+    except sqlite3.Error:
+        return None
+
+
+def abrir_somente_leitura(caminho):
+    """Abre uma conexão que não consegue alterar o banco (mode=ro + query_only)."""
+    uri = Path(caminho).absolute().as_uri() + '?mode=ro'
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    conn.execute('PRAGMA temp_store = MEMORY')
+    anexar_particoes(conn, caminho)
+    return conn
+
+
+def anexar_particoes(conn, caminho):
+    """(Re)anexa as partições anuais da Medicao; a view fica no banco temp."""
+    # query_only também bloqueia o banco temp; main continua protegido por mode=ro
+    conn.execute('PRAGMA query_only = OFF')
+    try:
+        particoes.anexar(conn, caminho, somente_leitura=True)
+    finally:
+        conn.execute('PRAGMA query_only = ON')
+
+
+@contextmanager
+def orcamento(segundos=None, cancelada=None):
+    """Limita as consultas que a thread atual fizer pelo pool (e pelo motor DuckDB).
+
+    Passados `segundos` (None ou 0: sem limite), ou assim que cancelada()
+    retornar verdadeiro, a consulta em andamento é abortada com
+    ConsultaInterrompida e a conexão volta livre para o pool.
+    """
+    anterior = getattr(_limites, 'atual', None)
+    inicio = time.monotonic()
+    _limites.atual = (inicio, inicio + segundos if segundos else None, cancelada)
+    try:
+        yield
+    finally:
+        _limites.atual = anterior
+
+
+def cancelada_por_marca(ler_marca):
+    """cancelada() para orcamento: verdadeiro assim que ler_marca() deixar de
+    devolver o valor que tinha agora (ex.: a marca da execução corrente de uma
+    sessão do painel, trocada quando essa execução é abandonada)."""
+    marca = ler_marca()
+    return lambda: ler_marca() != marca
+
+
+def prazo_restante():
+    """Segundos até o fim do orçamento da thread atual, ou None sem prazo."""
+    limite = getattr(_limites, 'atual', None)
+    if limite is None or limite[1] is None:
+        return None
+    return limite[1] - time.monotonic()
+
+
+def verificar_orcamento():
+    """Levanta ConsultaInterrompida se o orçamento da thread atual já acabou."""
+    motivo = _motivo_interrupcao()
+    if motivo:
+        raise ConsultaInterrompida(motivo, time.monotonic() - _limites.atual[0])
+
+
+def _motivo_interrupcao():
+    limite = getattr(_limites, 'atual', None)
+    if limite is None:
+        return None
+    _, fim, cancelada = limite
+    if fim is not None and time.monotonic() > fim:
+        return 'tempo'
+    if cancelada is not None and cancelada():
+        return 'cancelada'
+    return None
+
+
+@contextmanager
+def _interrompivel(conn):
+    """Aplica o orçamento da thread atual às consultas feitas em conn.
+
+    O progress handler do SQLite aborta a instrução em andamento uma única vez:
+    a limpeza que vem depois (DROP de temporárias, commit) roda normalmente.
+    """
+    limite = getattr(_limites, 'atual', None)
+    if limite is None:
+        yield
+        return
+    interrupcao = []
+
+    def verificar():
+        if interrupcao:
+            return 0
+        motivo = _motivo_interrupcao()
+        if motivo:
+            interrupcao.append(motivo)
+            return 1
+        return 0
+
+    conn.set_progress_handler(verificar, PASSOS_VERIFICACAO)
+    try:
+        yield
+    except Exception as e:
+        # O sqlite3 levanta OperationalError('interrupted'); o pandas o embrulha
+        # em DatabaseError
+        if interrupcao:
+            raise ConsultaInterrompida(interrupcao[0], time.monotonic() - limite[0]) from e
+        raise
+    finally:
+        conn.set_progress_handler(None, PASSOS_VERIFICACAO)
+
+
+class PoolConexoes:
+    """Pool de conexões somente leitura ao sisagua.db.
+
+    Cada conexão é usada por uma única thread por vez; as consultas de sessões
+    (ou abas) diferentes rodam em paralelo, já que o sqlite3 libera o GIL
+    durante a execução. Dentro de orcamento(), as consultas feitas na conexão
+    emprestada respeitam o prazo e o cancelamento da thread.
+    """
+
+    def __init__(self, caminho='sisagua.db', tamanho=None):
+        self.caminho = caminho
+        self.tamanho = tamanho or os.cpu_count() or 4
+        self._livres = queue.LifoQueue()
+        self._versoes = {}
+        for _ in range(self.tamanho):
+            conn = abrir_somente_leitura(caminho)
+            self._versoes[id(conn)] = conn.execute('PRAGMA data_version').fetchone()[0]
+            self._livres.put(conn)
+
+    @contextmanager
+    def conexao(self, timeout=None):
+        inicio = time.perf_counter()
+        if timeout is None and prazo_restante() is not None:
+            # Esperar por uma conexão livre também consome o orçamento
+            try:
+                conn = self._livres.get(timeout=max(prazo_restante(), 0))
+            except queue.Empty:
+                verificar_orcamento()
+                raise
+        else:
+            conn = self._livres.get(timeout=timeout)
+        with _uso_lock:
+            _uso['emprestimos'] += 1
+            _uso['espera_s'] += time.perf_counter() - inicio
+        try:
+            self._atualizar_particoes(conn)
+            with _interrompivel(conn):
+                yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._livres.put(conn)
+
+    def _atualizar_particoes(self, conn):
+        # data_version muda quando outra conexão grava no banco (uma carga ou
+        # um ano fechado); só então vale conferir se há partições novas
+        versao = conn.execute('PRAGMA data_version').fetchone()[0]
+        if versao != self._versoes.get(id(conn)):
+            anexar_particoes(conn, self.caminho)
+            self._versoes[id(conn)] = versao
+
+    def fechar(self):
+        while True:
+            try:
+                self._livres.get_nowait().close()
+            except queue.Empty:
+                break
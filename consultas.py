@@ -0,0 +1,313 @@
+# Consultas SQL atualizadas.
+# O marcador {filtros} indica onde entram os filtros da barra lateral (ver montar_consulta).
+def get_consultas():
+    return {
+        'etas_tecnologia': '''
+        SELECT 
+            tipo_filtracao as "Tecnologia de Tratamento",
+            COUNT(*) as "Qtd ETAs",
+            ROUND(COUNT(*) * 100.0 / (SELECT COUNT(*) FROM ETA), 2) as "Percentual"
+        FROM ETA 
+        WHERE tipo_filtracao IS NOT NULL AND tipo_filtracao != ''
+        GROUP BY tipo_filtracao
+        ORDER BY COUNT(*) DESC
+        ''',
+        
+        'parametros_qualidade': '''
+        SELECT 
+            nome_parametro as "Parâmetro de Qualidade",
+            unidade_medida as "Unidade",
+            CASE 
+                WHEN nome_parametro LIKE '%Turbidez%' THEN 'Aspecto Físico'
+                WHEN nome_parametro LIKE '%Cor%' THEN 'Aspecto Físico'
+                WHEN nome_parametro LIKE '%Cloro%' THEN 'Desinfecção'
+                WHEN nome_parametro LIKE '%pH%' THEN 'Equilíbrio Químico'
+                WHEN nome_parametro LIKE '%Fluoreto%' THEN 'Saúde Pública'
+                WHEN nome_parametro LIKE '%coli%' THEN 'Segurança Microbiológica'
+                WHEN nome_parametro LIKE '%Coliforme%' THEN 'Segurança Microbiológica'
+                ELSE 'Outros Indicadores'
+            END as "Finalidade do Monitoramento"
+        FROM Parametro 
+        WHERE nome_parametro IS NOT NULL AND nome_parametro != ''
+        ORDER BY 
+            CASE 
+                WHEN nome_parametro LIKE '%Turbidez%' THEN 1
+                WHEN nome_parametro LIKE '%Cloro%' THEN 2
+                WHEN nome_parametro LIKE '%pH%' THEN 3
+                WHEN nome_parametro LIKE '%coli%' THEN 4
+                ELSE 5
+            END,
+            nome_parametro
+        ''',
+        
+        'etas_estado': '''
+        SELECT 
+            e.uf as "UF",
+            e.nome_estado as "Estado",
+            COUNT(DISTINCT eta.id_eta) as "Total ETAs",
+            COUNT(DISTINCT mun.id_municipio) as "Municípios com ETA",
+            ROUND(1.0 * COUNT(DISTINCT eta.id_eta) / COUNT(DISTINCT mun.id_municipio), 2) as "ETAs por Município"
+        FROM Estado e
+        INNER JOIN Municipio mun ON e.id_estado = mun.id_estado
+        INNER JOIN ETA eta ON mun.id_municipio = eta.id_municipio
+        GROUP BY e.uf, e.nome_estado
+        HAVING COUNT(DISTINCT eta.id_eta) > 0
+        ORDER BY COUNT(DISTINCT eta.id_eta) DESC
+        ''',
+        
+        'medicoes_ponto': '''
+        SELECT 
+            pm.tipo_ponto as "Tipo",
+            pm.nome_ponto as "Ponto de Monitoramento",
+            COUNT(med.id_medicao) as "Total Medições",
+            ROUND(COUNT(med.id_medicao) * 100.0 / (SELECT COUNT(*) FROM Medicao med WHERE 1 = 1{filtros}), 2) as "% do Total"
+        FROM Ponto_Monitoramento pm
+        INNER JOIN Medicao med ON pm.id_ponto = med.id_ponto
+        WHERE 1 = 1{filtros}
+        GROUP BY pm.tipo_ponto, pm.nome_ponto
+        ORDER BY COUNT(med.id_medicao) DESC
+        ''',
+        
+        'parametros_categoria': '''
+        SELECT 
+            p.categoria_parametro as "Categoria",
+            p.nome_parametro as "Parâmetro",
+            COUNT(med.id_medicao) as "Total Medições",
+            ROUND(COUNT(med.id_medicao) * 100.0 / (SELECT COUNT(*) FROM Medicao med WHERE 1 = 1{filtros}), 2) as "% do Total"
+        FROM Parametro p
+        INNER JOIN Medicao med ON p.id_parametro = med.id_parametro
+        WHERE 1 = 1{filtros}
+        GROUP BY p.categoria_parametro, p.nome_parametro
+        ORDER BY p.categoria_parametro, COUNT(med.id_medicao) DESC
+        ''',
+        
+        'analise_geografica': '''
+        SELECT 
+            r.nome_regiao as "Região",
+            e.uf as "UF",
+            COUNT(DISTINCT mun.id_municipio) as "Municípios",
+            COUNT(DISTINCT eta.id_eta) as "ETAs Ativas",
+            COUNT(med.id_medicao) as "Total Medições",
+            ROUND(COUNT(med.id_medicao) * 1.0 / COUNT(DISTINCT eta.id_eta), 0) as "Medições/ETA"
+        FROM Regiao r
+        INNER JOIN Estado e ON r.id_regiao = e.id_regiao
+        INNER JOIN Municipio mun ON e.id_estado = mun.id_estado
+        INNER JOIN ETA eta ON mun.id_municipio = eta.id_municipio
+        INNER JOIN Medicao med ON eta.id_eta = med.id_eta
+        WHERE 1 = 1{filtros}
+        GROUP BY r.nome_regiao, e.uf
+        HAVING COUNT(med.id_medicao) > 0
+        ORDER BY COUNT(med.id_medicao) DESC
+        ''',
+        
+        'performance_instituicao': '''
+        SELECT 
+            i.nome_instituicao as "Instituição",
+            i.tipo_instituicao as "Tipo",
+            COUNT(DISTINCT eta.id_eta) as "ETAs",
+            COUNT(DISTINCT p.id_parametro) as "Parâmetros",
+            COUNT(med.id_medicao) as "Medições",
+            ROUND(COUNT(med.id_medicao) * 1.0 / COUNT(DISTINCT eta.id_eta), 0) as "Med/ETA"
+        FROM Instituicao i
+        INNER JOIN Escritorio_Regional er ON i.id_instituicao = er.id_instituicao
+        INNER JOIN ETA eta ON er.id_escritorio = eta.id_escritorio
+        INNER JOIN Medicao med ON eta.id_eta = med.id_eta
+        INNER JOIN Parametro p ON med.id_parametro = p.id_parametro
+        WHERE 1 = 1{filtros}
+        GROUP BY i.nome_instituicao, i.tipo_instituicao
+        HAVING COUNT(med.id_medicao) > 1000
+        ORDER BY COUNT(DISTINCT eta.id_eta) DESC
+        ''',
+        
+        # Passagem única sobre Medicao: o total por (tecnologia, parâmetro) vem de uma
+        # janela calculada antes do HAVING, equivalente ao antigo CTE total_analises
+        'analise_filtracao': '''
+        SELECT
+            tipo_filtracao AS "Tipo Filtração",
+            nome_parametro AS "Parâmetro",
+            nome_campo AS "Faixa de Valores",
+            analises AS "Análises",
+            etas AS "ETAs",
+            ROUND(analises * 100.0 / total_analises_parametro, 2) AS "Porcentagem"
+        FROM (
+            SELECT
+                eta.tipo_filtracao,
+                p.nome_parametro,
+                c.nome_campo,
+                SUM(med.valor_medido) AS analises,
+                COUNT(DISTINCT eta.id_eta) AS etas,
+                COUNT(med.id_medicao) AS medicoes,
+                SUM(SUM(med.valor_medido)) OVER (
+                    PARTITION BY eta.tipo_filtracao, p.nome_parametro
+                ) AS total_analises_parametro
+            FROM ETA eta
+            INNER JOIN Medicao med ON eta.id_eta = med.id_eta
+            INNER JOIN Parametro p ON med.id_parametro = p.id_parametro
+            INNER JOIN Campo c ON med.id_campo = c.id_campo
+            WHERE eta.tipo_filtracao IS NOT NULL AND (
+                (p.nome_parametro = 'Cloro Residual Livre (mg/L)' AND c.nome_campo IN (
+                    'Número de dados >= 2,0 mg/L e <= 5,0mg/L',
+                    'Número de dados < 0,2 mg/L',
+                    'Número de dados > 5,0 mg/L'
+                ))
+                OR
+                (p.nome_parametro = 'Cor (uH)' AND c.nome_campo IN (
+                    'Número de dados <= 15,0 uH',
+                    'Número de dados > 15,0 uH'
+                ))
+                OR
+                (p.nome_parametro = 'pH' AND c.nome_campo IN (
+                    'Número de dados >= 6,0 e <= 9,0',
+                    'Número de dados < 6,0',
+                    'Número de dados > 9,0'
+                ))
+            ){filtros}
+            GROUP BY eta.tipo_filtracao, p.nome_parametro, c.nome_campo
+        )
+        WHERE medicoes >= 10
+        ORDER BY tipo_filtracao, nome_parametro, nome_campo DESC
+        ''',
+        
+        'ranking_estados': '''
+        SELECT 
+            e.nome_estado as "Estado",
+            COUNT(DISTINCT eta.id_eta) as "ETAs",
+            COUNT(DISTINCT p.id_parametro) as "Parâmetros",
+            COUNT(med.id_medicao) as "Medições"
+        FROM Estado e
+        INNER JOIN Municipio mun ON e.id_estado = mun.id_estado
+        INNER JOIN ETA eta ON mun.id_municipio = eta.id_municipio
+        INNER JOIN Medicao med ON eta.id_eta = med.id_eta
+        INNER JOIN Parametro p ON med.id_parametro = p.id_parametro
+        WHERE 1 = 1{filtros}
+        GROUP BY e.nome_estado
+        HAVING COUNT(DISTINCT eta.id_eta) >= 5
+        ORDER BY COUNT(DISTINCT p.id_parametro) DESC, COUNT(med.id_medicao) DESC
+        ''',
+        
+        # NOVA CONSULTA 4.1: Evolução temporal
+        'evolucao_temporal': '''
+        SELECT 
+            r.nome_regiao as "Região",
+            med.mes_referencia as "Mês",
+            COUNT(med.id_medicao) as "Total de Registros",
+            COUNT(DISTINCT eta.id_eta) as "ETAs Ativas",
+            COUNT(DISTINCT p.id_parametro) as "Parâmetros Distintos",
+            ROUND(COUNT(med.id_medicao) * 1.0 / COUNT(DISTINCT eta.id_eta), 1) as "Intensidade (Reg/ETA)",
+            ROUND(COUNT(DISTINCT p.id_parametro) * 1.0 / COUNT(DISTINCT eta.id_eta), 2) as "Diversidade (Par/ETA)",
+            CASE 
+                WHEN med.mes_referencia <= 2 THEN 'Início do Ano'
+                WHEN med.mes_referencia <= 4 THEN 'Meio do Ano'
+                ELSE 'Segundo Semestre'
+            END as "Período"
+        FROM Regiao r
+        INNER JOIN Estado e ON r.id_regiao = e.id_regiao
+        INNER JOIN Municipio mun ON e.id_estado = mun.id_estado
+        INNER JOIN ETA eta ON mun.id_municipio = eta.id_municipio
+        INNER JOIN Medicao med ON eta.id_eta = med.id_eta
+        INNER JOIN Parametro p ON med.id_parametro = p.id_parametro
+        WHERE 1 = 1{filtros}
+        GROUP BY r.nome_regiao, med.mes_referencia
+        HAVING COUNT(med.id_medicao) >= 100
+        ORDER BY r.nome_regiao, med.mes_referencia
+        ''',
+        
+        'metricas_gerais': '''
+        SELECT 
+            'Estados Monitorados' as tipo, COUNT(DISTINCT e.nome_estado) as valor 
+        FROM Estado e
+        INNER JOIN Municipio m ON e.id_estado = m.id_estado
+        INNER JOIN ETA eta ON m.id_municipio = eta.id_municipio
+        UNION ALL
+        SELECT 'ETAs Ativas', COUNT(*) FROM ETA
+        UNION ALL  
+        SELECT 'Total de Medições', COUNT(*) FROM Medicao
+        UNION ALL
+        SELECT 'Parâmetros Monitorados', COUNT(*) FROM Parametro
+        UNION ALL
+        SELECT 'Municípios Atendidos', COUNT(DISTINCT m.id_municipio) 
+        FROM Municipio m 
+        INNER JOIN ETA eta ON m.id_municipio = eta.id_municipio
+        '''
+    }
+
+# Predicados dos filtros da barra lateral sobre a tabela Medicao (alias med).
+# Os valores são sempre passados como parâmetros nomeados, nunca interpolados.
+FILTROS = {
+    'ano': 'med.ano_referencia = :ano',
+    'mes_inicio': 'med.mes_referencia >= :mes_inicio',
+    'mes_fim': 'med.mes_referencia <= :mes_fim',
+    'regiao': '''med.id_eta IN (
+            SELECT eta_f.id_eta FROM ETA eta_f
+            INNER JOIN Municipio mun_f ON mun_f.id_municipio = eta_f.id_municipio
+            INNER JOIN Estado e_f ON e_f.id_estado = mun_f.id_estado
+            INNER JOIN Regiao r_f ON r_f.id_regiao = e_f.id_regiao
+            WHERE r_f.nome_regiao = :regiao)''',
+    'uf': '''med.id_eta IN (
+            SELECT eta_f.id_eta FROM ETA eta_f
+            INNER JOIN Municipio mun_f ON mun_f.id_municipio = eta_f.id_municipio
+            INNER JOIN Estado e_f ON e_f.id_estado = mun_f.id_estado
+            WHERE e_f.uf = :uf)''',
+    'tecnologia': 'med.id_eta IN (SELECT id_eta FROM ETA WHERE tipo_filtracao = :tecnologia)',
+    'parametro': 'med.id_parametro IN (SELECT id_parametro FROM Parametro WHERE nome_parametro = :parametro)',
+}
+
+# Filtros aplicados quando o chamador não informa outro valor
+FILTROS_PADRAO = {
+    'evolucao_temporal': {'ano': 2025},
+}
+
+# Listas de opções dos filtros da barra lateral
+CONSULTAS_OPCOES = {
+    'anos': 'SELECT DISTINCT ano_referencia FROM Medicao ORDER BY ano_referencia DESC',
+    'regioes': 'SELECT nome_regiao FROM Regiao ORDER BY nome_regiao',
+    'ufs': '''
+        SELECT e.uf FROM Estado e
+        INNER JOIN Regiao r ON r.id_regiao = e.id_regiao
+        WHERE :regiao IS NULL OR r.nome_regiao = :regiao
+        ORDER BY e.uf
+        ''',
+    'tecnologias': '''
+        SELECT DISTINCT tipo_filtracao FROM ETA
+        WHERE tipo_filtracao IS NOT NULL AND tipo_filtracao != ''
+        ORDER BY tipo_filtracao
+        ''',
+    'parametros': '''
+        SELECT nome_parametro FROM Parametro
+        WHERE nome_parametro IS NOT NULL AND nome_parametro != ''
+        ORDER BY nome_parametro
+        ''',
+}
+
+
+def filtros_aceitos(nome):
+    """Filtros da barra lateral que a consulta aplica (nenhum, sem o marcador {filtros})."""
+    return set(FILTROS) if '{filtros}' in get_consultas()[nome] else set()
+
+
+def filtros_ignorados(nome, filtros=None):
+    """Filtros informados (não None) que a consulta não aplica, em ordem alfabética."""
+    aceitos = filtros_aceitos(nome)
+    return sorted(chave for chave, valor in (filtros or {}).items() if valor is not None and chave not in aceitos)
+
+
+def filtros_ativos(nome, filtros=None, template=None):
+    """Filtros efetivos de uma consulta: padrões + valores informados (None = sem filtro)."""
+    template = template if template is not None else get_consultas()[nome]
+    if '{filtros}' not in template:
+        return {}
+    ativos = dict(FILTROS_PADRAO.get(nome, {}))
+    ativos.update({chave: valor for chave, valor in (filtros or {}).items() if valor is not None})
+    return ativos
+
+
+def renderizar(template, predicados, filtros):
+    clausula = ''.join(f' AND {predicados[chave]}' for chave in sorted(filtros))
+    return template.replace('{filtros}', clausula)
+
+
+def montar_consulta(nome, filtros=None):
+    """Retorna (sql, parâmetros) da consulta de get_consultas() com os filtros aplicados."""
+    template = get_consultas()[nome]
+    ativos = filtros_ativos(nome, filtros, template)
+    return renderizar(template, FILTROS, ativos), ativos
@@ -0,0 +1,242 @@
+import argparse
+import sqlite3
+import time
+
+import pandas as pd
+
+import agregados
+import particoes
+from agregados import FILTROS_ROLLUP
+from consultas import filtros_ativos, renderizar
+
+# Cubo hierárquico Região → UF → Município → ETA, derivado do rollup_medicao.
+# Cada nó guarda, por ano, as medições e as contagens distintas de ETAs,
+# municípios e parâmetros abaixo dele; ano 0 é o total de todos os anos (as
+# contagens distintas não se somam entre anos). id_pai 0 é a raiz (Brasil).
+# Só entram medições com a cadeia ETA → Município → Estado → Região completa,
+# de modo que os filhos de um nó sempre somam as medições dele.
+ESQUEMA = '''
+CREATE TABLE IF NOT EXISTS cubo_hierarquia (
+    nivel TEXT,
+    id_pai INTEGER,
+    id_no INTEGER,
+    ano_referencia INTEGER,
+    total_medicoes INTEGER,
+    etas INTEGER,
+    municipios INTEGER,
+    parametros INTEGER,
+    PRIMARY KEY (nivel, ano_referencia, id_pai, id_no)
+);
+CREATE TABLE IF NOT EXISTS cubo_anos (
+    ano_referencia INTEGER PRIMARY KEY,
+    linhas INTEGER,
+    total_medicoes INTEGER
+);
+'''
+
+# nível: (coluna do nó no rollup, coluna do pai, tabela, nome exibido)
+NIVEIS = {
+    'regiao': ('id_regiao', None, 'Regiao', 'd.nome_regiao'),
+    'uf': ('id_estado', 'id_regiao', 'Estado', "d.nome_estado || ' (' || d.uf || ')'"),
+    'municipio': ('id_municipio', 'id_estado', 'Municipio', 'd.nome_municipio'),
+    'eta': ('id_eta', 'id_municipio', 'ETA', "IFNULL(d.nome_eta, 'ETA ' || d.id_eta)"),
+}
+ROTULOS = {'regiao': 'Regiões', 'uf': 'Estados', 'municipio': 'Municípios', 'eta': 'ETAs'}
+
+# O cubo é chaveado só por ano; os demais filtros são respondidos pelo rollup
+FILTROS_SUPORTADOS = {'ano'}
+
+SQL_NIVEL = '''
+INSERT INTO cubo_hierarquia
+SELECT
+    :nivel,
+    {pai},
+    {no},
+    {ano},
+    SUM(total_medicoes),
+    COUNT(DISTINCT id_eta),
+    COUNT(DISTINCT id_municipio),
+    COUNT(DISTINCT id_parametro)
+FROM rollup_medicao
+WHERE id_regiao IS NOT NULL AND ano_referencia IS NOT NULL{periodo}
+GROUP BY {no}{grupo_ano}
+'''
+
+SQL_FILHOS_CUBO = '''
+SELECT
+    c.id_no AS id,
+    {nome} AS "Nome",
+    c.total_medicoes AS "Medições",
+    c.etas AS "ETAs",
+    c.municipios AS "Municípios",
+    c.parametros AS "Parâmetros"
+FROM cubo_hierarquia c
+INNER JOIN {tabela} d ON d.{coluna} = c.id_no
+WHERE c.nivel = :nivel AND c.ano_referencia = :ano_cubo AND c.id_pai = :pai
+ORDER BY c.total_medicoes DESC
+'''
+
+SQL_FILHOS_ROLLUP = '''
+SELECT
+    ru.{coluna} AS id,
+    {nome} AS "Nome",
+    SUM(ru.total_medicoes) AS "Medições",
+    COUNT(DISTINCT ru.id_eta) AS "ETAs",
+    COUNT(DISTINCT ru.id_municipio) AS "Municípios",
+    COUNT(DISTINCT ru.id_parametro) AS "Parâmetros"
+FROM rollup_medicao ru
+INNER JOIN {tabela} d ON d.{coluna} = ru.{coluna}
+WHERE ru.id_regiao IS NOT NULL{pai}{{filtros}}
+GROUP BY ru.{coluna}
+ORDER BY SUM(ru.total_medicoes) DESC
+'''
+
+# Caminho (nível, id, nome) até uma região ou UF clicada num gráfico do painel
+SQL_CAMINHO = {
+    'regiao': '''
+        SELECT 'regiao' AS nivel, id_regiao AS id, nome_regiao AS nome
+        FROM Regiao WHERE nome_regiao = :valor
+        ''',
+    'uf': '''
+        SELECT nivel, id, nome FROM (
+            SELECT 1 AS ordem, 'regiao' AS nivel, r.id_regiao AS id, r.nome_regiao AS nome
+            FROM Estado e INNER JOIN Regiao r ON r.id_regiao = e.id_regiao WHERE e.uf = :valor
+            UNION ALL
+            SELECT 2, 'uf', e.id_estado, e.nome_estado || ' (' || e.uf || ')'
+            FROM Estado e WHERE e.uf = :valor
+        ) ORDER BY ordem
+        ''',
+}
+
+
+def filho(nivel):
+    """Nível abaixo de `nivel` (None: raiz), ou None abaixo das ETAs."""
+    niveis = list(NIVEIS)
+    if nivel is None:
+        return niveis[0]
+    indice = niveis.index(nivel) + 1
+    return niveis[indice] if indice < len(niveis) else None
+
+
+def _construir(conn, ano=None):
+    """Nós de todos os níveis de um ano, ou do total de todos os anos (ano=None)."""
+    conn.execute('DELETE FROM cubo_hierarquia WHERE ano_referencia = ?', (ano or 0,))
+    for nivel, (no, pai, _, _) in NIVEIS.items():
+        conn.execute(
+            SQL_NIVEL.format(
+                no=no,
+                pai=f'MAX({pai})' if pai else '0',
+                ano='ano_referencia' if ano else '0',
+                periodo=' AND ano_referencia = :ano' if ano else '',
+                grupo_ano=', ano_referencia' if ano else '',
+            ),
+            {'nivel': nivel, 'ano': ano},
+        )
+
+
+def atualizar_cubo(conn):
+    """Mantém o cubo em sincronia com rollup_medicao.
+
+    Só os anos cujo número de linhas ou total de medições mudou no rollup são
+    refeitos, além do total de todos os anos. Retorna a lista de anos refeitos.
+    """
+    conn.executescript(ESQUEMA)
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        controle_rollup = agregados.assinatura_controle(conn)
+        if controle_rollup is not None and controle_rollup == agregados.assinatura_controle(conn, 'cubo_controle'):
+            conn.rollback()
+            return []
+        atuais = agregados.totais_rollup(conn, 'ano_referencia')
+        gravados = {ano: (linhas, total) for ano, linhas, total in conn.execute('SELECT * FROM cubo_anos')}
+        refazer = sorted(ano for ano, estado in atuais.items() if gravados.get(ano) != estado)
+        for ano in refazer:
+            _construir(conn, ano)
+        for ano in set(gravados) - set(atuais):
+            conn.execute('DELETE FROM cubo_hierarquia WHERE ano_referencia = ?', (ano,))
+        if refazer or set(gravados) != set(atuais):
+            _construir(conn)
+        conn.execute('DELETE FROM cubo_anos')
+        conn.executemany('INSERT INTO cubo_anos VALUES (?, ?, ?)',
+                         [(ano, linhas, total) for ano, (linhas, total) in atuais.items()])
+        agregados.copiar_controle(conn, 'cubo_controle')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return refazer
+
+
+def garantir_cubo(conn):
+    """Atualiza o cubo; False se não pôde ser construído (ex.: banco somente leitura)."""
+    try:
+        atualizar_cubo(conn)
+        return True
+    except sqlite3.Error:
+        return False
+
+
+def suporta(filtros=None):
+    """Os filtros ativos podem ser respondidos pelo cubo (só o ano)?"""
+    return {chave for chave, valor in (filtros or {}).items() if valor is not None} <= FILTROS_SUPORTADOS
+
+
+def montar_filhos(nivel, id_pai=0, filtros=None, usar_cubo=True):
+    """(sql, parâmetros) dos nós de `nivel` abaixo de `id_pai`, com as colunas
+    id, Nome, Medições, ETAs, Municípios e Parâmetros.
+
+    Sem o cubo (ou com filtros que ele não suporta), agrega só a parte do
+    rollup abaixo do pai.
+    """
+    coluna, coluna_pai, tabela, nome = NIVEIS[nivel]
+    if usar_cubo and suporta(filtros):
+        params = {'nivel': nivel, 'pai': int(id_pai), 'ano_cubo': int((filtros or {}).get('ano') or 0)}
+        return SQL_FILHOS_CUBO.format(nome=nome, tabela=tabela, coluna=coluna), params
+    pai = f' AND ru.{coluna_pai} = :pai' if coluna_pai else ''
+    template = SQL_FILHOS_ROLLUP.format(coluna=coluna, nome=nome, tabela=tabela, pai=pai)
+    ativos = filtros_ativos(None, filtros, template)
+    params = {**ativos, 'pai': int(id_pai)} if coluna_pai else ativos
+    return renderizar(template, FILTROS_ROLLUP, ativos), params
+
+
+def montar_caminho(nivel, valor):
+    """(sql, parâmetros) do caminho (nivel, id, nome) da raiz até a região ou UF `valor`."""
+    return SQL_CAMINHO[nivel], {'valor': valor}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Atualiza o cubo hierárquico Região → UF → Município → ETA')
+    parser.add_argument('banco', nargs='?', default='sisagua.db')
+    parser.add_argument('--ano', type=int, help='ano usado na conferência com o rollup')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.banco)
+    particoes.anexar(conn, args.banco)
+    inicio = time.perf_counter()
+    try:
+        refeitos = atualizar_cubo(conn)
+    except sqlite3.OperationalError as e:
+        raise SystemExit(f'Erro: {e} (construa os rollups antes: python agregados.py)')
+    print(f'Cubo atualizado em {time.perf_counter() - inicio:.2f}s; anos refeitos: {refeitos or "nenhum"}.')
+
+    # Conferência: os filhos de cada nível pelo cubo e pelo rollup
+    filtros = {'ano': args.ano}
+    fila = [('regiao', 0)]
+    while fila:
+        nivel, id_pai = fila.pop(0)
+        inicio = time.perf_counter()
+        sql, params = montar_filhos(nivel, id_pai, filtros)
+        pelo_cubo = pd.read_sql_query(sql, conn, params=params)
+        tempo_cubo = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        sql, params = montar_filhos(nivel, id_pai, filtros, usar_cubo=False)
+        pelo_rollup = pd.read_sql_query(sql, conn, params=params)
+        tempo_rollup = time.perf_counter() - inicio
+        iguais = pelo_cubo.sort_values('id').reset_index(drop=True).equals(
+            pelo_rollup.sort_values('id').reset_index(drop=True))
+        print(f'{ROTULOS[nivel]:<11} abaixo de {id_pai:>6}: {len(pelo_cubo):>5} nós, '
+              f'cubo {tempo_cubo * 1000:7.1f} ms, rollup {tempo_rollup * 1000:7.1f} ms'
+              f'{"" if iguais else "  DIVERGENTE"}')
+        if filho(nivel) and not pelo_cubo.empty:
+            # Desce pelo maior nó de cada nível
+            fila.append((filho(nivel), int(pelo_cubo['id'].iloc[0])))
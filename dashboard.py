@@ -3,8 +3,33 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
+import functools
+import os
 import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 import numpy as np
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+import agregados
+import api
+import aquecimento
+import cache_resultados
+import colunar
+import conexoes
+import cubo
+import esbocos
+import graficos
+import indices
+import instrumentacao
+import lote
+import motores
+import particoes
+import posagregacoes
+import tabelas
+import tipos
+from consultas import CONSULTAS_OPCOES, filtros_ignorados, montar_consulta
 
 # Configuração da página
 st.set_page_config(
@@ -57,288 +82,573 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Conectar ao banco de dados
+# Arquivo do banco (SISAGUA_BANCO permite apontar para outro, ex.: um banco sintético)
+BANCO = os.environ.get('SISAGUA_BANCO', 'sisagua.db')
+
+# Conexão de manutenção (escrita): usada apenas para rollups, índices e WAL
 @st.cache_resource
 def init_connection():
     try:
-        return sqlite3.connect('sisagua.db', check_same_thread=False)
+        conn = sqlite3.connect(BANCO, check_same_thread=False)
+        conexoes.ativar_wal(conn)
+        return conn
     except Exception as e:
         st.error(f"Erro ao conectar com o banco: {e}")
         st.stop()
 
 conn = init_connection()
 
+# Pool de conexões somente leitura para as consultas das sessões
+@st.cache_resource
+def get_pool():
+    tamanho = int(os.environ.get('SISAGUA_POOL', 0)) or None
+    return conexoes.PoolConexoes(BANCO, tamanho)
+
+# Threads em que as consultas das sessões rodam enquanto o script espera por
+# elas (ver _aguardar); quem limita as consultas simultâneas é o pool
+@st.cache_resource
+def get_executor():
+    return ThreadPoolExecutor(max_workers=max(32, get_pool().tamanho), thread_name_prefix='sisagua')
+
+# Verificação dos planos de consulta na inicialização.
+# Com SISAGUA_CRIAR_INDICES=1 os índices que faltam são criados automaticamente.
+@st.cache_resource
+def verificar_indices():
+    criar = os.environ.get('SISAGUA_CRIAR_INDICES') == '1'
+    return indices.verificar_indices(conn, criar=criar)
+
+relatorio_indices = verificar_indices()
+
+# Rollups pré-computados; a verificação de defasagem é refeita a cada 10 minutos.
+# A conexão de manutenção lê a Medicao inteira pela view das partições anuais,
+# anexada depois da verificação de índices (que olha a tabela do banco principal).
+@st.cache_resource(ttl=600)
+def preparar_agregados():
+    particoes.anexar(conn, BANCO)
+    return agregados.garantir_rollups(conn)
+
+# Esboços HyperLogLog por (UF, mês) do modo aproximado, construídos na primeira
+# vez que o modo é ligado e atualizados junto com os rollups
+@st.cache_resource(ttl=600)
+def preparar_esbocos():
+    return preparar_agregados() and esbocos.garantir_esbocos(conn)
+
+# Cubo Região → UF → Município → ETA do detalhamento, derivado dos rollups e
+# atualizado junto com eles (só os anos que mudaram são refeitos)
+@st.cache_resource(ttl=600)
+def preparar_cubo():
+    return preparar_agregados() and cubo.garantir_cubo(conn)
+
+# Histórico de latência das consultas, compartilhado por todas as sessões
+@st.cache_resource
+def get_registro_consultas():
+    return instrumentacao.RegistroConsultas()
+
+# Indica, por thread, se a última chamada de fato executou a consulta (cache
+# miss). Fica num cache_resource para ser o mesmo objeto em todas as reexecuções
+# do script; se a thread é a de aquecimento vem de aquecimento.em_segundo_plano().
+@st.cache_resource
+def _estado_threads():
+    return threading.local()
+
+_execucao = _estado_threads()
+
+# Orçamento de tempo de cada consulta da sessão, em segundos (0 desliga). A
+# thread de aquecimento tem um prazo maior, mas também limitado, para que uma
+# consulta patológica não prenda uma conexão do pool indefinidamente.
+ORCAMENTO_S = float(os.environ.get('SISAGUA_ORCAMENTO_S', 15))
+ORCAMENTO_FUNDO_S = float(os.environ.get('SISAGUA_ORCAMENTO_FUNDO_S', 120))
+
+# Último resultado de cada consulta, exibido como desatualizado quando ela é interrompida
+@st.cache_resource
+def get_resultados_anteriores():
+    return cache_resultados.ResultadosAnteriores()
+
+# Marca da execução corrente da sessão, trocada a cada execução completa do
+# script e quando uma execução é abandonada no meio (a sessão pediu outra ou foi
+# encerrada, ver _aguardar). Cada consulta guarda a marca de quando começou e é
+# abandonada assim que ela muda. Reexecuções de fragmentos não trocam a marca:
+# só contam se interromperem a execução em andamento.
+CHAVE_EXECUCAO = '_execucao_sessao'
+
+def _nova_execucao():
+    st.session_state[CHAVE_EXECUCAO] = st.session_state.get(CHAVE_EXECUCAO, 0) + 1
+
+_nova_execucao()
+
+def _orcamento():
+    if aquecimento.em_segundo_plano():
+        return conexoes.orcamento(ORCAMENTO_FUNDO_S)
+    marca = conexoes.cancelada_por_marca(lambda: st.session_state.get(CHAVE_EXECUCAO))
+    return conexoes.orcamento(ORCAMENTO_S, marca)
+
+# Intervalo entre os pontos de interrupção enquanto o script espera consultas
+INTERVALO_INTERRUPCAO = 0.2
+
+# Espera as consultas que rodam no executor passando por pontos de interrupção
+# do Streamlit (cada chamada st.* é um): se a sessão pediu outra execução ou foi
+# encerrada, o script sai daqui e troca a marca da execução, o que abandona as
+# consultas dela e devolve as conexões ao pool.
+def _aguardar(futuros):
+    marcador = None
+    try:
+        while wait(futuros, timeout=INTERVALO_INTERRUPCAO).not_done:
+            marcador = marcador or st.empty()
+            marcador.empty()
+    except BaseException:
+        _nova_execucao()
+        raise
+    return [futuro.result() for futuro in futuros]
+
+# executar(*args) sob o orçamento da sessão, numa thread do executor
+def _executar_orcado(executar, *args):
+    orcamento = _orcamento()
+    
+    def tarefa():
+        _execucao.miss = False
+        with orcamento:
+            return executar(*args), _execucao.miss
+    
+    try:
+        [(resultado, miss)] = em_paralelo(tarefa)
+    except conexoes.ConsultaInterrompida:
+        # Interrompida no meio da execução: não veio do cache
+        _execucao.miss = True
+        raise
+    _execucao.miss = miss
+    return resultado
+
+# Backend das consultas: 'sqlite' (padrão), 'duckdb' (motor analítico sobre o
+# mesmo banco), 'parquet' (snapshot colunar) ou 'processos' (consultas e
+# pós-agregações em processos trabalhadores, SISAGUA_PROCESSOS por servidor)
+BACKEND = os.environ.get('SISAGUA_BACKEND', 'sqlite')
+
+# Os trabalhadores vivem enquanto o servidor estiver no ar (não são recriados
+# junto com o motor)
+@st.cache_resource
+def get_processos():
+    return motores.MotorProcessos(BANCO, int(os.environ.get('SISAGUA_PROCESSOS', 0)) or None)
+
+# Motor que executa o SQL; o DuckDB é recarregado junto com os rollups e, se
+# não estiver instalado, o painel continua no SQLite
+@st.cache_resource(ttl=600)
+def get_motor():
+    sqlite = motores.MotorSQLite(get_pool())
+    if BACKEND not in ('duckdb', 'processos'):
+        return sqlite
+    preparar_agregados()
+    preparar_cubo()
+    if BACKEND == 'processos':
+        return get_processos()
+    try:
+        return motores.MotorDuckDB(BANCO, reserva=sqlite)
+    except Exception as e:
+        st.warning(f"DuckDB indisponível, usando SQLite: {e}")
+        return sqlite
+
+# Cache de resultados em disco, compartilhado entre processos e reinícios
+@st.cache_resource
+def get_cache_disco():
+    diretorio = os.environ.get('SISAGUA_CACHE_DIR', cache_resultados.DIRETORIO_PADRAO)
+    limite_mb = int(os.environ.get('SISAGUA_CACHE_MB', cache_resultados.LIMITE_MB))
+    return cache_resultados.CacheResultados(diretorio, limite_mb * 1024 ** 2)
+
+# Memória dos resultados antes e depois da conversão para tipos compactos
+@st.cache_resource
+def get_economia_memoria():
+    return tipos.EconomiaMemoria()
+
+def _compactar(df):
+    antes = tipos.memoria(df)
+    df = tipos.compactar(df)
+    get_economia_memoria().registrar(antes, tipos.memoria(df))
+    return df
+
+def _chave_params(params):
+    return tuple(sorted((params or {}).items()))
+
+# O cache em memória fica na frente do cache em disco; ambos são chaveados pelo
+# texto da consulta, pelos parâmetros vinculados e pela versão dos dados
+@st.cache_data(max_entries=500)
+def _executar_consulta(query, params=None, impressao=None, pos=None):
+    chave = ('consulta', query, _chave_params(params)) + ((pos,) if pos else ())
+    df = get_cache_disco().obter(chave, impressao)
+    if df is None:
+        _execucao.miss = True
+        df = _compactar(get_motor().executar(query, params, pos=pos))
+        get_cache_disco().guardar(chave, impressao, df)
+    return df
+
+# Snapshot Parquet, reexportado quando as tabelas de origem mudam; conferido a
+# cada nova versão dos dados
+@st.cache_resource(max_entries=1)
+def get_snapshot(impressao=None):
+    particoes.anexar(conn, BANCO)
+    if colunar.snapshot_desatualizado(conn):
+        colunar.exportar_snapshot(conn)
+    return colunar.SnapshotColunar()
+
+# Mesmo esquema de chaves do _executar_consulta: em memória na frente do cache
+# em disco, ambos pela versão dos dados
+@st.cache_data(max_entries=500)
+def _executar_snapshot(nome, filtros, impressao=None):
+    chave = ('snapshot', nome, _chave_params(filtros))
+    df = get_cache_disco().obter(chave, impressao)
+    if df is None:
+        _execucao.miss = True
+        df = _compactar(get_snapshot(impressao).executar(nome, filtros))
+        get_cache_disco().guardar(chave, impressao, df)
+    return df
+
+# Execuções da thread de aquecimento não entram no histórico de latência e
+# propagam os erros para o próprio aquecedor
+def _registrar(nome, segundos, df, interrompida=False):
+    if aquecimento.em_segundo_plano():
+        return
+    get_registro_consultas().registrar(
+        consulta=nome,
+        segundos=segundos,
+        cache_hit=not _execucao.miss,
+        linhas=len(df),
+        memoria_bytes=df.memory_usage(deep=True).sum(),
+        interrompida=interrompida,
+    )
+
+def _guardar_anteriores(resultados):
+    impressao = cache_resultados.impressao_digital(BANCO)
+    for chave, df in resultados.items():
+        get_resultados_anteriores().guardar(chave, impressao, df)
+
+# Resultados anteriores das chaves (DataFrame vazio onde não houver), com um
+# único aviso de desatualizado para o bloco
+def _usar_anteriores(rotulo, chaves, erro):
+    entradas = [get_resultados_anteriores().obter(chave) for chave in chaves]
+    resultados = [entrada['df'] if entrada else pd.DataFrame() for entrada in entradas]
+    if erro.motivo == 'cancelada':
+        # A sessão já vai ser reexecutada; não há o que avisar
+        return resultados
+    continua = " Ela continua em segundo plano; recarregue em instantes." if PREFETCH else ""
+    disponiveis = [entrada for entrada in entradas if entrada]
+    if not disponiveis:
+        st.warning(f"⏱️ {rotulo}: a consulta passou do limite de {ORCAMENTO_S:g}s e ainda não há "
+                   f"resultado anterior para exibir.{continua}")
+        return resultados
+    instante = min(entrada['instante'] for entrada in disponiveis)
+    versao = ("de uma versão anterior dos dados"
+              if any(entrada['impressao'] != cache_resultados.impressao_digital(BANCO) for entrada in disponiveis)
+              else "dos dados atuais")
+    st.badge("Desatualizado", icon="⏳", color="orange")
+    st.caption(f"{rotulo}: a consulta passou do limite de {ORCAMENTO_S:g}s; exibindo o resultado de "
+               f"{instante:%d/%m %H:%M:%S} ({versao}).{continua}")
+    return resultados
+
+# Consultas que estouraram o orçamento da sessão são refeitas pela thread de
+# aquecimento, com prazo maior; a próxima execução da página as encontra no
+# cache em disco. A thread chama a função por baixo do st.cache_data: passar
+# pelo cache seguraria a trava por chave do Streamlit durante todo o prazo e
+# bloquearia a próxima execução da sessão com os mesmos argumentos.
+def _refazer_em_segundo_plano(chave, funcao):
+    if PREFETCH:
+        get_aquecedor().agendar(('orcamento', *chave), funcao)
+
+# Enquanto a consulta é refeita em segundo plano, a sessão exibe o resultado
+# anterior sem executá-la de novo
+def _refazendo(chave):
+    return PREFETCH and not aquecimento.em_segundo_plano() and get_aquecedor().pendente(('orcamento', *chave))
+
+def _sem_cache(funcao):
+    return getattr(funcao, '__wrapped__', funcao)
+
+def _instrumentar(nome, executar, *args, anterior=None):
+    _execucao.miss = False
+    inicio = time.perf_counter()
+    interrompida = False
+    chave_fundo = (nome, repr(args))
+    try:
+        if _refazendo(chave_fundo):
+            raise conexoes.ConsultaInterrompida('tempo', ORCAMENTO_S)
+        df = _executar_orcado(executar, *args)
+        if anterior is not None:
+            _guardar_anteriores({anterior: df})
+    except conexoes.ConsultaInterrompida as e:
+        if aquecimento.em_segundo_plano():
+            raise
+        interrompida = True
+        [df] = _usar_anteriores(nome, [anterior], e)
+        if e.motivo == 'tempo':
+            _refazer_em_segundo_plano(chave_fundo, functools.partial(
+                _instrumentar, nome, _sem_cache(executar), *args, anterior=anterior))
+    except Exception as e:
+        if aquecimento.em_segundo_plano():
+            raise
+        st.error(f"Erro na consulta: {e}")
+        df = pd.DataFrame()
+    _registrar(nome, time.perf_counter() - inicio, df, interrompida)
+    return df
+
+def run_query(query, params=None, nome='ad hoc', impressao=None, pos=None):
+    impressao = impressao or cache_resultados.impressao_digital(BANCO)
+    return _instrumentar(nome, _executar_consulta, query, params, impressao, pos,
+                         anterior=('consulta', query, _chave_params(params)) + ((pos,) if pos else ()))
+
+@st.cache_data(max_entries=100)
+def _executar_aproximado(nome, filtros, impressao=None):
+    _execucao.miss = True
+    with get_pool().conexao() as conexao:
+        return _compactar(esbocos.consultar(conexao, nome, filtros))
+
+# Contagens distintas respondidas pelos esboços quando o modo aproximado está
+# ligado e os filtros ativos são só de período, região ou UF
+def usa_esbocos(nome, filtros):
+    return bool(filtros.get('aproximado')) and esbocos.suporta(nome, _sem_modo(filtros)) and preparar_esbocos()
+
+def _sem_modo(filtros):
+    return {chave: valor for chave, valor in filtros.items() if chave != 'aproximado'}
+
+# Partições anuais da Medicao: ({ano: arquivo}, anos fechados, {ano fechado: versão})
 @st.cache_data
-def run_query(query):
+def get_particoes(impressao=None):
+    with get_pool().conexao() as conexao:
+        registradas = particoes.particoes(conexao)
+        fechados = particoes.anos_fechados(conexao)
+        versoes = {ano: particoes.impressao_fechada(conexao, BANCO, ano) for ano in fechados}
+    return registradas, fechados, versoes
+
+# Executa uma consulta de get_consultas() com os filtros aplicados no próprio SQL,
+# respondendo a partir dos rollups sempre que possível
+def run_consulta(nome, **filtros):
+    if usa_esbocos(nome, filtros):
+        impressao = cache_resultados.impressao_digital(BANCO)
+        filtros = _sem_modo(filtros)
+        return _instrumentar(f'{nome} (aprox.)', _executar_aproximado, nome, filtros, impressao,
+                             anterior=('aproximado', nome, _chave_params(filtros)))
+    filtros = _sem_modo(filtros)
+    if BACKEND == 'parquet' and nome in colunar.CONSULTAS:
+        impressao = cache_resultados.impressao_digital(BANCO)
+        return _instrumentar(nome, _executar_snapshot, nome, filtros, impressao,
+                             anterior=('snapshot', nome, _chave_params(filtros)))
+    query, params, impressao = montar_sql(nome, filtros)
+    return run_query(query, params, nome=nome, impressao=impressao)
+
+# Resumo de posagregacoes.py sobre `df`, o resultado de run_consulta(nome, **filtros).
+# No backend 'processos' a consulta é refeita no trabalhador junto com o resumo
+# (e ambos ficam em cache), fora do processo do painel; nos demais, o resumo é
+# calculado aqui sobre o df já lido
+def run_pos(nome, pos, df, **filtros):
+    if BACKEND != 'processos' or usa_esbocos(nome, filtros):
+        return posagregacoes.aplicar(pos, df)
+    query, params, impressao = montar_sql(nome, _sem_modo(filtros))
+    return run_query(query, params, nome=f'{nome} ({pos})', impressao=impressao, pos=pos)
+
+# (sql, parâmetros, versão do resultado) de uma consulta de get_consultas(): sobre
+# os rollups sempre que possível e, filtrada por um ano fechado, lendo só a
+# partição dele, com a versão da partição (não muda com as cargas)
+def montar_sql(nome, filtros):
+    montada = agregados.montar_consulta(nome, filtros) if preparar_agregados() else None
+    query, params = montada or montar_consulta(nome, filtros)
+    impressao = cache_resultados.impressao_digital(BANCO)
+    registradas, fechados, versoes = get_particoes(impressao)
+    query = particoes.podar(query, params, fechados, registradas)
+    return query, params, particoes.versao(params, versoes, impressao)
+
+@st.cache_data(max_entries=100)
+def _executar_lote(nomes, filtros, impressao=None):
+    usar_rollup = preparar_agregados()
+    chaves = {nome: ('lote', nome, _chave_params(filtros), usar_rollup) for nome in nomes}
+    resultados = {nome: get_cache_disco().obter(chave, impressao) for nome, chave in chaves.items()}
+    if all(df is not None for df in resultados.values()):
+        return resultados, {}
+    _execucao.miss = True
+    registradas, fechados, _ = get_particoes(impressao)
+    with get_pool().conexao() as conexao:
+        resultados, tempos = lote.executar_lote(
+            conexao, list(nomes), filtros, usar_rollup=usar_rollup,
+            podar=lambda query, params: particoes.podar(query, params, fechados, registradas))
+    resultados = {nome: _compactar(df) for nome, df in resultados.items()}
+    for nome, chave in chaves.items():
+        get_cache_disco().guardar(chave, impressao, resultados[nome])
+    return resultados, tempos
+
+def _refazer_lote(nomes, filtros, impressao):
+    with _orcamento():
+        resultados, _ = _sem_cache(_executar_lote)(nomes, filtros, impressao)
+    _guardar_anteriores({('lote', nome, _chave_params(filtros)): df for nome, df in resultados.items()})
+
+# Executa chamadas independentes (ex.: as consultas da aba aberta) em paralelo,
+# cada uma numa conexão do pool, e retorna os resultados na ordem dada. Fora de
+# uma sessão (thread de aquecimento) ou já dentro do executor, roda em sequência.
+def em_paralelo(*chamadas):
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is None or getattr(_execucao, 'no_executor', False):
+        return [chamada() for chamada in chamadas]
+    
+    def tarefa(chamada):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        _execucao.no_executor = True
+        try:
+            return chamada()
+        finally:
+            _execucao.no_executor = False
+    
+    return _aguardar([get_executor().submit(tarefa, chamada) for chamada in chamadas])
+
+def run_consultas_paralelas(nomes, **filtros):
+    resultados = em_paralelo(*(functools.partial(run_consulta, nome, **filtros) for nome in nomes))
+    return dict(zip(nomes, resultados))
+
+# Executa as consultas de uma página numa única transação, compartilhando os
+# subplanos comuns; retorna {nome: DataFrame}
+def run_consultas(nomes, **filtros):
+    if BACKEND != 'sqlite' or any(usa_esbocos(nome, filtros) for nome in nomes):
+        return run_consultas_paralelas(nomes, **filtros)
+    filtros = _sem_modo(filtros)
+    anteriores = {nome: ('lote', nome, _chave_params(filtros)) for nome in nomes}
+    _execucao.miss = False
+    inicio = time.perf_counter()
+    interrompida = False
+    impressao = cache_resultados.impressao_digital(BANCO)
+    chave_fundo = ('lote', tuple(nomes), _chave_params(filtros), impressao)
     try:
-        return pd.read_sql_query(query, conn)
+        if _refazendo(chave_fundo):
+            raise conexoes.ConsultaInterrompida('tempo', ORCAMENTO_S)
+        resultados, tempos = _executar_orcado(_executar_lote, tuple(nomes), filtros, impressao)
+        _guardar_anteriores({anteriores[nome]: df for nome, df in resultados.items()})
+    except conexoes.ConsultaInterrompida as e:
+        if aquecimento.em_segundo_plano():
+            raise
+        interrompida = True
+        resultados = dict(zip(nomes, _usar_anteriores(', '.join(nomes), anteriores.values(), e)))
+        tempos = {}
+        if e.motivo == 'tempo':
+            _refazer_em_segundo_plano(chave_fundo, functools.partial(_refazer_lote, tuple(nomes), filtros, impressao))
     except Exception as e:
+        if aquecimento.em_segundo_plano():
+            raise
         st.error(f"Erro na consulta: {e}")
-        return pd.DataFrame()
-
-# Consultas SQL atualizadas
-def get_consultas():
-    return {
-        'etas_tecnologia': '''
-        SELECT 
-            tipo_filtracao as "Tecnologia de Tratamento",
-            COUNT(*) as "Qtd ETAs",
-            ROUND(COUNT(*) * 100.0 / (SELECT COUNT(*) FROM ETA), 2) as "Percentual"
-        FROM ETA 
-        WHERE tipo_filtracao IS NOT NULL AND tipo_filtracao != ''
-        GROUP BY tipo_filtracao
-        ORDER BY COUNT(*) DESC
-        ''',
-        
-        'parametros_qualidade': '''
-        SELECT 
-            nome_parametro as "Parâmetro de Qualidade",
-            unidade_medida as "Unidade",
-            CASE 
-                WHEN nome_parametro LIKE '%Turbidez%' THEN 'Aspecto Físico'
-                WHEN nome_parametro LIKE '%Cor%' THEN 'Aspecto Físico'
-                WHEN nome_parametro LIKE '%Cloro%' THEN 'Desinfecção'
-                WHEN nome_parametro LIKE '%pH%' THEN 'Equilíbrio Químico'
-                WHEN nome_parametro LIKE '%Fluoreto%' THEN 'Saúde Pública'
-                WHEN nome_parametro LIKE '%coli%' THEN 'Segurança Microbiológica'
-                WHEN nome_parametro LIKE '%Coliforme%' THEN 'Segurança Microbiológica'
-                ELSE 'Outros Indicadores'
-            END as "Finalidade do Monitoramento"
-        FROM Parametro 
-        WHERE nome_parametro IS NOT NULL AND nome_parametro != ''
-        ORDER BY 
-            CASE 
-                WHEN nome_parametro LIKE '%Turbidez%' THEN 1
-                WHEN nome_parametro LIKE '%Cloro%' THEN 2
-                WHEN nome_parametro LIKE '%pH%' THEN 3
-                WHEN nome_parametro LIKE '%coli%' THEN 4
-                ELSE 5
-            END,
-            nome_parametro
-        ''',
-        
-        'etas_estado': '''
-        SELECT 
-            e.uf as "UF",
-            e.nome_estado as "Estado",
-            COUNT(DISTINCT eta.id_eta) as "Total ETAs",
-            COUNT(DISTINCT mun.id_municipio) as "Municípios com ETA",
-            ROUND(1.0 * COUNT(DISTINCT eta.id_eta) / COUNT(DISTINCT mun.id_municipio), 2) as "ETAs por Município"
-        FROM Estado e
-        INNER JOIN Municipio mun ON e.id_estado = mun.id_estado
-        INNER JOIN ETA eta ON mun.id_municipio = eta.id_municipio
-        GROUP BY e.uf, e.nome_estado
-        HAVING COUNT(DISTINCT eta.id_eta) > 0
-        ORDER BY COUNT(DISTINCT eta.id_eta) DESC
-        ''',
-        
-        'medicoes_ponto': '''
-        SELECT 
-            pm.tipo_ponto as "Tipo",
-            pm.nome_ponto as "Ponto de Monitoramento",
-            COUNT(m.id_medicao) as "Total Medições",
-            ROUND(COUNT(m.id_medicao) * 100.0 / (SELECT COUNT(*) FROM Medicao), 2) as "% do Total"
-        FROM Ponto_Monitoramento pm
-        INNER JOIN Medicao m ON pm.id_ponto = m.id_ponto
-        GROUP BY pm.tipo_ponto, pm.nome_ponto
-        ORDER BY COUNT(m.id_medicao) DESC
-        ''',
-        
-        'parametros_categoria': '''
-        SELECT 
-            p.categoria_parametro as "Categoria",
-            p.nome_parametro as "Parâmetro",
-            COUNT(m.id_medicao) as "Total Medições",
-            ROUND(COUNT(m.id_medicao) * 100.0 / (SELECT COUNT(*) FROM Medicao), 2) as "% do Total"
-        FROM Parametro p
-        INNER JOIN Medicao m ON p.id_parametro = m.id_parametro
-        GROUP BY p.categoria_parametro, p.nome_parametro
-        ORDER BY p.categoria_parametro, COUNT(m.id_medicao) DESC
-        ''',
-        
-        'analise_geografica': '''
-        SELECT 
-            r.nome_regiao as "Região",
-            e.uf as "UF",
-            COUNT(DISTINCT mun.id_municipio) as "Municípios",
-            COUNT(DISTINCT eta.id_eta) as "ETAs Ativas",
-            COUNT(med.id_medicao) as "Total Medições",
-            ROUND(COUNT(med.id_medicao) * 1.0 / COUNT(DISTINCT eta.id_eta), 0) as "Medições/ETA"
-        FROM Regiao r
-        INNER JOIN Estado e ON r.id_regiao = e.id_regiao
-        INNER JOIN Municipio mun ON e.id_estado = mun.id_estado
-        INNER JOIN ETA eta ON mun.id_municipio = eta.id_municipio
-        INNER JOIN Medicao med ON eta.id_eta = med.id_eta
-        GROUP BY r.nome_regiao, e.uf
-        HAVING COUNT(med.id_medicao) > 0
-        ORDER BY COUNT(med.id_medicao) DESC
-        ''',
-        
-        'performance_instituicao': '''
-        SELECT 
-            i.nome_instituicao as "Instituição",
-            i.tipo_instituicao as "Tipo",
-            COUNT(DISTINCT eta.id_eta) as "ETAs",
-            COUNT(DISTINCT p.id_parametro) as "Parâmetros",
-            COUNT(med.id_medicao) as "Medições",
-            ROUND(COUNT(med.id_medicao) * 1.0 / COUNT(DISTINCT eta.id_eta), 0) as "Med/ETA"
-        FROM Instituicao i
-        INNER JOIN Escritorio_Regional er ON i.id_instituicao = er.id_instituicao
-        INNER JOIN ETA eta ON er.id_escritorio = eta.id_escritorio
-        INNER JOIN Medicao med ON eta.id_eta = med.id_eta
-        INNER JOIN Parametro p ON med.id_parametro = p.id_parametro
-        GROUP BY i.nome_instituicao, i.tipo_instituicao
-        HAVING COUNT(med.id_medicao) > 1000
-        ORDER BY COUNT(DISTINCT eta.id_eta) DESC
-        ''',
-        
-        'analise_filtracao': '''
-        WITH total_analises AS (
-            SELECT
-                eta.tipo_filtracao,
-                p.nome_parametro,
-                SUM(med.valor_medido) AS total_analises_parametro
-            FROM ETA eta
-            INNER JOIN Medicao med ON eta.id_eta = med.id_eta
-            INNER JOIN Parametro p ON med.id_parametro = p.id_parametro
-            INNER JOIN Campo c ON med.id_campo = c.id_campo
-            WHERE (
-                (p.nome_parametro = 'Cloro Residual Livre (mg/L)' AND c.nome_campo IN (
-                    'Número de dados >= 2,0 mg/L e <= 5,0mg/L',
-                    'Número de dados < 0,2 mg/L',
-                    'Número de dados > 5,0 mg/L'
-                ))
-                OR
-                (p.nome_parametro = 'Cor (uH)' AND c.nome_campo IN (
-                    'Número de dados <= 15,0 uH',
-                    'Número de dados > 15,0 uH'
-                ))
-                OR
-                (p.nome_parametro = 'pH' AND c.nome_campo IN (
-                    'Número de dados >= 6,0 e <= 9,0',
-                    'Número de dados < 6,0',
-                    'Número de dados > 9,0'
-                ))
-            )
-            GROUP BY eta.tipo_filtracao, p.nome_parametro
-        )
-        SELECT
-            eta.tipo_filtracao AS "Tipo Filtração",
-            p.nome_parametro AS "Parâmetro",
-            c.nome_campo AS "Faixa de Valores",
-            SUM(med.valor_medido) AS "Análises",
-            COUNT(DISTINCT eta.id_eta) AS "ETAs",
-            ROUND(SUM(med.valor_medido) * 100.0 / ta.total_analises_parametro, 2) AS "Porcentagem"
-        FROM ETA eta
-        INNER JOIN Medicao med ON eta.id_eta = med.id_eta
-        INNER JOIN Parametro p ON med.id_parametro = p.id_parametro
-        INNER JOIN Campo c ON med.id_campo = c.id_campo
-        INNER JOIN total_analises ta ON
-            ta.tipo_filtracao = eta.tipo_filtracao AND
-            ta.nome_parametro = p.nome_parametro
-        WHERE (
-            (p.nome_parametro = 'Cloro Residual Livre (mg/L)' AND c.nome_campo IN (
-                'Número de dados >= 2,0 mg/L e <= 5,0mg/L',
-                'Número de dados < 0,2 mg/L',
-                'Número de dados > 5,0 mg/L'
-            ))
-            OR
-            (p.nome_parametro = 'Cor (uH)' AND c.nome_campo IN (
-                'Número de dados <= 15,0 uH',
-                'Número de dados > 15,0 uH'
-            ))
-            OR
-            (p.nome_parametro = 'pH' AND c.nome_campo IN (
-                'Número de dados >= 6,0 e <= 9,0',
-                'Número de dados < 6,0',
-                'Número de dados > 9,0'
-            ))
-        )
-        GROUP BY eta.tipo_filtracao, p.nome_parametro, c.nome_campo, ta.total_analises_parametro
-        HAVING COUNT(med.id_medicao) >= 10
-        ORDER BY eta.tipo_filtracao, p.nome_parametro, c.nome_campo DESC
-        ''',
-        
-        'ranking_estados': '''
-        SELECT 
-            e.nome_estado as "Estado",
-            COUNT(DISTINCT eta.id_eta) as "ETAs",
-            COUNT(DISTINCT p.id_parametro) as "Parâmetros",
-            COUNT(med.id_medicao) as "Medições"
-        FROM Estado e
-        INNER JOIN Municipio mun ON e.id_estado = mun.id_estado
-        INNER JOIN ETA eta ON mun.id_municipio = eta.id_municipio
-        INNER JOIN Medicao med ON eta.id_eta = med.id_eta
-        INNER JOIN Parametro p ON med.id_parametro = p.id_parametro
-        GROUP BY e.nome_estado
-        HAVING COUNT(DISTINCT eta.id_eta) >= 5
-        ORDER BY COUNT(DISTINCT p.id_parametro) DESC, COUNT(med.id_medicao) DESC
-        ''',
-        
-        # NOVA CONSULTA 4.1: Evolução temporal
-        'evolucao_temporal': '''
-        SELECT 
-            r.nome_regiao as "Região",
-            med.mes_referencia as "Mês",
-            COUNT(med.id_medicao) as "Total de Registros",
-            COUNT(DISTINCT eta.id_eta) as "ETAs Ativas",
-            COUNT(DISTINCT p.id_parametro) as "Parâmetros Distintos",
-            ROUND(COUNT(med.id_medicao) * 1.0 / COUNT(DISTINCT eta.id_eta), 1) as "Intensidade (Reg/ETA)",
-            ROUND(COUNT(DISTINCT p.id_parametro) * 1.0 / COUNT(DISTINCT eta.id_eta), 2) as "Diversidade (Par/ETA)",
-            CASE 
-                WHEN med.mes_referencia <= 2 THEN 'Início do Ano'
-                WHEN med.mes_referencia <= 4 THEN 'Meio do Ano'
-                ELSE 'Segundo Semestre'
-            END as "Período"
-        FROM Regiao r
-        INNER JOIN Estado e ON r.id_regiao = e.id_regiao
-        INNER JOIN Municipio mun ON e.id_estado = mun.id_estado
-        INNER JOIN ETA eta ON mun.id_municipio = eta.id_municipio
-        INNER JOIN Medicao med ON eta.id_eta = med.id_eta
-        INNER JOIN Parametro p ON med.id_parametro = p.id_parametro
-        WHERE med.ano_referencia = 2025
-        GROUP BY r.nome_regiao, med.mes_referencia
-        HAVING COUNT(med.id_medicao) >= 100
-        ORDER BY r.nome_regiao, med.mes_referencia
-        ''',
-        
-        'metricas_gerais': '''
-        SELECT 
-            'Estados Monitorados' as tipo, COUNT(DISTINCT e.nome_estado) as valor 
-        FROM Estado e
-        INNER JOIN Municipio m ON e.id_estado = m.id_estado
-        INNER JOIN ETA eta ON m.id_municipio = eta.id_municipio
-        UNION ALL
-        SELECT 'ETAs Ativas', COUNT(*) FROM ETA
-        UNION ALL  
-        SELECT 'Total de Medições', COUNT(*) FROM Medicao
-        UNION ALL
-        SELECT 'Parâmetros Monitorados', COUNT(*) FROM Parametro
-        UNION ALL
-        SELECT 'Municípios Atendidos', COUNT(DISTINCT m.id_municipio) 
-        FROM Municipio m 
-        INNER JOIN ETA eta ON m.id_municipio = eta.id_municipio
-        '''
-    }
+        resultados, tempos = {nome: pd.DataFrame() for nome in nomes}, {}
+    decorrido = time.perf_counter() - inicio
+    for nome in nomes:
+        segundos = tempos.get(nome, 0.0) if _execucao.miss and not interrompida else decorrido / len(nomes)
+        _registrar(nome, segundos, resultados[nome], interrompida)
+    return resultados
+
+def carregar_opcoes(chave, params=None):
+    df = run_query(CONSULTAS_OPCOES[chave], params, nome=f'opcoes_{chave}')
+    return df.iloc[:, 0].tolist() if not df.empty else []
+
+# Consultas nomeadas de cada página: (consultas, executadas num único lote?)
+PAGINAS = {
+    "📊 Visão Geral": (['metricas_gerais', 'etas_estado', 'analise_geografica'], True),
+    "🏭 Infraestrutura": (['etas_tecnologia', 'parametros_qualidade'], False),
+    "🌍 Distribuição Territorial": (['etas_estado', 'medicoes_ponto', 'parametros_categoria'], False),
+    "🏢 Análise Institucional": (['analise_geografica', 'performance_instituicao', 'analise_filtracao'], False),
+    "📈 Indicadores de Qualidade": (['ranking_estados', 'analise_filtracao'], False),
+    "⏰ Evolução Temporal": (['evolucao_temporal'], False),
+}
+
+# Sem ano selecionado, a evolução mensal usa o ano mais recente disponível
+def ano_temporal(filtros):
+    if filtros.get('ano'):
+        return filtros['ano']
+    anos = carregar_opcoes('anos')
+    return anos[0] if anos else None
+
+def carregar_pagina(pagina, filtros):
+    nomes, em_lote = PAGINAS[pagina]
+    if pagina == "⏰ Evolução Temporal":
+        filtros = {**filtros, 'ano': ano_temporal(filtros)}
+    if em_lote:
+        return run_consultas(nomes, **filtros)
+    return run_consultas_paralelas(nomes, **filtros)
+
+def aquecer_tudo(filtros_padrao):
+    for chave in ('anos', 'regioes', 'tecnologias', 'parametros'):
+        carregar_opcoes(chave)
+    carregar_opcoes('ufs', {'regiao': None})
+    for pagina in PAGINAS:
+        carregar_pagina(pagina, filtros_padrao)
+
+# Aquecimento e pré-busca em segundo plano (desligue com SISAGUA_PREFETCH=0)
+PREFETCH = os.environ.get('SISAGUA_PREFETCH', '1') != '0'
+
+@st.cache_resource
+def get_aquecedor():
+    return aquecimento.Aquecedor()
+
+# API HTTP local (api.py) dentro do processo do painel, ligada por SISAGUA_API_PORTA:
+# usa o mesmo pool, o mesmo cache em disco e os mesmos rollups das sessões
+@st.cache_resource
+def iniciar_api():
+    porta = int(os.environ.get('SISAGUA_API_PORTA', 0))
+    if not porta:
+        return None
+    camada = api.CamadaConsultas(BANCO, get_pool(), get_cache_disco(), rollups_prontos=preparar_agregados,
+                                 orcamento_s=ORCAMENTO_S)
+    try:
+        return api.iniciar_em_segundo_plano(camada, porta)
+    except OSError as e:
+        st.warning(f"API não iniciada na porta {porta}: {e}")
+        return None
+
+servidor_api = iniciar_api()
 
 # Header principal
 st.markdown('<h1 class="main-header">💧 SISAGUA - Monitoramento da Qualidade da Água</h1>', unsafe_allow_html=True)
 
 # Sidebar
 st.sidebar.title("🧭 Navegação")
-page = st.sidebar.selectbox(
-    "Escolha uma seção:",
-    [
-        "📊 Visão Geral",
-        "🏭 Infraestrutura", 
-        "🌍 Distribuição Territorial",
-        "🏢 Análise Institucional", 
-        "📈 Indicadores de Qualidade",
-        "⏰ Evolução Temporal"  # NOVA PÁGINA
-    ]
-)
+page = st.sidebar.selectbox("Escolha uma seção:", list(PAGINAS))
+
+# Filtros globais, empurrados para o SQL das consultas sobre medições
+st.sidebar.markdown("### 🔎 Filtros")
+anos = carregar_opcoes('anos')
+ano_selected = st.sidebar.selectbox("Ano de referência:", ['Todos'] + anos)
+mes_inicio, mes_fim = st.sidebar.slider("Meses:", 1, 12, (1, 12))
+regiao_selected = st.sidebar.selectbox("Região:", ['Todas'] + carregar_opcoes('regioes'))
+regiao_filtro = None if regiao_selected == 'Todas' else regiao_selected
+uf_selected = st.sidebar.selectbox("UF:", ['Todas'] + carregar_opcoes('ufs', {'regiao': regiao_filtro}))
+tech_selected = st.sidebar.selectbox("Tecnologia:", ['Todas'] + carregar_opcoes('tecnologias'))
+param_selected = st.sidebar.selectbox("Parâmetro:", ['Todos'] + carregar_opcoes('parametros'))
+
+filtros = {
+    'ano': None if ano_selected == 'Todos' else ano_selected,
+    'mes_inicio': mes_inicio if mes_inicio > 1 else None,
+    'mes_fim': mes_fim if mes_fim < 12 else None,
+    'regiao': regiao_filtro,
+    'uf': None if uf_selected == 'Todas' else uf_selected,
+    'tecnologia': None if tech_selected == 'Todas' else tech_selected,
+    'parametro': None if param_selected == 'Todos' else param_selected,
+}
+
+# Modo aproximado: ETAs, municípios e parâmetros distintos estimados por esboços
+# HyperLogLog, bem mais baratos que COUNT(DISTINCT) na escala nacional
+if st.sidebar.toggle("≈ Contagens aproximadas", value=os.environ.get('SISAGUA_APROXIMADO') == '1',
+                     help="Estima as contagens distintas a partir de esboços HyperLogLog por UF e mês "
+                          f"(erro padrão de ±{esbocos.ERRO_PADRAO:.1%}). Filtros de tecnologia ou "
+                          "parâmetro usam sempre a contagem exata."):
+    filtros['aproximado'] = True
+
+# Na inicialização e a cada mudança nos dados, todas as páginas são
+# pré-calculadas com os filtros padrão
+if PREFETCH:
+    aquecedor = get_aquecedor()
+    impressao_atual = cache_resultados.impressao_digital(BANCO)
+    if aquecedor.impressao != impressao_atual:
+        aquecedor.impressao = impressao_atual
+        aquecedor.agendar(('tudo', impressao_atual), aquecer_tudo, dict.fromkeys(filtros))
+
+# Página oculta de diagnóstico, acessível via ?diagnostico=1
+if st.query_params.get("diagnostico") == "1":
+    page = "🩺 Diagnóstico"
 
-consultas = get_consultas()
+if relatorio_indices.get('varreduras'):
+    with st.sidebar.expander("⚠️ Índices recomendados"):
+        st.caption(f"{len(relatorio_indices['varreduras'])} varreduras completas em tabelas grandes.")
+        for alerta in relatorio_indices['varreduras']:
+            st.caption(f"• {alerta['consulta']}: {alerta['plano']}")
+        if relatorio_indices['faltantes']:
+            st.caption("Execute `python indices.py --criar` para criar: "
+                       + ", ".join(relatorio_indices['faltantes']))
 
 # Função auxiliar para criar gráficos com estilo consistente
 def create_styled_chart(fig, title, height=450):
@@ -352,13 +662,178 @@ def create_styled_chart(fig, title, height=450):
     )
     return fig
 
+# Figuras prontas (estilizadas e otimizadas) compartilhadas entre sessões e reruns,
+# chaveadas pela especificação do gráfico e pelo conteúdo dos dados
+@st.cache_resource(max_entries=256, show_spinner=False)
+def _figura_em_cache(spec, impressao, _construir):
+    return graficos.otimizar_figura(_construir())
+
+# Margem de erro mostrada junto dos números que vieram dos esboços
+def nota_aproximacao(nome, filtros):
+    if usa_esbocos(nome, filtros):
+        colunas = ', '.join(esbocos.colunas_aproximadas(nome))
+        st.caption(f"≈ {colunas}: estimativas HyperLogLog, erro padrão ±{esbocos.ERRO_PADRAO:.1%} "
+                   f"(±{2 * esbocos.ERRO_PADRAO:.1%} com ~95% de confiança).")
+
+# Consultas de cadastro (sem o marcador {filtros}) mostram o total, seja qual
+# for o filtro da barra lateral; o aviso evita confundi-las com as filtradas
+def nota_sem_filtros(nome, filtros):
+    ignorados = filtros_ignorados(nome, _sem_modo(filtros))
+    if ignorados:
+        st.caption(f"ℹ️ Cadastro completo: não considera os filtros da barra lateral ({', '.join(ignorados)}).")
+
+def exibir_figura(spec, dados, construir, **selecao):
+    fig = _figura_em_cache(spec, graficos.impressao_dados(dados), construir)
+    st.plotly_chart(fig, use_container_width=True, **selecao)
+
+# Gráficos clicáveis: o ponto clicado (pela posição na série ou, sem ela, pelo
+# rótulo) é um dos `valores` e é passado para abrir()
+def _ao_clicar(chave, valores, abrir):
+    pontos = st.session_state[chave]['selection']['points']
+    if not pontos:
+        return
+    indice = pontos[0].get('point_index', pontos[0].get('point_number'))
+    rotulo = pontos[0].get('label', pontos[0].get('x'))
+    if indice is not None and indice < len(valores):
+        abrir(valores[indice])
+    elif rotulo in valores:
+        abrir(rotulo)
+
+def clicavel(chave, valores, abrir):
+    valores = list(valores)
+    return dict(key=chave, selection_mode='points', on_select=functools.partial(_ao_clicar, chave, valores, abrir))
+
+# Resumos em st.metric mostram só os maiores itens; gráficos de pizza agrupam o
+# restante numa fatia "Outros"
+TOP_METRICAS = 5
+TOP_FATIAS = 10
+
+# Tabela de um resultado de get_consultas() paginada (tabelas.py): a consulta roda
+# uma vez por run_consulta (em cache) e busca, ordenação e páginas são recortes do
+# DataFrame; só a página visível é enviada ao navegador. O número da página fica
+# no session_state.
+def _mudar_pagina(paginacao, passo):
+    paginacao['numero'] += passo
+
+def tabela_paginada(nome, filtros, chave, formatar=None):
+    config = tabelas.TABELAS[nome]
+    padrao, padrao_desc = config['ordem']
+    col_busca, col_ordem, col_direcao = st.columns([3, 2, 1], vertical_alignment="bottom")
+    busca = col_busca.text_input("🔍 Buscar", key=f'{chave}_busca',
+                                 placeholder=" / ".join(config['busca'])).strip() or None
+    ordem = col_ordem.selectbox("Ordenar por", config['colunas'], index=config['colunas'].index(padrao),
+                                key=f'{chave}_ordem')
+    descendente = col_direcao.toggle("Decrescente", value=padrao_desc, key=f'{chave}_desc')
+
+    filtros = _sem_modo(filtros)
+    df = tabelas.ordenar(nome, tabelas.filtrar(nome, run_consulta(nome, **filtros), busca), ordem, descendente)
+    # Outros filtros, ordem ou busca: volta para a primeira página
+    estado = (_chave_params(filtros), ordem, descendente, busca)
+    paginacao = st.session_state.setdefault(f'{chave}_paginas', {'estado': None, 'numero': 0})
+    if paginacao['estado'] != estado:
+        paginacao.update(estado=estado, numero=0)
+    total, tamanho = len(df), tabelas.TAMANHO_PAGINA
+    paginacao['numero'] = min(paginacao['numero'], tabelas.paginas(total, tamanho) - 1)
+    numero = paginacao['numero']
+    pagina = tabelas.pagina(df, numero, tamanho)
+
+    st.dataframe(formatar(pagina) if formatar else pagina, use_container_width=True, hide_index=True)
+    col_anterior, col_info, col_proxima = st.columns([1, 4, 1], vertical_alignment="center")
+    col_anterior.button("◀ Anterior", key=f'{chave}_anterior', disabled=numero == 0,
+                        on_click=_mudar_pagina, args=(paginacao, -1))
+    inicio = numero * tamanho
+    if len(pagina):
+        col_info.caption(f"Linhas {inicio + 1:,}–{inicio + len(pagina):,} de {total:,}")
+    else:
+        col_info.caption("Nenhuma linha encontrada.")
+    col_proxima.button("Próxima ▶", key=f'{chave}_proxima', disabled=numero + 1 >= tabelas.paginas(total, tamanho),
+                       on_click=_mudar_pagina, args=(paginacao, 1))
+
+# Detalhamento Região → UF → Município → ETA (cubo.py): cada passo lê só os
+# filhos do nó aberto. O caminho [(nível, id, nome), ...] fica no session_state;
+# clicar numa região ou UF dos gráficos do painel abre o detalhamento nela.
+TOP_DETALHAMENTO = 30
+
+def abrir_detalhamento(nivel, valor):
+    st.session_state['detalhamento_alvo'] = (nivel, valor)
+
+def _voltar_detalhamento(nivel):
+    del st.session_state['detalhamento'][nivel:]
+
+def _descer_detalhamento(profundidade, nivel, linha):
+    st.session_state['detalhamento'][profundidade:] = [(nivel, int(linha['id']), linha['Nome'])]
+
+@st.fragment
+def detalhamento(filtros):
+    st.markdown("### 🔎 Detalhamento Regional")
+    alvo = st.session_state.pop('detalhamento_alvo', None)
+    if alvo:
+        df_caminho = run_query(*cubo.montar_caminho(*alvo), nome='cubo (caminho)')
+        st.session_state['detalhamento'] = [(linha.nivel, int(linha.id), linha.nome)
+                                            for linha in df_caminho.itertuples()]
+    caminho = st.session_state.setdefault('detalhamento', [])
+
+    # Trilha: cada botão volta para aquele nível
+    trilha = st.columns(len(cubo.NIVEIS))
+    for i, rotulo in enumerate(["🇧🇷 Brasil"] + [nome for _, _, nome in caminho]):
+        trilha[i].button(rotulo, key=f'detalhamento_trilha_{i}', disabled=i == len(caminho),
+                         on_click=_voltar_detalhamento, args=(i,), use_container_width=True)
+
+    nivel_pai, id_pai = caminho[-1][:2] if caminho else (None, 0)
+    nivel = cubo.filho(nivel_pai)
+    filtros = _sem_modo(filtros)
+    usar_cubo = preparar_cubo()
+    df = run_query(*cubo.montar_filhos(nivel, id_pai, filtros, usar_cubo=usar_cubo), nome=f'cubo ({nivel})')
+    if df.empty:
+        st.info("Nenhuma medição abaixo deste nível com os filtros atuais.")
+        return
+
+    rotulo = cubo.ROTULOS[nivel]
+    # As ETAs são o último nível: o gráfico delas não abre nada
+    proximo = cubo.filho(nivel)
+    maiores = df.head(TOP_DETALHAMENTO)
+    def construir():
+        fig = px.bar(maiores, x='Nome', y='Medições', hover_data=['ETAs', 'Municípios', 'Parâmetros'],
+                     color='Medições', color_continuous_scale='Teal')
+        fig.update_xaxes(tickangle=45)
+        fig = create_styled_chart(fig, f"{rotulo} por Medições", height=400)
+        return fig
+    selecao = {}
+    if proximo:
+        chave = f'detalhamento_grafico_{nivel}_{id_pai}'
+        selecao = clicavel(chave, maiores.to_dict('records'), functools.partial(_descer_detalhamento, len(caminho), nivel))
+    exibir_figura(('detalhamento', nivel, id_pai), maiores, construir, **selecao)
+
+    if proximo:
+        # Alternativa ao clique no gráfico, que alcança também os nós fora do top
+        chave = f'detalhamento_abrir_{nivel}_{id_pai}'
+        st.selectbox(f"Detalhar ({rotulo}):", range(len(df)),
+                     index=None, format_func=lambda i: df['Nome'].iloc[i], key=chave,
+                     on_change=lambda: _descer_detalhamento(len(caminho), nivel, df.iloc[st.session_state[chave]]))
+    st.dataframe(df.drop(columns='id'), use_container_width=True, hide_index=True)
+    origem = "cubo pré-calculado" if usar_cubo and cubo.suporta(filtros) else "rollups (filtros fora do cubo)"
+    grafico = f", {TOP_DETALHAMENTO} maiores no gráfico" if len(df) > TOP_DETALHAMENTO else ""
+    st.caption(f"{len(df):,} {rotulo}{grafico} · fonte: {origem}.")
+
+# Abas preguiçosas: só a aba aberta executa suas consultas e gráficos, e trocar
+# de aba reexecuta apenas este fragmento, não o script inteiro
+@st.fragment
+def renderizar_abas(chave, abas, filtros):
+    containers = st.tabs(list(abas), key=chave, on_change='rerun')
+    for container, renderizar in zip(containers, abas.values()):
+        if container.open:
+            with container:
+                renderizar(filtros)
+
 # Páginas
 if page == "📊 Visão Geral":
     st.markdown('<h2 class="section-header">Panorama do Sistema SISAGUA</h2>', unsafe_allow_html=True)
     
+    resultados = run_consultas(['metricas_gerais', 'etas_estado', 'analise_geografica'], **filtros)
+    
     # Métricas principais
     try:
-        df_metricas = run_query(consultas['metricas_gerais'])
+        df_metricas = resultados['metricas_gerais']
         
         if not df_metricas.empty:
             col1, col2, col3, col4, col5 = st.columns(5)
@@ -370,6 +845,7 @@ if page == "📊 Visão Geral":
                     with metrics_cols[i]:
                         st.metric(row['tipo'], f"{row['valor']:,}")
                         st.markdown('</div>', unsafe_allow_html=True)
+            nota_sem_filtros('metricas_gerais', filtros)
     except Exception as e:
         st.error(f"Erro ao carregar métricas: {e}")
     
@@ -378,38 +854,50 @@ if page == "📊 Visão Geral":
     
     with col1:
         try:
-            df_estados = run_query(consultas['etas_estado'])
+            df_estados = resultados['etas_estado']
             
             if not df_estados.empty:
-                fig = px.bar(df_estados.head(10), 
-                           x='UF', y='Total ETAs', 
-                           title="🏆 Top 10 Estados por Número de ETAs",
-                           color='Total ETAs', 
-                           color_continuous_scale='Blues',
-                           text='Total ETAs')
-                fig.update_traces(texttemplate='%{text}', textposition='outside')
-                fig = create_styled_chart(fig, "🏆 Top 10 Estados por Número de ETAs")
-                st.plotly_chart(fig, use_container_width=True)
+                def construir():
+                    fig = px.bar(df_estados.head(10), 
+                               x='UF', y='Total ETAs', 
+                               title="🏆 Top 10 Estados por Número de ETAs",
+                               color='Total ETAs', 
+                               color_continuous_scale='Blues',
+                               text='Total ETAs')
+                    fig.update_traces(texttemplate='%{text}', textposition='outside')
+                    fig = create_styled_chart(fig, "🏆 Top 10 Estados por Número de ETAs")
+                    return fig
+                exibir_figura('visao_top_estados', df_estados, construir,
+                              **clicavel('visao_top_estados_clique', df_estados['UF'].head(10),
+                                         functools.partial(abrir_detalhamento, 'uf')))
+                nota_sem_filtros('etas_estado', filtros)
         except Exception as e:
             st.error(f"Erro: {e}")
     
     with col2:
         try:
-            df_geo = run_query(consultas['analise_geografica'])
+            df_geo = resultados['analise_geografica']
             
             if not df_geo.empty:
-                regiao_totals = df_geo.groupby('Região')['Total Medições'].sum().reset_index()
+                regiao_totals = run_pos('analise_geografica', 'totais_regiao', df_geo, **filtros)
                 
-                fig = px.pie(regiao_totals, 
-                           values='Total Medições', 
-                           names='Região',
-                           title="🌍 Distribuição por Região",
-                           color_discrete_sequence=px.colors.qualitative.Set3)
-                fig = create_styled_chart(fig, "🌍 Distribuição por Região")
-                st.plotly_chart(fig, use_container_width=True)
+                def construir():
+                    fig = px.pie(regiao_totals, 
+                               values='Total Medições', 
+                               names='Região',
+                               title="🌍 Distribuição por Região",
+                               color_discrete_sequence=px.colors.qualitative.Set3)
+                    fig = create_styled_chart(fig, "🌍 Distribuição por Região")
+                    return fig
+                exibir_figura('visao_regioes', df_geo, construir,
+                              **clicavel('visao_regioes_clique', regiao_totals['Região'],
+                                         functools.partial(abrir_detalhamento, 'regiao')))
         except Exception as e:
             st.error(f"Erro: {e}")
     
+    # Clicar numa região ou num estado acima abre o detalhamento nele
+    detalhamento(filtros)
+    
     # Resumo executivo
     st.markdown("### 📋 Resumo Executivo")
     col1, col2, col3 = st.columns(3)
@@ -426,56 +914,61 @@ if page == "📊 Visão Geral":
 elif page == "🏭 Infraestrutura":
     st.markdown('<h2 class="section-header">Infraestrutura e Parâmetros</h2>', unsafe_allow_html=True)
     
-    tab1, tab2 = st.tabs(["🔧 Tecnologias de Tratamento", "🧪 Parâmetros de Qualidade"])
-    
-    with tab1:
+    def aba_tecnologias(filtros):
         st.subheader("Tecnologias de Filtração")
         
-        df_tech = run_query(consultas['etas_tecnologia'])
+        df_tech = run_consulta('etas_tecnologia', **filtros)
         
         if not df_tech.empty:
             col1, col2 = st.columns([2, 1])
             
             with col1:
-                fig = px.bar(df_tech, 
-                           x='Tecnologia de Tratamento', y='Qtd ETAs',
-                           title="Distribuição por Tecnologia",
-                           color='Qtd ETAs', 
-                           color_continuous_scale='viridis',
-                           text='Qtd ETAs')
-                fig.update_traces(texttemplate='%{text}', textposition='outside')
-                fig.update_xaxes(tickangle=45)
-                fig = create_styled_chart(fig, "Distribuição por Tecnologia")
-                st.plotly_chart(fig, use_container_width=True)
+                def construir():
+                    fig = px.bar(df_tech, 
+                               x='Tecnologia de Tratamento', y='Qtd ETAs',
+                               title="Distribuição por Tecnologia",
+                               color='Qtd ETAs', 
+                               color_continuous_scale='viridis',
+                               text='Qtd ETAs')
+                    fig.update_traces(texttemplate='%{text}', textposition='outside')
+                    fig.update_xaxes(tickangle=45)
+                    fig = create_styled_chart(fig, "Distribuição por Tecnologia")
+                    return fig
+                exibir_figura('infra_tecnologias', df_tech, construir)
+                nota_sem_filtros('etas_tecnologia', filtros)
             
             with col2:
                 st.markdown("### 📊 Resumo Estatístico")
                 total_etas = df_tech['Qtd ETAs'].sum()
-                for _, row in df_tech.iterrows():
+                for _, row in df_tech.nlargest(TOP_METRICAS, 'Qtd ETAs').iterrows():
                     st.metric(
                         label=row['Tecnologia de Tratamento'][:20] + "...",
                         value=f"{row['Qtd ETAs']:,}",
                         delta=f"{row['Percentual']:.1f}%"
                     )
+                if len(df_tech) > TOP_METRICAS:
+                    st.caption(f"As {TOP_METRICAS} tecnologias mais comuns de {len(df_tech)}.")
                 
                 st.markdown(f"**Total de ETAs:** {total_etas:,}")
     
-    with tab2:
+    def aba_parametros(filtros):
         st.subheader("Parâmetros Monitorados")
         
-        df_param = run_query(consultas['parametros_qualidade'])
+        df_param = run_consulta('parametros_qualidade', **filtros)
         
         if not df_param.empty:
             col1, col2 = st.columns(2)
             
             with col1:
                 finalidade_count = df_param['Finalidade do Monitoramento'].value_counts()
-                fig = px.pie(values=finalidade_count.values, 
-                           names=finalidade_count.index,
-                           title="Distribuição por Finalidade",
-                           color_discrete_sequence=px.colors.qualitative.Pastel)
-                fig = create_styled_chart(fig, "Distribuição por Finalidade")
-                st.plotly_chart(fig, use_container_width=True)
+                def construir():
+                    fig = px.pie(values=finalidade_count.values, 
+                               names=finalidade_count.index,
+                               title="Distribuição por Finalidade",
+                               color_discrete_sequence=px.colors.qualitative.Pastel)
+                    fig = create_styled_chart(fig, "Distribuição por Finalidade")
+                    return fig
+                exibir_figura('infra_finalidades', df_param, construir)
             
             with col2:
                 st.markdown("### 🔍 Detalhamento por Categoria")
@@ -485,151 +978,180 @@ elif page == "🏭 Infraestrutura":
                         for _, param in params.iterrows():
                             unidade = param['Unidade'] if param['Unidade'] != 'None' else 'Qualitativo'
                             st.write(f"• **{param['Parâmetro de Qualidade']}** ({unidade})")
+    
+    renderizar_abas('abas_infraestrutura', {
+        "🔧 Tecnologias de Tratamento": aba_tecnologias,
+        "🧪 Parâmetros de Qualidade": aba_parametros,
+    }, filtros)
 
 elif page == "🌍 Distribuição Territorial":
     st.markdown('<h2 class="section-header">Distribuição Territorial</h2>', unsafe_allow_html=True)
     
-    tab1, tab2, tab3 = st.tabs(["🗺️ Estados", "📍 Pontos de Coleta", "🧪 Parâmetros"])
-    
-    with tab1:
+    def aba_estados(filtros):
         st.subheader("Cobertura por Estado")
         
-        df_estados = run_query(consultas['etas_estado'])
+        df_estados = run_consulta('etas_estado', **filtros)
         
         if not df_estados.empty:
-            fig = make_subplots(specs=[[{"secondary_y": True}]])
-            
-            fig.add_trace(
-                go.Bar(x=df_estados['UF'], 
-                      y=df_estados['Total ETAs'], 
-                      name="ETAs",
-                      marker_color='steelblue'),
-                secondary_y=False,
-            )
-            
-            fig.add_trace(
-                go.Scatter(x=df_estados['UF'], 
-                          y=df_estados['Municípios com ETA'], 
-                          mode='lines+markers', 
-                          name="Municípios", 
-                          line=dict(color='red', width=3),
-                          marker=dict(size=8)),
-                secondary_y=True,
-            )
-            
-            fig.update_yaxes(title_text="Número de ETAs", secondary_y=False)
-            fig.update_yaxes(title_text="Municípios Atendidos", secondary_y=True)
-            fig = create_styled_chart(fig, "ETAs e Cobertura Municipal por Estado")
-            
-            st.plotly_chart(fig, use_container_width=True)
+            def construir():
+                fig = make_subplots(specs=[[{"secondary_y": True}]])
+            
+                fig.add_trace(
+                    go.Bar(x=df_estados['UF'], 
+                          y=df_estados['Total ETAs'], 
+                          name="ETAs",
+                          marker_color='steelblue'),
+                    secondary_y=False,
+                )
+            
+                fig.add_trace(
+                    go.Scatter(x=df_estados['UF'], 
+                              y=df_estados['Municípios com ETA'], 
+                              mode='lines+markers', 
+                              name="Municípios", 
+                              line=dict(color='red', width=3),
+                              marker=dict(size=8)),
+                    secondary_y=True,
+                )
+            
+                fig.update_yaxes(title_text="Número de ETAs", secondary_y=False)
+                fig.update_yaxes(title_text="Municípios Atendidos", secondary_y=True)
+                fig = create_styled_chart(fig, "ETAs e Cobertura Municipal por Estado")
+                return fig
+            exibir_figura('territorial_estados', df_estados, construir,
+                          **clicavel('territorial_estados_clique', df_estados['UF'],
+                                     functools.partial(abrir_detalhamento, 'uf')))
+            nota_sem_filtros('etas_estado', filtros)
             
             # Tabela com indicadores
             st.markdown("### 📊 Indicadores Detalhados")
-            df_estados_display = df_estados.copy()
-            df_estados_display['Eficiência'] = df_estados_display['ETAs por Município'].apply(lambda x: f"{x:.2f}")
-            st.dataframe(df_estados_display, use_container_width=True)
+            tabela_paginada('etas_estado', filtros, 'tabela_estados', formatar=lambda df: df.assign(
+                **{'Eficiência': df['ETAs por Município'].apply(lambda x: f"{x:.2f}")}))
+            
+            detalhamento(filtros)
     
-    with tab2:
+    def aba_pontos(filtros):
         st.subheader("Pontos de Monitoramento")
         
-        df_pontos = run_query(consultas['medicoes_ponto'])
+        # Gráfico e métricas mostram só os maiores pontos; a lista completa fica
+        # na tabela paginada, sobre o mesmo resultado
+        df_todos = run_consulta('medicoes_ponto', **_sem_modo(filtros))
+        df_pontos = tabelas.top(df_todos, 'Total Medições', TOP_FATIAS)
         
         if not df_pontos.empty:
+            total_pontos = len(df_todos)
+            total_medicoes = int(df_todos['Total Medições'].sum())
             col1, col2 = st.columns(2)
             
             with col1:
-                fig = px.pie(df_pontos, 
-                           values='Total Medições', 
-                           names='Ponto de Monitoramento',
-                           title="Distribuição por Ponto")
-                fig = create_styled_chart(fig, "Distribuição por Ponto")
-                st.plotly_chart(fig, use_container_width=True)
+                fatias = df_pontos[['Ponto de Monitoramento', 'Total Medições']].astype({'Ponto de Monitoramento': object})
+                restante = total_medicoes - fatias['Total Medições'].sum()
+                if total_pontos > len(fatias) and restante > 0:
+                    fatias.loc[len(fatias)] = [f"Outros ({total_pontos - len(df_pontos):,} pontos)", restante]
+                def construir():
+                    fig = px.pie(fatias, 
+                               values='Total Medições', 
+                               names='Ponto de Monitoramento',
+                               title="Distribuição por Ponto")
+                    fig = create_styled_chart(fig, "Distribuição por Ponto")
+                    return fig
+                exibir_figura('territorial_pontos', fatias, construir)
             
             with col2:
                 st.markdown("### 📈 Análise Quantitativa")
-                total_medicoes = df_pontos['Total Medições'].sum()
-                for _, row in df_pontos.iterrows():
+                for _, row in df_pontos.head(TOP_METRICAS).iterrows():
                     st.metric(
                         label=row['Ponto de Monitoramento'][:25] + "...",
                         value=f"{row['Total Medições']:,}",
                         delta=f"{row['% do Total']:.1f}%"
                     )
+                if total_pontos > TOP_METRICAS:
+                    st.caption(f"Os {TOP_METRICAS} pontos com mais medições de {total_pontos:,}.")
                 st.markdown(f"**Total:** {total_medicoes:,} medições")
+            
+            st.markdown("### 📋 Todos os Pontos")
+            tabela_paginada('medicoes_ponto', filtros, 'tabela_pontos')
     
-    with tab3:
+    def aba_categorias(filtros):
         st.subheader("Categorias de Parâmetros")
         
-        df_param_cat = run_query(consultas['parametros_categoria'])
+        df_param_cat = run_consulta('parametros_categoria', **filtros)
         
         if not df_param_cat.empty:
-            fig = px.sunburst(df_param_cat, 
-                             path=['Categoria', 'Parâmetro'], 
-                             values='Total Medições',
-                             title="Hierarquia: Categorias → Parâmetros")
-            fig = create_styled_chart(fig, "Hierarquia: Categorias → Parâmetros", 500)
-            st.plotly_chart(fig, use_container_width=True)
+            def construir():
+                fig = px.sunburst(df_param_cat, 
+                                 path=['Categoria', 'Parâmetro'], 
+                                 values='Total Medições',
+                                 title="Hierarquia: Categorias → Parâmetros")
+                fig = create_styled_chart(fig, "Hierarquia: Categorias → Parâmetros", 500)
+                return fig
+            exibir_figura('territorial_categorias', df_param_cat, construir)
             
             # Top parâmetros
             st.markdown("### 🔝 Top 10 Parâmetros Mais Monitorados")
             top_params = df_param_cat.nlargest(10, 'Total Medições')
             st.dataframe(top_params, use_container_width=True)
+    
+    renderizar_abas('abas_territorial', {
+        "🗺️ Estados": aba_estados,
+        "📍 Pontos de Coleta": aba_pontos,
+        "🧪 Parâmetros": aba_categorias,
+    }, filtros)
 
 elif page == "🏢 Análise Institucional":
     st.markdown('<h2 class="section-header">Análise Institucional</h2>', unsafe_allow_html=True)
     
-    tab1, tab2, tab3 = st.tabs(["🌎 Panorama Regional", "🏛️ Performance Institucional", "⚙️ Eficácia por Tecnologia"])
-    
-    with tab1:
+    def aba_regional(filtros):
         st.subheader("Eficiência Regional")
         
-        df_geo = run_query(consultas['analise_geografica'])
+        df_geo = run_consulta('analise_geografica', **filtros)
         
         if not df_geo.empty:
-            fig = px.scatter(df_geo, 
-                           x='ETAs Ativas', 
-                           y='Total Medições', 
-                           size='Medições/ETA', 
-                           color='Região',
-                           hover_name='UF',
-                           title="Eficiência por Estado",
-                           hover_data=['Municípios'])
-            fig = create_styled_chart(fig, "Eficiência por Estado")
-            st.plotly_chart(fig, use_container_width=True)
+            def construir():
+                fig = px.scatter(df_geo, 
+                               x='ETAs Ativas', 
+                               y='Total Medições', 
+                               size='Medições/ETA', 
+                               color='Região',
+                               hover_name='UF',
+                               title="Eficiência por Estado",
+                               hover_data=['Municípios'])
+                fig = create_styled_chart(fig, "Eficiência por Estado")
+                return fig
+            exibir_figura('institucional_regional', df_geo, construir)
+            nota_aproximacao('analise_geografica', filtros)
             
             # Resumo por região
-            resumo_regiao = df_geo.groupby('Região').agg({
-                'Total Medições': 'sum',
-                'ETAs Ativas': 'sum',
-                'Medições/ETA': 'mean',
-                'Municípios': 'sum'
-            }).round(1).reset_index()
+            resumo_regiao = run_pos('analise_geografica', 'resumo_regiao', df_geo, **filtros)
             
             st.markdown("### 📋 Resumo Regional")
             st.dataframe(resumo_regiao, use_container_width=True)
     
-    with tab2:
+    def aba_instituicoes(filtros):
         st.subheader("Ranking Institucional")
         
-        df_inst = run_query(consultas['performance_instituicao'])
+        df_inst = run_consulta('performance_instituicao', **filtros)
         
         if not df_inst.empty:
-            fig = px.scatter(df_inst, 
-                           x='ETAs', 
-                           y='Medições', 
-                           size='Med/ETA',
-                           color='Tipo',
-                           hover_name='Instituição',
-                           title="Performance: ETAs × Medições")
-            fig = create_styled_chart(fig, "Performance: ETAs × Medições")
-            st.plotly_chart(fig, use_container_width=True)
+            def construir():
+                fig = px.scatter(df_inst, 
+                               x='ETAs', 
+                               y='Medições', 
+                               size='Med/ETA',
+                               color='Tipo',
+                               hover_name='Instituição',
+                               title="Performance: ETAs × Medições")
+                fig = create_styled_chart(fig, "Performance: ETAs × Medições")
+                return fig
+            exibir_figura('institucional_instituicoes', df_inst, construir)
             
             st.markdown("### 🏆 Ranking Detalhado")
-            st.dataframe(df_inst, use_container_width=True)
+            tabela_paginada('performance_instituicao', filtros, 'tabela_instituicoes')
     
-    with tab3:
+    def aba_tecnologia_filtracao(filtros):
         st.subheader("Análise por Tecnologia de Filtração")
         
-        df_filtrac = run_query(consultas['analise_filtracao'])
+        df_filtrac = run_consulta('analise_filtracao', **filtros)
         
         if not df_filtrac.empty:
             # Análise por parâmetro
@@ -640,38 +1162,47 @@ elif page == "🏢 Análise Institucional":
                 data_param = df_filtrac[df_filtrac['Parâmetro'] == parametro]
                 
                 if not data_param.empty:
-                    fig = px.bar(data_param, 
-                               x='Tipo Filtração', 
-                               y='Porcentagem',
-                               color='Faixa de Valores',
-                               title=f"Distribuição de {parametro} por Tecnologia",
-                               barmode='stack')
-                    fig = create_styled_chart(fig, f"Distribuição de {parametro} por Tecnologia")
-                    fig.update_xaxes(tickangle=45)
-                    st.plotly_chart(fig, use_container_width=True)
+                    def construir():
+                        fig = px.bar(data_param, 
+                                   x='Tipo Filtração', 
+                                   y='Porcentagem',
+                                   color='Faixa de Valores',
+                                   title=f"Distribuição de {parametro} por Tecnologia",
+                                   barmode='stack')
+                        fig = create_styled_chart(fig, f"Distribuição de {parametro} por Tecnologia")
+                        fig.update_xaxes(tickangle=45)
+                        return fig
+                    exibir_figura(('institucional_filtracao', parametro), data_param, construir)
+    
+    renderizar_abas('abas_institucional', {
+        "🌎 Panorama Regional": aba_regional,
+        "🏛️ Performance Institucional": aba_instituicoes,
+        "⚙️ Eficácia por Tecnologia": aba_tecnologia_filtracao,
+    }, filtros)
 
 elif page == "📈 Indicadores de Qualidade":
     st.markdown('<h2 class="section-header">Indicadores de Qualidade</h2>', unsafe_allow_html=True)
     
-    tab1, tab2 = st.tabs(["🏆 Ranking de Estados", "🧪 Análise por Filtração"])
-    
-    with tab1:
+    def aba_ranking(filtros):
         st.subheader("Ranking de Estados por Diversidade")
         
-        df_ranking = run_query(consultas['ranking_estados'])
+        df_ranking = run_consulta('ranking_estados', **filtros)
         
         if not df_ranking.empty:
-            fig = px.bar(df_ranking.head(15), 
-                        x='Estado', 
-                        y='Parâmetros',
-                        title="Top 15 Estados por Diversidade de Parâmetros",
-                        color='Parâmetros', 
-                        color_continuous_scale='RdYlGn',
-                        text='Parâmetros')
-            fig.update_traces(texttemplate='%{text}', textposition='outside')
-            fig = create_styled_chart(fig, "Top 15 Estados por Diversidade de Parâmetros")
-            fig.update_xaxes(tickangle=45)
-            st.plotly_chart(fig, use_container_width=True)
+            def construir():
+                fig = px.bar(df_ranking.head(15), 
+                            x='Estado', 
+                            y='Parâmetros',
+                            title="Top 15 Estados por Diversidade de Parâmetros",
+                            color='Parâmetros', 
+                            color_continuous_scale='RdYlGn',
+                            text='Parâmetros')
+                fig.update_traces(texttemplate='%{text}', textposition='outside')
+                fig = create_styled_chart(fig, "Top 15 Estados por Diversidade de Parâmetros")
+                fig.update_xaxes(tickangle=45)
+                return fig
+            exibir_figura('indicadores_ranking', df_ranking, construir)
+            nota_aproximacao('ranking_estados', filtros)
             
             if len(df_ranking) > 0:
                 st.markdown("### 🎯 Principais Insights")
@@ -693,31 +1224,15 @@ elif page == "📈 Indicadores de Qualidade":
             st.markdown("### 📊 Tabela Completa")
             st.dataframe(df_ranking, use_container_width=True)
     
-    with tab2:
+    def aba_filtracao(filtros):
         st.subheader("Análise Detalhada por Filtração")
         
-        df_filtrac = run_query(consultas['analise_filtracao'])
+        st.caption("Tecnologia e parâmetro são selecionados nos filtros da barra lateral.")
         
-        if not df_filtrac.empty:
-            # Filtros interativos
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                tecnologias = ['Todas'] + list(df_filtrac['Tipo Filtração'].unique())
-                tech_selected = st.selectbox("Selecione a Tecnologia:", tecnologias)
-            
-            with col2:
-                parametros = ['Todos'] + list(df_filtrac['Parâmetro'].unique())
-                param_selected = st.selectbox("Selecione o Parâmetro:", parametros)
-            
-            # Filtrar dados
-            df_filtered = df_filtrac.copy()
-            if tech_selected != 'Todas':
-                df_filtered = df_filtered[df_filtered['Tipo Filtração'] == tech_selected]
-            if param_selected != 'Todos':
-                df_filtered = df_filtered[df_filtered['Parâmetro'] == param_selected]
-            
-            if not df_filtered.empty:
+        df_filtered = run_consulta('analise_filtracao', **filtros)
+        
+        if not df_filtered.empty:
+            def construir():
                 fig = px.scatter(df_filtered, 
                                x='Análises', 
                                y='Porcentagem',
@@ -726,112 +1241,221 @@ elif page == "📈 Indicadores de Qualidade":
                                hover_name='Faixa de Valores',
                                title="Análise de Performance por Tecnologia")
                 fig = create_styled_chart(fig, "Análise de Performance por Tecnologia")
-                st.plotly_chart(fig, use_container_width=True)
-                
-                st.dataframe(df_filtered, use_container_width=True)
-            else:
-                st.warning("Nenhum dado encontrado para os filtros selecionados.")
+                return fig
+            exibir_figura('indicadores_filtracao', df_filtered, construir)
+            
+            tabela_paginada('analise_filtracao', filtros, 'tabela_filtracao')
+        else:
+            st.warning("Nenhum dado encontrado para os filtros selecionados.")
+    
+    renderizar_abas('abas_indicadores', {
+        "🏆 Ranking de Estados": aba_ranking,
+        "🧪 Análise por Filtração": aba_filtracao,
+    }, filtros)
 
 # NOVA PÁGINA: Evolução Temporal
 elif page == "⏰ Evolução Temporal":
     st.markdown('<h2 class="section-header">Evolução Temporal do Monitoramento</h2>', unsafe_allow_html=True)
     
-    df_temporal = run_query(consultas['evolucao_temporal'])
+    ano_referencia = ano_temporal(filtros)
+    if ano_referencia is not None:
+        st.caption(f"Ano de referência: {ano_referencia}")
+    df_temporal = run_consulta('evolucao_temporal', **{**filtros, 'ano': ano_referencia})
+    nota_aproximacao('evolucao_temporal', {**filtros, 'ano': ano_referencia})
     
     if not df_temporal.empty:
-        tab1, tab2, tab3 = st.tabs(["📈 Tendências Mensais", "🌍 Análise Regional", "📊 Métricas de Performance"])
-        
-        with tab1:
+        def aba_tendencias(filtros):
             st.subheader("Evolução Mensal por Região")
             
             # Gráfico de linha temporal
-            fig = px.line(df_temporal, 
-                         x='Mês', 
-                         y='Total de Registros', 
-                         color='Região',
-                         title="Evolução dos Registros ao Longo do Ano",
-                         markers=True)
-            fig = create_styled_chart(fig, "Evolução dos Registros ao Longo do Ano")
-            st.plotly_chart(fig, use_container_width=True)
+            def construir():
+                fig = px.line(df_temporal, 
+                             x='Mês', 
+                             y='Total de Registros', 
+                             color='Região',
+                             title="Evolução dos Registros ao Longo do Ano",
+                             markers=True)
+                fig = create_styled_chart(fig, "Evolução dos Registros ao Longo do Ano")
+                return fig
+            exibir_figura('evolucao_registros', df_temporal, construir)
             
             # Intensidade de monitoramento
-            fig2 = px.line(df_temporal, 
-                          x='Mês', 
-                          y='Intensidade (Reg/ETA)', 
-                          color='Região',
-                          title="Intensidade de Monitoramento (Registros/ETA)",
-                          markers=True)
-            fig2 = create_styled_chart(fig2, "Intensidade de Monitoramento (Registros/ETA)")
-            st.plotly_chart(fig2, use_container_width=True)
+            def construir():
+                fig2 = px.line(df_temporal, 
+                              x='Mês', 
+                              y='Intensidade (Reg/ETA)', 
+                              color='Região',
+                              title="Intensidade de Monitoramento (Registros/ETA)",
+                              markers=True)
+                fig2 = create_styled_chart(fig2, "Intensidade de Monitoramento (Registros/ETA)")
+                return fig2
+            exibir_figura('evolucao_intensidade', df_temporal, construir)
         
-        with tab2:
+        def aba_comparacao_regional(filtros):
             st.subheader("Comparação Regional")
             
             # Heatmap de intensidade
             pivot_intensidade = df_temporal.pivot(index='Região', columns='Mês', values='Intensidade (Reg/ETA)')
             
-            fig = px.imshow(pivot_intensidade,
-                           title="Mapa de Calor - Intensidade por Região e Mês",
-                           color_continuous_scale='Viridis',
-                           aspect='auto')
-            fig = create_styled_chart(fig, "Mapa de Calor - Intensidade por Região e Mês", 400)
-            st.plotly_chart(fig, use_container_width=True)
+            def construir():
+                fig = px.imshow(pivot_intensidade,
+                               title="Mapa de Calor - Intensidade por Região e Mês",
+                               color_continuous_scale='Viridis',
+                               aspect='auto')
+                fig = create_styled_chart(fig, "Mapa de Calor - Intensidade por Região e Mês", 400)
+                return fig
+            exibir_figura('evolucao_mapa_calor', df_temporal, construir)
             
             # Análise por período
-            periodo_summary = df_temporal.groupby(['Região', 'Período']).agg({
-                'Total de Registros': 'sum',
-                'Intensidade (Reg/ETA)': 'mean',
-                'Diversidade (Par/ETA)': 'mean'
-            }).round(2).reset_index()
+            periodo_summary = run_pos('evolucao_temporal', 'resumo_periodo', df_temporal,
+                                      **{**filtros, 'ano': ano_referencia})
             
             st.markdown("### 📋 Resumo por Período")
             st.dataframe(periodo_summary, use_container_width=True)
         
-        with tab3:
+        def aba_metricas(filtros):
             st.subheader("Métricas de Performance")
             
             col1, col2 = st.columns(2)
             
             with col1:
                 # Diversidade de parâmetros
-                fig = px.scatter(df_temporal, 
-                               x='ETAs Ativas', 
-                               y='Diversidade (Par/ETA)',
-                               size='Total de Registros',
-                               color='Região',
-                               hover_data=['Mês'],
-                               title="Diversidade vs ETAs Ativas")
-                fig = create_styled_chart(fig, "Diversidade vs ETAs Ativas")
-                st.plotly_chart(fig, use_container_width=True)
+                def construir():
+                    fig = px.scatter(df_temporal, 
+                                   x='ETAs Ativas', 
+                                   y='Diversidade (Par/ETA)',
+                                   size='Total de Registros',
+                                   color='Região',
+                                   hover_data=['Mês'],
+                                   title="Diversidade vs ETAs Ativas")
+                    fig = create_styled_chart(fig, "Diversidade vs ETAs Ativas")
+                    return fig
+                exibir_figura('evolucao_diversidade', df_temporal, construir)
             
             with col2:
                 # Box plot da intensidade
-                fig = px.box(df_temporal, 
-                           x='Região', 
-                           y='Intensidade (Reg/ETA)',
-                           title="Distribuição da Intensidade por Região")
-                fig = create_styled_chart(fig, "Distribuição da Intensidade por Região")
-                fig.update_xaxes(tickangle=45)
-                st.plotly_chart(fig, use_container_width=True)
+                def construir():
+                    fig = px.box(df_temporal, 
+                               x='Região', 
+                               y='Intensidade (Reg/ETA)',
+                               title="Distribuição da Intensidade por Região")
+                    fig = create_styled_chart(fig, "Distribuição da Intensidade por Região")
+                    fig.update_xaxes(tickangle=45)
+                    return fig
+                exibir_figura('evolucao_intensidade_box', df_temporal, construir)
             
             # Métricas resumo
             st.markdown("### 🎯 Métricas Consolidadas")
             
-            metricas_resumo = df_temporal.groupby('Região').agg({
-                'Total de Registros': ['sum', 'mean'],
-                'ETAs Ativas': 'mean',
-                'Parâmetros Distintos': 'mean',
-                'Intensidade (Reg/ETA)': ['mean', 'std'],
-                'Diversidade (Par/ETA)': ['mean', 'std']
-            }).round(2)
-            
-            # Achatando colunas multi-nível
-            metricas_resumo.columns = ['_'.join(col).strip() for col in metricas_resumo.columns]
+            metricas_resumo = run_pos('evolucao_temporal', 'metricas_regiao', df_temporal,
+                                      **{**filtros, 'ano': ano_referencia})
+            if not metricas_resumo.empty:
+                metricas_resumo = metricas_resumo.set_index('Região')
             st.dataframe(metricas_resumo, use_container_width=True)
+        
+        renderizar_abas('abas_evolucao', {
+            "📈 Tendências Mensais": aba_tendencias,
+            "🌍 Análise Regional": aba_comparacao_regional,
+            "📊 Métricas de Performance": aba_metricas,
+        }, filtros)
     
     else:
         st.warning("⚠️ Dados temporais não disponíveis para análise.")
 
+elif page == "🩺 Diagnóstico":
+    st.markdown('<h2 class="section-header">Diagnóstico das Consultas</h2>', unsafe_allow_html=True)
+    
+    registro = get_registro_consultas()
+    df_execucoes = registro.como_dataframe()
+    
+    if not df_execucoes.empty:
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Execuções registradas", f"{len(df_execucoes):,}")
+        with col2:
+            st.metric("Taxa de cache hit", f"{df_execucoes['cache_hit'].mean():.1%}")
+        with col3:
+            st.metric("Tempo total (s)", f"{df_execucoes['segundos'].sum():.2f}")
+        
+        st.markdown("### 🐢 Consultas por Latência Máxima")
+        st.dataframe(registro.resumo(), use_container_width=True)
+        
+        st.markdown("### 📜 Execuções Recentes")
+        st.dataframe(df_execucoes.iloc[::-1], use_container_width=True)
+        
+        st.download_button("⬇️ Exportar JSON Lines",
+                           data=registro.exportar_jsonl(),
+                           file_name="consultas_sisagua.jsonl",
+                           mime="application/jsonl")
+    else:
+        st.info("Nenhuma consulta registrada neste processo ainda.")
+    
+    st.markdown("### 💾 Cache em Disco")
+    stats_cache = get_cache_disco().estatisticas()
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Entradas", f"{stats_cache['entradas']:,}")
+    with col2:
+        st.metric("Tamanho (MB)", f"{stats_cache['bytes'] / 1024 ** 2:.1f} / {stats_cache['limite_bytes'] / 1024 ** 2:.0f}")
+    with col3:
+        st.metric("Acertos neste processo", f"{stats_cache['taxa_acerto']:.1%}")
+
+    st.markdown("### 🗜️ Memória dos Resultados")
+    economia = get_economia_memoria().estatisticas()
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Resultados compactados", f"{economia['resultados']:,}")
+    with col2:
+        st.metric("Memória (KB)", f"{economia['bytes_depois'] / 1024:,.1f}",
+                  delta=f"{(economia['bytes_depois'] - economia['bytes_antes']) / 1024:,.1f} KB",
+                  delta_color="inverse")
+    with col3:
+        st.metric("Redução", f"{economia['razao']:.1f}x")
+
+    interrompidas = int(df_execucoes['interrompida'].sum()) if not df_execucoes.empty else 0
+    st.caption(f"Orçamento por consulta: {ORCAMENTO_S:g}s na sessão, {ORCAMENTO_FUNDO_S:g}s em segundo plano "
+               f"(0 = sem limite). {interrompidas} execuções interrompidas; "
+               f"{len(get_resultados_anteriores())} resultados anteriores guardados como reserva.")
+
+    if servidor_api is not None:
+        stats_api = servidor_api.camada.estatisticas()
+        st.caption(f"API em http://{servidor_api.server_address[0]}:{servidor_api.server_address[1]}/consultas: "
+                   f"{stats_api['pedidos']} pedidos, {stats_api['execucoes']} executados no banco.")
+
+    if PREFETCH:
+        estado_aquecimento = get_aquecedor().estado()
+        st.caption(f"Aquecimento em segundo plano: {estado_aquecimento['executadas']} tarefas concluídas, "
+                   f"{estado_aquecimento['pendentes']} pendentes.")
+        for erro in estado_aquecimento['erros']:
+            st.caption(f"• {erro}")
+    
+    # O botão de comparação reexecuta só esta seção
+    @st.fragment
+    def secao_motores():
+        st.markdown("### ⚙️ Motores de Consulta")
+        motor = get_motor()
+        st.caption(f"Backend configurado: {BACKEND} | Motor em uso: {motor.nome}")
+        if getattr(motor, 'nao_suportadas', None):
+            st.warning(f"{len(motor.nao_suportadas)} consulta(s) executada(s) no SQLite por não serem suportadas pelo DuckDB.")
+        if not motores.duckdb_disponivel():
+            st.info("Instale o pacote duckdb para comparar os motores.")
+        elif st.button("⏱️ Comparar SQLite × DuckDB"):
+            with st.spinner("Executando as consultas nos dois motores..."):
+                sqlite = motores.MotorSQLite(get_pool())
+                duck = motor if motor.nome == 'duckdb' else motores.MotorDuckDB(BANCO, reserva=sqlite)
+                comparacao = motores.comparar_motores([sqlite, duck])
+            st.metric("Speedup mediano", f"{comparacao['speedup'].median():.1f}x")
+            st.dataframe(comparacao, use_container_width=True)
+    
+    secao_motores()
+
+# Enquanto o usuário lê a página atual, as demais (e as abas ainda não abertas
+# desta) são pré-buscadas com os mesmos filtros
+if PREFETCH and page in PAGINAS:
+    for pagina in PAGINAS:
+        chave = ('pagina', pagina, tuple(sorted(filtros.items())), impressao_atual)
+        aquecedor.agendar(chave, carregar_pagina, pagina, dict(filtros))
+
 # Footer
 st.markdown("---")
 st.markdown("""
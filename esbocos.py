@@ -0,0 +1,337 @@
+import argparse
+import math
+import sqlite3
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+
+import agregados
+import particoes
+from agregados import CONSULTAS_ROLLUP, FILTROS_ROLLUP
+from consultas import filtros_ativos, montar_consulta, renderizar
+
+# Esboços HyperLogLog com 2^12 registradores: erro padrão de 1,04/sqrt(4096) ≈ 1,6%
+PRECISAO = 12
+REGISTRADORES = 1 << PRECISAO
+ERRO_PADRAO = 1.04 / math.sqrt(REGISTRADORES)
+
+# Dimensões contadas por esboço e a coluna de rollup_medicao de cada uma
+DIMENSOES = {'eta': 'id_eta', 'parametro': 'id_parametro', 'municipio': 'id_municipio'}
+
+# Os esboços são guardados por (UF, ano, mês): só os filtros sobre essas chaves
+# podem ser respondidos por eles; tecnologia e parâmetro exigem a contagem exata
+FILTROS_SUPORTADOS = {'ano', 'mes_inicio', 'mes_fim', 'regiao', 'uf'}
+
+ESQUEMA = '''
+CREATE TABLE IF NOT EXISTS esboco_distintos (
+    id_estado INTEGER,
+    ano_referencia INTEGER,
+    mes_referencia INTEGER,
+    dimensao TEXT,
+    registradores BLOB,
+    PRIMARY KEY (id_estado, ano_referencia, mes_referencia, dimensao)
+);
+CREATE TABLE IF NOT EXISTS esboco_celulas (
+    id_estado INTEGER,
+    id_regiao INTEGER,
+    ano_referencia INTEGER,
+    mes_referencia INTEGER,
+    total_medicoes INTEGER,
+    total_com_parametro INTEGER,
+    PRIMARY KEY (id_estado, ano_referencia, mes_referencia)
+);
+CREATE TABLE IF NOT EXISTS esboco_periodos (
+    ano_referencia INTEGER,
+    mes_referencia INTEGER,
+    linhas INTEGER,
+    total_medicoes INTEGER,
+    PRIMARY KEY (ano_referencia, mes_referencia)
+);
+'''
+
+# Totais exatos por (UF, ano, mês), gravados junto com os esboços: a consulta
+# aproximada não volta ao rollup. O alias ru permite reaproveitar FILTROS_ROLLUP.
+SQL_CELULAS = '''
+    SELECT
+        ru.id_estado,
+        ru.ano_referencia,
+        ru.mes_referencia,
+        r.nome_regiao AS "Região",
+        e.uf AS "UF",
+        e.nome_estado AS "Estado",
+        ru.{total} AS total_medicoes
+    FROM esboco_celulas ru
+    INNER JOIN Regiao r ON r.id_regiao = ru.id_regiao
+    INNER JOIN Estado e ON e.id_estado = ru.id_estado
+    WHERE 1 = 1{filtros}
+'''
+
+# Esboços só das células que SQL_CELULAS selecionou (mesmos filtros), em vez do
+# histórico inteiro de cada dimensão
+SQL_DISTINTOS = '''
+    SELECT d.id_estado, d.ano_referencia, d.mes_referencia, d.dimensao, d.registradores
+    FROM esboco_distintos d
+    INNER JOIN ({celulas}) c ON c.id_estado = d.id_estado
+        AND c.ano_referencia = d.ano_referencia AND c.mes_referencia = d.mes_referencia
+    WHERE d.dimensao IN ({dimensoes})
+'''
+
+
+def _hash64(valores):
+    """splitmix64: espalha ids inteiros (sequenciais) uniformemente por 64 bits."""
+    x = np.asarray(valores).astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _bits(x):
+    """Número de bits significativos de cada elemento (int.bit_length vetorizado)."""
+    n = np.zeros(x.shape, dtype=np.int64)
+    for deslocamento in (32, 16, 8, 4, 2, 1):
+        alto = x >= (np.uint64(1) << np.uint64(deslocamento))
+        n += alto * deslocamento
+        x = np.where(alto, x >> np.uint64(deslocamento), x)
+    return n + (x > 0)
+
+
+def _posicoes(valores):
+    """(registrador, posto) de cada valor: o posto é 1 + zeros à esquerda do resto do hash."""
+    h = _hash64(valores)
+    resto = h & np.uint64((1 << (64 - PRECISAO)) - 1)
+    return (h >> np.uint64(64 - PRECISAO)).astype(np.intp), ((64 - PRECISAO) - _bits(resto) + 1).astype(np.uint8)
+
+
+def esboco(valores):
+    """Registradores HyperLogLog dos valores inteiros informados."""
+    registradores = np.zeros(REGISTRADORES, dtype=np.uint8)
+    indices, postos = _posicoes(valores)
+    np.maximum.at(registradores, indices, postos)
+    return registradores
+
+
+def unir(esbocos):
+    """União de esboços: o máximo de cada registrador."""
+    return np.maximum.reduce(list(esbocos))
+
+
+def estimar(registradores):
+    """Cardinalidade estimada, com contagem linear para conjuntos pequenos."""
+    m = REGISTRADORES
+    alfa = 0.7213 / (1 + 1.079 / m)
+    bruta = alfa * m * m / np.sum(np.ldexp(1.0, -registradores.astype(np.int64)))
+    vazios = int(np.count_nonzero(registradores == 0))
+    if bruta <= 2.5 * m and vazios:
+        return m * math.log(m / vazios)
+    return float(bruta)
+
+
+def _serializar(registradores):
+    # Esboços de poucos elementos são quase todos zeros e comprimem muito
+    return zlib.compress(registradores.tobytes(), 6)
+
+
+def _desserializar(blob):
+    return np.frombuffer(zlib.decompress(blob), dtype=np.uint8)
+
+
+def _apagar_periodo(conn, ano, mes):
+    for tabela in ('esboco_distintos', 'esboco_celulas'):
+        conn.execute(f'DELETE FROM {tabela} WHERE ano_referencia = ? AND mes_referencia = ?', (ano, mes))
+
+
+def _construir_periodo(conn, ano, mes):
+    _apagar_periodo(conn, ano, mes)
+    conn.execute(
+        'INSERT INTO esboco_celulas '
+        'SELECT id_estado, MAX(id_regiao), ano_referencia, mes_referencia, SUM(total_medicoes), '
+        'SUM(CASE WHEN id_parametro IS NOT NULL THEN total_medicoes ELSE 0 END) '
+        'FROM rollup_medicao WHERE ano_referencia = ? AND mes_referencia = ? AND id_estado IS NOT NULL '
+        'GROUP BY id_estado, ano_referencia, mes_referencia',
+        (ano, mes),
+    )
+    linhas = []
+    for dimensao, coluna in DIMENSOES.items():
+        df = pd.read_sql_query(
+            f'SELECT DISTINCT id_estado, {coluna} AS valor FROM rollup_medicao '
+            f'WHERE ano_referencia = ? AND mes_referencia = ? '
+            f'AND id_estado IS NOT NULL AND {coluna} IS NOT NULL',
+            conn, params=(ano, mes),
+        )
+        for id_estado, grupo in df.groupby('id_estado'):
+            linhas.append((int(id_estado), ano, mes, dimensao, _serializar(esboco(grupo['valor'].to_numpy()))))
+    conn.executemany('INSERT INTO esboco_distintos VALUES (?, ?, ?, ?, ?)', linhas)
+
+
+def atualizar_esbocos(conn):
+    """Mantém um esboço por (UF, ano, mês, dimensão) em sincronia com rollup_medicao.
+
+    Só os períodos cujo número de linhas ou total de medições mudou no rollup
+    são refeitos. Retorna a lista de (ano, mês) reconstruídos.
+    """
+    conn.executescript(ESQUEMA)
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        controle_rollup = agregados.assinatura_controle(conn)
+        if controle_rollup is not None and controle_rollup == agregados.assinatura_controle(conn, 'esboco_controle'):
+            conn.rollback()
+            return []
+        atuais = agregados.totais_rollup(conn, 'ano_referencia', 'mes_referencia')
+        gravados = {
+            (ano, mes): (linhas, total)
+            for ano, mes, linhas, total in conn.execute('SELECT * FROM esboco_periodos')
+        }
+        refazer = sorted(periodo for periodo, estado in atuais.items() if gravados.get(periodo) != estado)
+        for ano, mes in refazer:
+            _construir_periodo(conn, ano, mes)
+        for ano, mes in set(gravados) - set(atuais):
+            _apagar_periodo(conn, ano, mes)
+        conn.execute('DELETE FROM esboco_periodos')
+        conn.executemany('INSERT INTO esboco_periodos VALUES (?, ?, ?, ?)',
+                         [(ano, mes, linhas, total) for (ano, mes), (linhas, total) in atuais.items()])
+        agregados.copiar_controle(conn, 'esboco_controle')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return refazer
+
+
+def garantir_esbocos(conn):
+    """Atualiza os esboços; False se não puderam ser construídos (ex.: banco somente leitura)."""
+    try:
+        atualizar_esbocos(conn)
+        return True
+    except (sqlite3.Error, pd.errors.DatabaseError):
+        return False
+
+
+def _evolucao(df):
+    df['Intensidade (Reg/ETA)'] = (df['Total de Registros'] / df['ETAs Ativas']).round(1)
+    df['Diversidade (Par/ETA)'] = (df['Parâmetros Distintos'] / df['ETAs Ativas']).round(2)
+    df['Período'] = np.select([df['Mês'] <= 2, df['Mês'] <= 4], ['Início do Ano', 'Meio do Ano'],
+                              'Segundo Semestre')
+    df = df[df['Total de Registros'] >= 100]
+    return df.sort_values(['Região', 'Mês'])
+
+
+def _geografica(df):
+    df['Medições/ETA'] = (df['Total Medições'] / df['ETAs Ativas']).round(0)
+    df = df[df['Total Medições'] > 0]
+    return df.sort_values('Total Medições', ascending=False, kind='stable')
+
+
+def _ranking(df):
+    df = df[df['ETAs'] >= 5]
+    return df.sort_values(['Parâmetros', 'Medições'], ascending=False, kind='stable')
+
+
+# Consultas respondidas pelos esboços: agrupamento, coluna do total exato,
+# contagens distintas estimadas (coluna -> dimensão) e colunas finais
+CONSULTAS = {
+    'analise_geografica': {
+        'total_celula': 'total_medicoes',
+        'grupos': ['Região', 'UF'],
+        'total': 'Total Medições',
+        'distintos': {'Municípios': 'municipio', 'ETAs Ativas': 'eta'},
+        'finalizar': _geografica,
+        'colunas': ['Região', 'UF', 'Municípios', 'ETAs Ativas', 'Total Medições', 'Medições/ETA'],
+    },
+    'ranking_estados': {
+        'total_celula': 'total_com_parametro',
+        'grupos': ['Estado'],
+        'total': 'Medições',
+        'distintos': {'ETAs': 'eta', 'Parâmetros': 'parametro'},
+        'finalizar': _ranking,
+        'colunas': ['Estado', 'ETAs', 'Parâmetros', 'Medições'],
+    },
+    'evolucao_temporal': {
+        'total_celula': 'total_com_parametro',
+        'grupos': ['Região', 'Mês'],
+        'total': 'Total de Registros',
+        'distintos': {'ETAs Ativas': 'eta', 'Parâmetros Distintos': 'parametro'},
+        'finalizar': _evolucao,
+        'colunas': ['Região', 'Mês', 'Total de Registros', 'ETAs Ativas', 'Parâmetros Distintos',
+                    'Intensidade (Reg/ETA)', 'Diversidade (Par/ETA)', 'Período'],
+    },
+}
+
+
+def suporta(nome, filtros=None):
+    """A consulta tem versão aproximada e os filtros ativos podem ser respondidos pelos esboços?"""
+    if nome not in CONSULTAS:
+        return False
+    return set(filtros_ativos(nome, filtros, CONSULTAS_ROLLUP[nome])) <= FILTROS_SUPORTADOS
+
+
+def colunas_aproximadas(nome):
+    """Colunas cujo valor depende de uma contagem distinta estimada."""
+    derivadas = {'Medições/ETA', 'Intensidade (Reg/ETA)', 'Diversidade (Par/ETA)'}
+    return list(CONSULTAS[nome]['distintos']) + [c for c in CONSULTAS[nome]['colunas'] if c in derivadas]
+
+
+def consultar(conn, nome, filtros=None):
+    """Versão aproximada da consulta: somas exatas do rollup e contagens distintas dos esboços."""
+    spec = CONSULTAS[nome]
+    ativos = filtros_ativos(nome, filtros, CONSULTAS_ROLLUP[nome])
+    sql = renderizar(SQL_CELULAS.replace('{total}', spec['total_celula']), FILTROS_ROLLUP, ativos)
+    totais = pd.read_sql_query(sql, conn, params=ativos)
+    totais['Mês'] = totais.pop('mes_referencia')
+
+    dimensoes = {f'_dimensao{i}': dimensao for i, dimensao in enumerate(sorted(set(spec['distintos'].values())))}
+    sql_distintos = SQL_DISTINTOS.format(celulas=sql, dimensoes=', '.join(f':{nome}' for nome in dimensoes))
+    esbocos = {}
+    for id_estado, ano, mes, dimensao, blob in conn.execute(sql_distintos, {**ativos, **dimensoes}):
+        esbocos[id_estado, ano, mes, dimensao] = blob
+
+    linhas = []
+    for chave, grupo in totais.groupby(spec['grupos'], sort=False):
+        linha = dict(zip(spec['grupos'], chave))
+        linha[spec['total']] = int(grupo['total_medicoes'].sum())
+        celulas = list(zip(grupo['id_estado'], grupo['ano_referencia'], grupo['Mês']))
+        for coluna, dimensao in spec['distintos'].items():
+            blobs = [esbocos.get((*celula, dimensao)) for celula in celulas]
+            registradores = [_desserializar(b) for b in blobs if b is not None]
+            linha[coluna] = round(estimar(unir(registradores))) if registradores else 0
+        linhas.append(linha)
+    df = pd.DataFrame(linhas, columns=spec['grupos'] + [spec['total']] + list(spec['distintos']))
+    if df.empty:
+        return pd.DataFrame(columns=spec['colunas'])
+    return spec['finalizar'](df)[spec['colunas']].reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Atualiza os esboços HyperLogLog e compara as contagens aproximadas com as exatas')
+    parser.add_argument('banco', nargs='?', default='sisagua.db')
+    parser.add_argument('--ano', type=int, help='filtro de ano usado na comparação')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.banco)
+    particoes.anexar(conn, args.banco)
+    inicio = time.perf_counter()
+    try:
+        refeitos = atualizar_esbocos(conn)
+    except sqlite3.OperationalError as e:
+        raise SystemExit(f'Erro: {e} (construa os rollups com `python agregados.py` antes).')
+    print(f'{len(refeitos)} períodos reconstruídos em {time.perf_counter() - inicio:.2f}s.')
+    print(f'Erro padrão dos esboços: ±{ERRO_PADRAO:.1%} (±{2 * ERRO_PADRAO:.1%} com ~95% de confiança).')
+
+    filtros = {'ano': args.ano} if args.ano else {}
+    for nome, spec in CONSULTAS.items():
+        inicio = time.perf_counter()
+        sql, params = montar_consulta(nome, filtros)
+        exato = pd.read_sql_query(sql, conn, params=params)
+        segundos_exato = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        aproximado = consultar(conn, nome, filtros)
+        segundos_aproximado = time.perf_counter() - inicio
+        comparados = exato.merge(aproximado, on=spec['grupos'], suffixes=('', ' (aprox.)'))
+        erros = [
+            ((comparados[f'{c} (aprox.)'] - comparados[c]).abs() / comparados[c].clip(lower=1)).max()
+            for c in spec['distintos']
+        ]
+        print(f'{nome:<22} exata {segundos_exato * 1000:8.1f} ms | aproximada {segundos_aproximado * 1000:7.1f} ms | '
+              f'{len(comparados)}/{len(exato)} grupos | maior erro relativo {max(erros, default=0):.2%}')
@@ -0,0 +1,108 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+# Acima deste número de pontos numa figura, os scatters passam a ser WebGL
+LIMITE_WEBGL = 1000
+# Pontos por série a partir dos quais ela é reduzida no servidor: mais que
+# isso não cabe na largura de um gráfico e só aumenta o JSON enviado
+MAX_PONTOS_SERIE = 2000
+
+# Atributos de um trace que têm um valor por ponto e acompanham a redução
+_ATRIBUTOS_POR_PONTO = [
+    ('x',), ('y',), ('text',), ('hovertext',), ('customdata',), ('ids',),
+    ('marker', 'size'), ('marker', 'color'), ('marker', 'symbol'),
+]
+
+
+def impressao_dados(*dfs):
+    """Hash do conteúdo (valores, colunas e tipos) dos DataFrames de uma figura."""
+    h = hashlib.sha1()
+    for df in dfs:
+        h.update(repr((list(df.columns), [str(t) for t in df.dtypes])).encode())
+        h.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    return h.hexdigest()
+
+
+def _pontos(trace):
+    for atributo in ('x', 'y'):
+        valores = getattr(trace, atributo, None)
+        if valores is not None and not isinstance(valores, str):
+            return len(valores)
+    return 0
+
+
+def _indices_reduzidos(x, y, limite):
+    """Índices que preservam o formato da série: mínimo e máximo de y por faixa
+    de posições consecutivas. Só equivale a faixas de x numa série ordenada em x
+    (ver _reduzivel).
+
+    Para séries sem y numérico, cai para uma amostragem uniforme.
+    """
+    n = len(y)
+    try:
+        y = np.asarray(y, dtype=float)
+    except (TypeError, ValueError):
+        return np.linspace(0, n - 1, limite).astype(int)
+    faixas = max(limite // 2, 1)
+    limites = np.linspace(0, n, faixas + 1).astype(int)
+    indices = [0, n - 1]
+    for inicio, fim in zip(limites[:-1], limites[1:]):
+        if fim <= inicio:
+            continue
+        trecho = y[inicio:fim]
+        if np.isnan(trecho).all():
+            indices.append(inicio)
+            continue
+        indices.append(inicio + int(np.nanargmin(trecho)))
+        indices.append(inicio + int(np.nanargmax(trecho)))
+    return np.unique(indices)
+
+
+def _reduzivel(trace):
+    """Só linhas com x em ordem são reduzidas: nelas, posições vizinhas são
+    valores de x vizinhos. Pontos soltos (scatter, bolhas) ficam inteiros e
+    contam só com o WebGL."""
+    if 'lines' not in (trace.mode or 'lines'):
+        return False
+    if trace.x is None or isinstance(trace.x, str):
+        return True
+    x = pd.Index(trace.x)
+    return x.is_monotonic_increasing or x.is_monotonic_decreasing
+
+
+def _reduzir(trace, limite):
+    n = _pontos(trace)
+    indices = _indices_reduzidos(trace.x, trace.y if trace.y is not None else trace.x, limite)
+    atualizacao = {}
+    for caminho in _ATRIBUTOS_POR_PONTO:
+        objeto = trace
+        for parte in caminho:
+            objeto = getattr(objeto, parte, None)
+            if objeto is None:
+                break
+        if objeto is None or isinstance(objeto, (str, int, float)) or len(objeto) != n:
+            continue
+        valores = np.asarray(objeto)
+        atualizacao['_'.join(caminho)] = valores[indices]
+    trace.update(atualizacao, overwrite=False)
+
+
+def otimizar_figura(fig, limite_webgl=LIMITE_WEBGL, max_pontos=MAX_PONTOS_SERIE):
+    """Reduz as linhas longas ordenadas em x e troca scatters grandes por WebGL (Scattergl)."""
+    total = sum(_pontos(trace) for trace in fig.data)
+    traces = []
+    alterada = False
+    for trace in fig.data:
+        if trace.type in ('scatter', 'scattergl') and _pontos(trace) > max_pontos and _reduzivel(trace):
+            _reduzir(trace, max_pontos)
+        if trace.type == 'scatter' and total > limite_webgl:
+            trace = go.Scattergl(trace.to_plotly_json(), skip_invalid=True)
+            alterada = True
+        traces.append(trace)
+    if alterada:
+        fig.data = ()
+        fig.add_traces(traces)
+    return fig
@@ -0,0 +1,136 @@
+import argparse
+import re
+import sqlite3
+
+from consultas import get_consultas, montar_consulta
+
+# Tabelas com mais linhas que isso são consideradas grandes para fins de alerta
+LIMITE_LINHAS = 10000
+
+# Índices recomendados para as junções e filtros de get_consultas().
+# Os índices da Medicao incluem as colunas lidas pelas consultas para que o
+# SQLite consiga respondê-las apenas pelo índice (covering index).
+INDICES_RECOMENDADOS = [
+    ('idx_medicao_eta', 'Medicao', ['id_eta', 'id_parametro', 'ano_referencia', 'mes_referencia']),
+    ('idx_medicao_parametro', 'Medicao', ['id_parametro', 'id_campo', 'id_eta', 'valor_medido']),
+    ('idx_medicao_ponto', 'Medicao', ['id_ponto']),
+    ('idx_medicao_periodo', 'Medicao', ['ano_referencia', 'mes_referencia', 'id_eta', 'id_parametro']),
+    ('idx_eta_municipio', 'ETA', ['id_municipio']),
+    ('idx_eta_escritorio', 'ETA', ['id_escritorio']),
+    ('idx_eta_tipo_filtracao', 'ETA', ['tipo_filtracao']),
+    ('idx_municipio_estado', 'Municipio', ['id_estado']),
+    ('idx_estado_regiao', 'Estado', ['id_regiao']),
+    ('idx_escritorio_instituicao', 'Escritorio_Regional', ['id_instituicao']),
+]
+
+_PADRAO_TABELA = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+_PALAVRAS_RESERVADAS = {'on', 'where', 'inner', 'left', 'join', 'group', 'order', 'union', 'having'}
+
+
+def _tabelas_por_alias(query):
+    aliases = {}
+    for tabela, alias in _PADRAO_TABELA.findall(query):
+        aliases[tabela.lower()] = tabela
+        if alias and alias.lower() not in _PALAVRAS_RESERVADAS:
+            aliases[alias.lower()] = tabela
+    return aliases
+
+
+def contar_linhas(conn, tabela):
+    return conn.execute(f'SELECT COUNT(*) FROM {tabela}').fetchone()[0]
+
+
+def plano_consulta(conn, query, params=None):
+    return [linha[3] for linha in conn.execute(f'EXPLAIN QUERY PLAN {query}', params or {})]
+
+
+def varreduras_grandes(conn, nomes=None, limite=LIMITE_LINHAS):
+    """Lista os SCANs completos (sem índice de cobertura) sobre tabelas grandes."""
+    nomes = nomes or list(get_consultas())
+    linhas_por_tabela = {}
+    alertas = []
+    for nome in nomes:
+        query, params = montar_consulta(nome)
+        aliases = _tabelas_por_alias(query)
+        for detalhe in plano_consulta(conn, query, params):
+            partes = detalhe.split()
+            if len(partes) < 2 or partes[0] != 'SCAN' or 'COVERING INDEX' in detalhe:
+                continue
+            tabela = aliases.get(partes[1].lower())
+            if tabela is None:
+                # Subconsultas e CTEs materializadas não são tabelas do banco
+                continue
+            if tabela not in linhas_por_tabela:
+                linhas_por_tabela[tabela] = contar_linhas(conn, tabela)
+            if linhas_por_tabela[tabela] > limite:
+                alertas.append({
+                    'consulta': nome,
+                    'tabela': tabela,
+                    'linhas': linhas_por_tabela[tabela],
+                    'plano': detalhe,
+                })
+    return alertas
+
+
+def _colunas_indexadas(conn, tabela):
+    colunas = []
+    for indice in conn.execute(f'PRAGMA index_list({tabela})').fetchall():
+        colunas.append([info[2] for info in conn.execute(f'PRAGMA index_info({indice[1]})')])
+    return colunas
+
+
+def indices_faltantes(conn):
+    """Índices recomendados que não existem (nem com o mesmo prefixo de colunas)."""
+    faltantes = []
+    for nome, tabela, colunas in INDICES_RECOMENDADOS:
+        existentes = _colunas_indexadas(conn, tabela)
+        if not any(existente[:len(colunas)] == colunas for existente in existentes):
+            faltantes.append((nome, tabela, colunas))
+    return faltantes
+
+
+def criar_indices(conn):
+    """Cria os índices recomendados que faltam e atualiza as estatísticas."""
+    criados = []
+    for nome, tabela, colunas in indices_faltantes(conn):
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {nome} ON {tabela} ({", ".join(colunas)})')
+        criados.append(nome)
+    conn.execute('ANALYZE')
+    conn.commit()
+    return criados
+
+
+def verificar_indices(conn, criar=False, limite=LIMITE_LINHAS):
+    """Verificação de inicialização: relata SCANs grandes e, opcionalmente, corrige."""
+    relatorio = {'criados': [], 'varreduras': [], 'faltantes': []}
+    try:
+        if criar:
+            relatorio['criados'] = criar_indices(conn)
+        relatorio['varreduras'] = varreduras_grandes(conn, limite=limite)
+        relatorio['faltantes'] = [nome for nome, _, _ in indices_faltantes(conn)]
+    except sqlite3.Error as e:
+        relatorio['erro'] = str(e)
+    return relatorio
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Verifica os planos de consulta do sisagua.db')
+    parser.add_argument('banco', nargs='?', default='sisagua.db')
+    parser.add_argument('--criar', action='store_true',
+                        help='cria os índices que faltam e executa ANALYZE')
+    parser.add_argument('--limite', type=int, default=LIMITE_LINHAS,
+                        help='número de linhas a partir do qual uma tabela é considerada grande')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.banco)
+    relatorio = verificar_indices(conn, criar=args.criar, limite=args.limite)
+    if 'erro' in relatorio:
+        raise SystemExit(f"Erro: {relatorio['erro']}")
+    for nome in relatorio['criados']:
+        print(f'Índice criado: {nome}')
+    for alerta in relatorio['varreduras']:
+        print(f"[{alerta['consulta']}] {alerta['plano']} ({alerta['tabela']}: {alerta['linhas']:,} linhas)")
+    if relatorio['faltantes']:
+        print(f"Índices faltantes: {', '.join(relatorio['faltantes'])} (use --criar)")
+    elif not relatorio['varreduras']:
+        print('Nenhuma varredura completa em tabelas grandes.')
@@ -0,0 +1,67 @@
+import json
+import threading
+from collections import deque
+from datetime import datetime
+
+import pandas as pd
+
+# Quantidade máxima de execuções mantidas em memória
+MAX_REGISTROS = 5000
+
+
+class RegistroConsultas:
+    """Histórico das execuções de run_query, compartilhado pelas sessões do processo."""
+
+    def __init__(self, max_registros=MAX_REGISTROS):
+        self._registros = deque(maxlen=max_registros)
+        self._lock = threading.Lock()
+
+    def registrar(self, consulta, segundos, cache_hit, linhas, memoria_bytes, interrompida=False):
+        registro = {
+            'instante': datetime.now().isoformat(timespec='milliseconds'),
+            'consulta': consulta,
+            'segundos': round(segundos, 6),
+            'cache_hit': cache_hit,
+            'linhas': int(linhas),
+            'memoria_bytes': int(memoria_bytes),
+            'interrompida': bool(interrompida),
+        }
+        with self._lock:
+            self._registros.append(registro)
+        return registro
+
+    def registros(self):
+        with self._lock:
+            return list(self._registros)
+
+    def limpar(self):
+        with self._lock:
+            self._registros.clear()
+
+    def como_dataframe(self):
+        return pd.DataFrame(
+            self.registros(),
+            columns=['instante', 'consulta', 'segundos', 'cache_hit', 'linhas', 'memoria_bytes', 'interrompida'],
+        )
+
+    def resumo(self):
+        """Estatísticas por consulta, da mais lenta para a mais rápida."""
+        df = self.como_dataframe()
+        if df.empty:
+            return df
+        resumo = df.groupby('consulta').agg(
+            execucoes=('segundos', 'size'),
+            cache_hits=('cache_hit', 'sum'),
+            segundos_medio=('segundos', 'mean'),
+            segundos_max=('segundos', 'max'),
+            linhas=('linhas', 'last'),
+            memoria_bytes=('memoria_bytes', 'last'),
+            interrupcoes=('interrompida', 'sum'),
+        )
+        resumo['taxa_hit'] = (resumo['cache_hits'] / resumo['execucoes']).round(3)
+        return resumo.sort_values('segundos_max', ascending=False).reset_index()
+
+    def exportar_jsonl(self):
+        return ''.join(
+            json.dumps(registro, ensure_ascii=False) + '\n' for registro in self.registros()
+        )
@@ -0,0 +1,169 @@
+import time
+from collections import Counter
+
+import pandas as pd
+
+import agregados
+from consultas import FILTROS, filtros_ativos, montar_consulta, renderizar
+
+# Subplanos comuns às consultas de uma mesma página, materializados uma única vez
+# por lote em tabelas temporárias quando mais de uma consulta os lê; com um só
+# leitor, entram como CTE na própria consulta. A ordem importa: um subplano pode usar outro.
+SUBPLANOS = {
+    # ETA -> Município -> Estado -> Região, com LEFT JOINs para preservar as
+    # semânticas de cada consulta original (que filtram as chaves nulas)
+    'lote_eta_geo': '''
+        SELECT
+            eta.id_eta,
+            mun.id_municipio,
+            e.id_estado,
+            e.uf,
+            e.nome_estado,
+            r.id_regiao,
+            r.nome_regiao
+        FROM ETA eta
+        INNER JOIN Municipio mun ON mun.id_municipio = eta.id_municipio
+        LEFT JOIN Estado e ON e.id_estado = mun.id_estado
+        LEFT JOIN Regiao r ON r.id_regiao = e.id_regiao
+        ''',
+    # Medições por ETA, já com os filtros da barra lateral
+    'lote_medicao_eta': '''
+        SELECT med.id_eta, COUNT(med.id_medicao) AS medicoes
+        FROM Medicao med
+        WHERE 1 = 1{filtros}
+        GROUP BY med.id_eta
+        ''',
+}
+
+# Versões das consultas de get_consultas() que leem dos subplanos: (sql, subplanos usados)
+CONSULTAS_LOTE = {
+    'metricas_gerais': ('''
+        SELECT
+            'Estados Monitorados' as tipo, COUNT(DISTINCT g.nome_estado) as valor
+        FROM lote_eta_geo g
+        WHERE g.id_estado IS NOT NULL
+        UNION ALL
+        SELECT 'ETAs Ativas', COUNT(*) FROM ETA
+        UNION ALL
+        SELECT 'Total de Medições', COUNT(*) FROM Medicao
+        UNION ALL
+        SELECT 'Parâmetros Monitorados', COUNT(*) FROM Parametro
+        UNION ALL
+        SELECT 'Municípios Atendidos', COUNT(DISTINCT g.id_municipio)
+        FROM lote_eta_geo g
+        ''', ['lote_eta_geo']),
+
+    'etas_estado': ('''
+        SELECT
+            g.uf as "UF",
+            g.nome_estado as "Estado",
+            COUNT(DISTINCT g.id_eta) as "Total ETAs",
+            COUNT(DISTINCT g.id_municipio) as "Municípios com ETA",
+            ROUND(1.0 * COUNT(DISTINCT g.id_eta) / COUNT(DISTINCT g.id_municipio), 2) as "ETAs por Município"
+        FROM lote_eta_geo g
+        WHERE g.id_estado IS NOT NULL
+        GROUP BY g.uf, g.nome_estado
+        HAVING COUNT(DISTINCT g.id_eta) > 0
+        ORDER BY COUNT(DISTINCT g.id_eta) DESC
+        ''', ['lote_eta_geo']),
+
+    'analise_geografica': ('''
+        SELECT
+            g.nome_regiao as "Região",
+            g.uf as "UF",
+            COUNT(DISTINCT g.id_municipio) as "Municípios",
+            COUNT(DISTINCT g.id_eta) as "ETAs Ativas",
+            SUM(m.medicoes) as "Total Medições",
+            ROUND(SUM(m.medicoes) * 1.0 / COUNT(DISTINCT g.id_eta), 0) as "Medições/ETA"
+        FROM lote_eta_geo g
+        INNER JOIN lote_medicao_eta m ON m.id_eta = g.id_eta
+        WHERE g.id_regiao IS NOT NULL
+        GROUP BY g.nome_regiao, g.uf
+        HAVING SUM(m.medicoes) > 0
+        ORDER BY SUM(m.medicoes) DESC
+        ''', ['lote_eta_geo', 'lote_medicao_eta']),
+}
+
+
+def _plano_lote(nomes, usar_rollup):
+    """Decide, para cada consulta, se ela vem do rollup, dos subplanos ou do SQL original."""
+    plano = {}
+    for nome in nomes:
+        if usar_rollup and nome in agregados.CONSULTAS_ROLLUP:
+            plano[nome] = 'rollup'
+        elif nome in CONSULTAS_LOTE:
+            plano[nome] = 'lote'
+        else:
+            plano[nome] = 'original'
+    return plano
+
+
+def _subplanos(plano):
+    """Separa os subplanos lidos pelas consultas 'lote' em (materializar, embutir).
+
+    Só compensa materializar o que mais de uma consulta lê; um subplano sem
+    leitor (ex.: a consulta que o usaria veio do rollup) não é construído.
+    """
+    leitores = Counter(sp for nome, origem in plano.items() if origem == 'lote'
+                       for sp in CONSULTAS_LOTE[nome][1])
+    materializar = [sp for sp in SUBPLANOS if leitores[sp] > 1]
+    embutir = [sp for sp in SUBPLANOS if leitores[sp] == 1]
+    return materializar, embutir
+
+
+def executar_lote(conn, nomes, filtros=None, usar_rollup=False, podar=None):
+    """Executa várias consultas de get_consultas() numa única transação de leitura.
+
+    Os subplanos usados por mais de uma consulta são materializados uma vez em
+    tabelas temporárias. `podar(query, params)`, se dado, reescreve cada SQL
+    antes da execução (ver particoes.podar). Retorna ({nome: DataFrame}, {nome: segundos}).
+    """
+    podar = podar or (lambda query, params: query)
+    plano = _plano_lote(nomes, usar_rollup)
+    subplanos, embutidos = _subplanos(plano)
+    params_subplanos = filtros_ativos(None, filtros, SUBPLANOS['lote_medicao_eta'])
+
+    def _renderizar(subplano):
+        template = SUBPLANOS[subplano]
+        params = params_subplanos if '{filtros}' in template else {}
+        return renderizar(template, FILTROS, params), params
+
+    resultados, tempos = {}, {}
+    # Conexões do pool são query_only; as tabelas temporárias só existem na
+    # base temp, e o mode=ro continua impedindo escritas no banco principal
+    query_only = conn.execute('PRAGMA query_only').fetchone()[0]
+    if subplanos and query_only:
+        conn.execute('PRAGMA query_only = OFF')
+    conn.execute('BEGIN')
+    try:
+        for subplano in subplanos:
+            inicio = time.perf_counter()
+            sql, params = _renderizar(subplano)
+            conn.execute(f'DROP TABLE IF EXISTS temp.{subplano}')
+            conn.execute(f'CREATE TEMP TABLE {subplano} AS {podar(sql, params)}', params)
+            tempos[subplano] = time.perf_counter() - inicio
+
+        for nome in nomes:
+            inicio = time.perf_counter()
+            if plano[nome] == 'rollup':
+                query, params = agregados.montar_consulta(nome, filtros)
+            elif plano[nome] == 'lote':
+                query, usados = CONSULTAS_LOTE[nome]
+                ctes, params = [], {}
+                for subplano in (sp for sp in embutidos if sp in usados):
+                    sql, params_cte = _renderizar(subplano)
+                    ctes.append(f'{subplano} AS ({sql})')
+                    params.update(params_cte)
+                if ctes:
+                    query = f'WITH {", ".join(ctes)} {query}'
+            else:
+                query, params = montar_consulta(nome, filtros)
+            resultados[nome] = pd.read_sql_query(podar(query, params), conn, params=params)
+            tempos[nome] = time.perf_counter() - inicio
+    finally:
+        for subplano in subplanos:
+            conn.execute(f'DROP TABLE IF EXISTS temp.{subplano}')
+        conn.commit()
+        if subplanos and query_only:
+            conn.execute('PRAGMA query_only = ON')
+    return resultados, tempos
@@ -0,0 +1,381 @@
+import argparse
+import itertools
+import multiprocessing
+import os
+import re
+import sys
+import threading
+import time
+import types
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+
+import colunar
+import conexoes
+import particoes
+import posagregacoes
+from consultas import get_consultas, montar_consulta
+
+try:
+    import duckdb
+except ImportError:  # DuckDB é opcional: sem ele, só o motor SQLite fica disponível
+    duckdb = None
+
+# :nome (SQLite) -> $nome (DuckDB), sem confundir com ::tipo ou com texto entre aspas simples
+_PARAMETRO_NOMEADO = re.compile(r"('(?:[^']|'')*')|(?<![:\w]):([A-Za-z_]\w*)")
+# O LIKE do SQLite ignora maiúsculas/minúsculas em ASCII; o do DuckDB não
+_LIKE = re.compile(r'\bLIKE\b', re.IGNORECASE)
+
+# Tipos inteiros do DuckDB que o pandas recebe como float64 (ex.: SUM de BIGINT)
+_INTEIROS_LARGOS = {'HUGEINT', 'UHUGEINT'}
+
+# Intervalo, em segundos, entre as verificações de prazo e cancelamento enquanto
+# uma consulta roda num processo trabalhador
+INTERVALO_VERIFICACAO = 0.1
+# Últimas consultas canceladas que os trabalhadores do MotorProcessos conferem
+# (inclusive as que ainda esperam na fila do executor)
+CANCELADAS_RECENTES = 64
+
+
+def duckdb_disponivel():
+    return duckdb is not None
+
+
+def adaptar_sql(query):
+    """Traduz o dialeto das consultas do painel (SQLite) para o DuckDB."""
+    def trocar(m):
+        return m.group(1) or f'${m.group(2)}'
+    return _LIKE.sub('ILIKE', _PARAMETRO_NOMEADO.sub(trocar, query))
+
+
+class MotorSQLite:
+    """Motor padrão: executa as consultas numa conexão do pool somente leitura."""
+
+    nome = 'sqlite'
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def executar(self, query, params=None, pos=None):
+        with self.pool.conexao() as conn:
+            df = pd.read_sql_query(query, conn, params=params)
+        return posagregacoes.aplicar(pos, df)
+
+
+class MotorDuckDB:
+    """Motor analítico em processo (vetorizado e multithread) sobre o mesmo banco.
+
+    O sisagua.db é anexado pela extensão sqlite do DuckDB; quando ela não está
+    disponível (ex.: sem acesso à rede para instalá-la), as tabelas são copiadas
+    para a memória em lotes Arrow. Consultas que o DuckDB não aceita voltam para
+    o motor de reserva (SQLite) e ficam registradas em `nao_suportadas`.
+    """
+
+    nome = 'duckdb'
+
+    def __init__(self, caminho='sisagua.db', reserva=None, threads=None):
+        if duckdb is None:
+            raise RuntimeError('duckdb não está instalado (pip install duckdb)')
+        self.caminho = caminho
+        self.reserva = reserva
+        self.nao_suportadas = set()
+        self._lock = threading.Lock()
+        self.conn = duckdb.connect(':memory:')
+        if threads:
+            self.conn.execute(f'SET threads = {int(threads)}')
+        self.modo = self._anexar() or self._carregar()
+
+    def _anexar(self):
+        caminho = str(self.caminho).replace("'", "''")
+        try:
+            self.conn.execute(f"ATTACH '{caminho}' AS sisagua (TYPE SQLITE, READ_ONLY)")
+            registradas = self._particoes()
+            if not registradas:
+                self.conn.execute('USE sisagua')
+                return 'anexado'
+            # Como no SQLite: cada arquivo de partição anexado com o nome de
+            # particoes.esquema() (as consultas podadas leem medicao_<ano>.Medicao)
+            # e uma view Medicao sobre todos eles, encontrada antes da tabela do
+            # banco principal
+            partes = ['SELECT * FROM sisagua.Medicao']
+            for arquivo in dict.fromkeys(registradas.values()):
+                alvo = str(Path(self.caminho).parent / arquivo).replace("'", "''")
+                self.conn.execute(f"ATTACH '{alvo}' AS {particoes.esquema(arquivo)} (TYPE SQLITE, READ_ONLY)")
+                partes.append(f'SELECT * FROM {particoes.esquema(arquivo)}.Medicao')
+            self.conn.execute('CREATE VIEW memory.main.Medicao AS ' + ' UNION ALL '.join(partes))
+            self.conn.execute("SET search_path = 'memory.main,sisagua.main'")
+        except duckdb.Error:
+            return None
+        return 'anexado'
+
+    def _particoes(self):
+        origem = conexoes.abrir_somente_leitura(self.caminho)
+        try:
+            return particoes.particoes(origem)
+        finally:
+            origem.close()
+
+    def _carregar(self):
+        origem = conexoes.abrir_somente_leitura(self.caminho)
+        try:
+            tabelas = [tabela for (tabela,) in origem.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+            )]
+            for tabela in tabelas:
+                esquema = colunar.esquema_arrow(origem, tabela, dicionario=False)
+                self.conn.register('_lote', esquema.empty_table())
+                self.conn.execute(f'CREATE TABLE "{tabela}" AS SELECT * FROM _lote')
+                for lote in colunar.ler_em_lotes(origem, tabela, esquema):
+                    self.conn.register('_lote', pa.Table.from_batches([lote]))
+                    self.conn.execute(f'INSERT INTO "{tabela}" SELECT * FROM _lote')
+                self.conn.unregister('_lote')
+            # A Medicao copiada já reúne as partições (lida pela view); os nomes
+            # usados pelas consultas podadas viram filtros sobre ela
+            arquivos = {}
+            for ano, arquivo in particoes.particoes(origem).items():
+                arquivos.setdefault(particoes.esquema(arquivo), []).append(str(int(ano)))
+            for nome, anos in arquivos.items():
+                self.conn.execute(f'CREATE SCHEMA {nome}')
+                self.conn.execute(f'CREATE VIEW {nome}.Medicao AS '
+                                  f'SELECT * FROM main.Medicao WHERE ano_referencia IN ({", ".join(anos)})')
+        finally:
+            origem.close()
+        return 'carregado'
+
+    def executar(self, query, params=None, pos=None):
+        return posagregacoes.aplicar(pos, self._executar(query, params))
+
+    def _executar(self, query, params=None):
+        if self.reserva is not None and query in self.nao_suportadas:
+            return self.reserva.executar(query, params)
+        try:
+            # Um cursor por chamada: o DuckDB paraleliza cada consulta internamente
+            with self._lock:
+                cursor = self.conn.cursor()
+            # O orçamento da thread (conexoes.orcamento) vira um interrupt no prazo
+            conexoes.verificar_orcamento()
+            restante = conexoes.prazo_restante()
+            cronometro = threading.Timer(restante, cursor.interrupt) if restante is not None else None
+            try:
+                if cronometro is not None:
+                    cronometro.start()
+                cursor.execute(adaptar_sql(query), params or None)
+                tipos = [str(coluna[1]) for coluna in cursor.description]
+                df = cursor.fetchdf()
+            finally:
+                if cronometro is not None:
+                    cronometro.cancel()
+                cursor.close()
+        except duckdb.InterruptException:
+            conexoes.verificar_orcamento()
+            raise
+        except duckdb.Error:
+            if self.reserva is None:
+                raise
+            self.nao_suportadas.add(query)
+            return self.reserva.executar(query, params)
+        if df.empty:
+            # Como no pandas sobre o sqlite3: sem linhas, as colunas ficam object
+            return df.astype(object)
+        for coluna, tipo in zip(df.columns, tipos):
+            if tipo in _INTEIROS_LARGOS and df[coluna].notna().all():
+                df[coluna] = df[coluna].astype('int64')
+        return df
+
+    def fechar(self):
+        self.conn.close()
+
+
+# Estado de cada processo trabalhador do MotorProcessos
+_trabalhador = {}
+
+
+def _iniciar_trabalhador(caminho, canceladas):
+    _trabalhador['pool'] = conexoes.PoolConexoes(caminho, tamanho=1)
+    _trabalhador['canceladas'] = canceladas
+
+
+def _escrever_stream(tabela, destino):
+    # Em função própria: ao retornar, nenhum objeto do Arrow aponta mais para
+    # `destino`, e a área compartilhada pode ser fechada
+    with pa.ipc.new_stream(destino, tabela.schema) as writer:
+        writer.write_table(tabela)
+
+
+def _executar_no_trabalhador(tarefa, query, params, pos, segundos):
+    """Roda a consulta e a pós-agregação e grava o resultado, em formato de
+    stream Arrow, numa área de memória compartilhada. Retorna (nome, bytes).
+
+    A consulta é abortada se o painel desistir dela (MotorProcessos.executar
+    grava `tarefa` entre as canceladas), e o trabalhador fica livre.
+    """
+    canceladas = _trabalhador['canceladas']
+    with conexoes.orcamento(segundos, lambda: tarefa in canceladas[:]):
+        with _trabalhador['pool'].conexao() as conn:
+            df = pd.read_sql_query(query, conn, params=params)
+    tabela = pa.Table.from_pandas(posagregacoes.aplicar(pos, df), preserve_index=False)
+    contador = pa.MockOutputStream()
+    _escrever_stream(tabela, contador)
+    tamanho = contador.size()
+    memoria = shared_memory.SharedMemory(create=True, size=max(tamanho, 1))
+    try:
+        _escrever_stream(tabela, pa.FixedSizeBufferWriter(pa.py_buffer(memoria.buf)))
+    except BaseException:
+        memoria.close()
+        memoria.unlink()
+        raise
+    memoria.close()
+    return memoria.name, tamanho
+
+
+def _ler_resultado(nome, tamanho):
+    memoria = shared_memory.SharedMemory(name=nome)
+    try:
+        # Copia o stream antes de liberar a área: as colunas do DataFrame podem
+        # apontar direto para os buffers Arrow
+        dados = pa.py_buffer(bytes(memoria.buf[:tamanho]))
+    finally:
+        memoria.close()
+        memoria.unlink()
+    return pa.ipc.open_stream(dados).read_all().to_pandas()
+
+
+def _descartar(futuro):
+    # Resultado que ninguém mais espera (consulta cancelada ou fora do prazo)
+    if not futuro.cancelled() and futuro.exception() is None:
+        nome, _ = futuro.result()
+        memoria = shared_memory.SharedMemory(name=nome)
+        memoria.close()
+        memoria.unlink()
+
+
+@contextmanager
+def _sem_modulo_principal():
+    # O Streamlit executa o script do painel como __main__, e o spawn o
+    # reexecutaria em cada trabalhador; eles só precisam deste módulo
+    principal = sys.modules['__main__']
+    sys.modules['__main__'] = types.ModuleType('__main__')
+    try:
+        yield
+    finally:
+        sys.modules['__main__'] = principal
+
+
+class MotorProcessos:
+    """Motor que executa as consultas e as pós-agregações em processos trabalhadores.
+
+    O pandas (montagem do DataFrame, groupby) prende o GIL; em processos
+    separados, consultas pesadas não travam as demais sessões do servidor e as
+    páginas usam vários núcleos. Cada trabalhador tem sua conexão somente
+    leitura; o resultado volta como stream Arrow numa área de memória
+    compartilhada (pelo pipe do pool passa só o nome dela). O orçamento da
+    thread que chamou (conexoes.orcamento) vale também no trabalhador: o prazo
+    segue com a consulta, e o cancelamento chega por um vetor compartilhado com
+    os números das consultas canceladas.
+    """
+
+    nome = 'processos'
+
+    def __init__(self, caminho='sisagua.db', processos=None):
+        self.caminho = caminho
+        self.processos = processos or os.cpu_count() or 4
+        # spawn: o servidor tem várias threads, e fork copiaria travas seguradas por elas
+        contexto = multiprocessing.get_context('spawn')
+        self.canceladas = contexto.Array('q', CANCELADAS_RECENTES, lock=False)
+        self._tarefas = itertools.count(1)
+        self._proxima_cancelada = itertools.count()
+        self.executor = ProcessPoolExecutor(
+            self.processos, mp_context=contexto,
+            initializer=_iniciar_trabalhador, initargs=(str(caminho), self.canceladas),
+        )
+        # Todos os trabalhadores sobem já aqui (o executor só cria processos
+        # enquanto não tem todos), com as conexões abertas e o pandas importado
+        with _sem_modulo_principal():
+            iniciados = [self.executor.submit(os.getpid) for _ in range(self.processos)]
+        for futuro in iniciados:
+            futuro.result()
+
+    def executar(self, query, params=None, pos=None):
+        conexoes.verificar_orcamento()
+        tarefa = next(self._tarefas)
+        futuro = self.executor.submit(_executar_no_trabalhador, tarefa, query, params, pos,
+                                      conexoes.prazo_restante())
+        try:
+            while True:
+                try:
+                    nome, tamanho = futuro.result(timeout=INTERVALO_VERIFICACAO)
+                    break
+                except TimeoutError:
+                    conexoes.verificar_orcamento()
+        except conexoes.ConsultaInterrompida:
+            if not futuro.cancel():
+                self._cancelar(tarefa)
+            futuro.add_done_callback(_descartar)
+            raise
+        return _ler_resultado(nome, tamanho)
+
+    def _cancelar(self, tarefa):
+        # O trabalhador confere o vetor no progress handler do SQLite e aborta
+        # a consulta; as posições são reaproveitadas em rodízio
+        self.canceladas[next(self._proxima_cancelada) % CANCELADAS_RECENTES] = tarefa
+
+    def fechar(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def comparar_motores(motores, nomes=None, filtros=None, repeticoes=3):
+    """Mede cada consulta de get_consultas() em cada motor (melhor de N execuções).
+
+    Retorna um DataFrame com os segundos por motor e o speedup do segundo motor
+    em relação ao primeiro.
+    """
+    nomes = nomes or list(get_consultas())
+    base, alvo = motores[0].nome, motores[-1].nome
+    linhas = []
+    for nome in nomes:
+        query, params = montar_consulta(nome, filtros)
+        linha = {'consulta': nome}
+        for motor in motores:
+            tempos = []
+            for _ in range(repeticoes):
+                inicio = time.perf_counter()
+                motor.executar(query, params)
+                tempos.append(time.perf_counter() - inicio)
+            linha[f'{motor.nome}_s'] = min(tempos)
+        linha['speedup'] = linha[f'{base}_s'] / max(linha[f'{alvo}_s'], 1e-9)
+        linha['reserva'] = query in getattr(motores[-1], 'nao_suportadas', ())
+        linhas.append(linha)
+    return pd.DataFrame(linhas)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compara o motor SQLite com o DuckDB ou o de processos '
+                                                 'nas consultas do painel')
+    parser.add_argument('banco', nargs='?', default='sisagua.db')
+    parser.add_argument('--motor', choices=['duckdb', 'processos'], default='duckdb')
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--threads', type=int, help='threads do DuckDB (padrão: todos os núcleos)')
+    parser.add_argument('--processos', type=int, help='processos trabalhadores (padrão: um por núcleo)')
+    args = parser.parse_args()
+
+    # Os trabalhadores recebem as funções pelo nome do módulo: executado como
+    # script, este módulo é __main__, que o spawn não encontra nos trabalhadores
+    import motores
+
+    pool = conexoes.PoolConexoes(args.banco, tamanho=1)
+    sqlite = MotorSQLite(pool)
+    inicio = time.perf_counter()
+    if args.motor == 'processos':
+        motor = motores.MotorProcessos(args.banco, args.processos)
+        print(f'{motor.processos} processos trabalhadores')
+    else:
+        if not duckdb_disponivel():
+            raise SystemExit('duckdb não está instalado (pip install duckdb)')
+        motor = MotorDuckDB(args.banco, reserva=sqlite, threads=args.threads)
+        print(f'DuckDB pronto em {time.perf_counter() - inicio:.2f}s (modo: {motor.modo})')
+    print(comparar_motores([sqlite, motor], repeticoes=args.repeticoes).to_string(index=False))
@@ -0,0 +1,278 @@
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import stat
+import time
+from pathlib import Path
+
+import alteracoes
+import cache_resultados
+
+# Medicao particionada por ano: os anos fechados saem do banco principal para
+# arquivos SQLite (<banco>_medicao_<ano>.db, ou <banco>_medicao_<ano>_<ano>.db
+# quando um arquivo reúne vários anos), anexados em toda conexão e reunidos com
+# o ano aberto numa view temporária chamada Medicao. As consultas de
+# get_consultas() continuam funcionando sem alteração; as que filtram um ano são
+# reescritas por podar() para ler só o arquivo desse ano.
+REGISTRO = 'particao_medicao'
+
+# O SQLite anexa no máximo 10 bancos por conexão (SQLITE_MAX_ATTACHED padrão).
+# Um fica livre para o arquivo novo que fechar_anos() anexa; passando disso, os
+# anos mais antigos a fechar dividem um mesmo arquivo (ver _agrupar).
+MAX_ARQUIVOS = 9
+ESQUEMA_REGISTRO = f'''
+CREATE TABLE IF NOT EXISTS {REGISTRO} (
+    ano INTEGER PRIMARY KEY,
+    arquivo TEXT NOT NULL,
+    linhas INTEGER NOT NULL,
+    fechada_em TEXT NOT NULL
+)
+'''
+
+# Referências à tabela nas consultas (não casa com id_medicao, rollup_medicao
+# nem com "Total Medições")
+_TABELA_MEDICAO = re.compile(r'(?<![\w.])Medicao\b')
+
+
+def esquema(arquivo):
+    """Nome do banco anexado com o arquivo de partição (medicao_<ano> ou medicao_<ano>_<ano>)."""
+    return re.search(r'medicao_\d+(?:_\d+)?(?=\.db$)', str(arquivo)).group(0)
+
+
+def arquivo_particao(banco, inicio, fim=None):
+    banco = Path(banco)
+    anos = f'{int(inicio)}_{int(fim)}' if fim is not None and fim != inicio else f'{int(inicio)}'
+    return banco.with_name(f'{banco.stem}_medicao_{anos}.db')
+
+
+def _tem_registro(conn):
+    return conn.execute(
+        "SELECT COUNT(*) FROM main.sqlite_master WHERE type = 'table' AND name = ?", (REGISTRO,)
+    ).fetchone()[0] > 0
+
+
+def particoes(conn):
+    """{ano: arquivo} das partições registradas no banco principal."""
+    if not _tem_registro(conn):
+        return {}
+    return dict(conn.execute(f'SELECT ano, arquivo FROM main.{REGISTRO} ORDER BY ano'))
+
+
+def anexar(conn, banco, somente_leitura=False):
+    """Anexa as partições e cria a view temporária Medicao sobre todas elas.
+
+    Em conexões somente leitura (abertas com uri=True), as partições são
+    anexadas com immutable=1: o SQLite não as trava nem confere mudanças, já
+    que os anos fechados nunca são alterados. Retorna os anos anexados.
+    """
+    registradas = particoes(conn)
+    if not registradas:
+        return []
+    anexadas = {nome for _, nome, _ in conn.execute('PRAGMA database_list')}
+    colunas = [linha[1] for linha in conn.execute('PRAGMA main.table_info(Medicao)')]
+    selecao = ', '.join(colunas)
+    partes = [f'SELECT {selecao} FROM main.Medicao']
+    for arquivo in dict.fromkeys(registradas.values()):
+        caminho = Path(banco).parent / arquivo
+        if esquema(arquivo) not in anexadas:
+            if somente_leitura:
+                alvo = caminho.absolute().as_uri() + '?mode=ro&immutable=1'
+            else:
+                alvo = str(caminho)
+            conn.execute('ATTACH DATABASE ? AS ' + esquema(arquivo), (alvo,))
+        partes.append(f'SELECT {selecao} FROM {esquema(arquivo)}.Medicao')
+    conn.execute('DROP VIEW IF EXISTS temp.Medicao')
+    conn.execute('CREATE TEMP VIEW Medicao AS ' + ' UNION ALL '.join(partes))
+    return list(registradas)
+
+
+def esquemas_anexados(conn):
+    """Nomes dos bancos de partição anexados à conexão."""
+    return [nome for _, nome, _ in conn.execute('PRAGMA database_list') if re.fullmatch(r'medicao_\d+(?:_\d+)?', nome)]
+
+
+def anos_fechados(conn):
+    """Anos que estão inteiros numa partição (nenhuma linha do ano no banco principal)."""
+    registradas = particoes(conn)
+    if not registradas:
+        return frozenset()
+    abertos = {ano for (ano,) in conn.execute('SELECT DISTINCT ano_referencia FROM main.Medicao')}
+    return frozenset(set(registradas) - abertos)
+
+
+def podar(query, params, fechados, registradas):
+    """Reescreve a consulta para ler só a partição do ano filtrado.
+
+    `params` são os filtros efetivos da consulta (os de montar_consulta): sem
+    filtro de ano, nenhuma referência à Medicao é filtrada por ano e a view
+    inteira é usada. Com um ano fechado, Medicao vira a tabela do arquivo da
+    partição (o filtro de ano da consulta separa o ano quando o arquivo reúne
+    vários); com um ano sem partição, main.Medicao. Um ano dividido entre a
+    partição e o banco principal (linhas que chegaram depois do fechamento) usa a view.
+    """
+    ano = (params or {}).get('ano')
+    if ano is None or not registradas:
+        return query
+    if ano in fechados:
+        alvo = f'{esquema(registradas[ano])}.Medicao'
+    elif ano not in registradas:
+        alvo = 'main.Medicao'
+    else:
+        return query
+    return _TABELA_MEDICAO.sub(alvo, query)
+
+
+def versao(params, versoes, impressao):
+    """Versão do resultado: a do ano fechado quando a consulta se restringe a ele."""
+    return versoes.get((params or {}).get('ano'), impressao)
+
+
+def _tabelas_dimensao(conn):
+    return [nome for (nome,) in conn.execute(
+        "SELECT name FROM main.sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' "
+        "AND name NOT LIKE 'rollup_%' AND name NOT LIKE 'esboco_%' AND name NOT LIKE 'cubo_%' "
+        "AND name NOT IN ('Medicao', ?, ?) ORDER BY name", (REGISTRO, alteracoes.TABELA)
+    )]
+
+
+def impressao_fechada(conn, banco, ano):
+    """Versão dos resultados restritos a um ano fechado.
+
+    Depende só do arquivo da partição (imutável) e das tabelas de dimensão
+    (linhas, maior rowid e alterações contadas por alteracoes.py): cargas no
+    ano aberto não a alteram, e os resultados do ano fechado ficam válidos no
+    cache indefinidamente.
+    """
+    arquivo = Path(banco).parent / particoes(conn)[ano]
+    contadas = alteracoes.contagens(conn)
+    partes = []
+    for tabela in _tabelas_dimensao(conn):
+        linhas, max_rowid = conn.execute(
+            f'SELECT COUNT(*), COALESCE(MAX(rowid), 0) FROM main.{tabela}'
+        ).fetchone()
+        partes.append(f'{tabela}:{linhas}:{max_rowid}:{contadas.get(tabela, 0)}')
+    info = arquivo.stat()
+    partes.append(f'{ano}:{info.st_mtime_ns}:{info.st_size}')
+    digest = hashlib.sha1('|'.join(partes).encode()).hexdigest()[:16]
+    return f'{cache_resultados.PREFIXO_PERMANENTE}{int(ano)}-{digest}'
+
+
+def _ddl_medicao(conn):
+    tabela = conn.execute(
+        "SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = 'Medicao'"
+    ).fetchone()[0]
+    indices = [sql for (sql,) in conn.execute(
+        "SELECT sql FROM main.sqlite_master WHERE type = 'index' AND tbl_name = 'Medicao' AND sql IS NOT NULL"
+    )]
+    return tabela, indices
+
+
+def fechar_anos(conn, banco, anos):
+    """Move as linhas dos anos de main.Medicao para um novo arquivo de partição.
+
+    A partição recebe a mesma estrutura e os mesmos índices da Medicao e fica
+    somente leitura no sistema de arquivos. Retorna {ano: linhas movidas}.
+    """
+    anos = sorted(anos)
+    destino = arquivo_particao(banco, anos[0], anos[-1])
+    if destino.exists():
+        raise FileExistsError(f'{destino} já existe')
+    tabela, indices = _ddl_medicao(conn)
+    nome = esquema(destino)
+    conn.execute('ATTACH DATABASE ? AS ' + nome, (str(destino),))
+    concluido = False
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(re.sub(r'CREATE TABLE\s+"?Medicao"?', f'CREATE TABLE {nome}.Medicao', tabela, count=1))
+            linhas = {}
+            for ano in anos:
+                linhas[ano] = conn.execute(
+                    f'INSERT INTO {nome}.Medicao SELECT * FROM main.Medicao WHERE ano_referencia = ?', (ano,)
+                ).rowcount
+            for sql in indices:
+                conn.execute(re.sub(r'CREATE INDEX\s+', f'CREATE INDEX {nome}.', sql, count=1))
+            conn.execute(f'ANALYZE {nome}')
+            conn.execute(ESQUEMA_REGISTRO)
+            fechada_em = time.strftime('%Y-%m-%dT%H:%M:%S')
+            for ano in anos:
+                conn.execute('DELETE FROM main.Medicao WHERE ano_referencia = ?', (ano,))
+                conn.execute(f'INSERT INTO main.{REGISTRO} VALUES (?, ?, ?, ?)',
+                             (ano, destino.name, linhas[ano], fechada_em))
+            conn.commit()
+            concluido = True
+        except BaseException:
+            conn.rollback()
+            raise
+    finally:
+        conn.execute('DETACH DATABASE ' + nome)
+        if not concluido:
+            destino.unlink(missing_ok=True)
+    os.chmod(destino, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+    return linhas
+
+
+def _agrupar(anos, livres):
+    """Divide os anos a fechar (em ordem) em no máximo `livres` arquivos: os mais
+    antigos dividem o primeiro, os recentes ficam um por arquivo."""
+    if not anos:
+        return []
+    if livres < 1:
+        raise ValueError(f'já há {MAX_ARQUIVOS} arquivos de partição, o máximo que uma conexão '
+                         f'do SQLite consegue anexar; não é possível fechar {", ".join(map(str, anos))}')
+    juntos = max(len(anos) - livres + 1, 1)
+    return [anos[:juntos]] + [[ano] for ano in anos[juntos:]]
+
+
+def particionar(conn, banco, ate_ano=None, progresso=None):
+    """Fecha todos os anos até `ate_ano` (padrão: todos menos o mais recente).
+
+    Cada ano vai para um arquivo próprio enquanto o total de arquivos couber
+    em MAX_ARQUIVOS; além disso, os anos mais antigos são reunidos num só.
+    Anos já fechados são ignorados. Retorna {ano: linhas movidas}.
+    """
+    anos = [ano for (ano,) in conn.execute(
+        'SELECT DISTINCT ano_referencia FROM main.Medicao WHERE ano_referencia IS NOT NULL ORDER BY 1'
+    )]
+    if ate_ano is None:
+        ate_ano = max(anos) - 1 if anos else None
+    registradas = particoes(conn)
+    # Linhas de um ano fechado que chegaram depois ficam no banco principal
+    a_fechar = [ano for ano in anos if ate_ano is not None and ano <= ate_ano and ano not in registradas]
+    movidas = {}
+    for grupo in _agrupar(a_fechar, MAX_ARQUIVOS - len(set(registradas.values()))):
+        for ano, linhas in fechar_anos(conn, banco, grupo).items():
+            movidas[ano] = linhas
+            if progresso:
+                progresso(ano, linhas)
+    return movidas
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Particiona a Medicao do sisagua.db em arquivos por ano fechado '
+                                     f'(no máximo {MAX_ARQUIVOS}, o limite de bancos anexados do SQLite)')
+    parser.add_argument('banco', nargs='?', default='sisagua.db')
+    parser.add_argument('--ate-ano', type=int, help='último ano a fechar (padrão: todos menos o mais recente)')
+    parser.add_argument('--vacuum', action='store_true', help='compacta o banco principal depois de mover as linhas')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.banco)
+    inicio = time.perf_counter()
+    try:
+        movidas = particionar(conn, args.banco, args.ate_ano,
+                              progresso=lambda ano, linhas: print(f'{ano}: {linhas:,} linhas -> '
+                                                                  f'{particoes(conn)[ano]}'))
+    except ValueError as e:
+        raise SystemExit(f'Erro: {e}')
+    if args.vacuum and movidas:
+        conn.execute('VACUUM')
+    if not movidas:
+        print('Nenhum ano a fechar.')
+    else:
+        print(f'{len(movidas)} anos fechados em {time.perf_counter() - inicio:.1f}s; '
+              f'{sum(movidas.values()):,} linhas movidas.')
+    registradas = particoes(conn)
+    restantes = conn.execute('SELECT COUNT(*) FROM main.Medicao').fetchone()[0]
+    print(f'Partições: {", ".join(map(str, registradas)) or "nenhuma"}; {restantes:,} linhas no banco principal.')
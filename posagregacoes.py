@@ -0,0 +1,61 @@
+import pandas as pd
+
+# Resumos em pandas feitos sobre o resultado de uma consulta nomeada. Ficam
+# registrados por nome para que o motor de processos (motores.MotorProcessos)
+# os execute no trabalhador, junto com a consulta; os demais motores os aplicam
+# no próprio processo. Todos devolvem um DataFrame sem índice (como o cache em
+# disco guarda).
+
+
+def totais_regiao(df):
+    """analise_geografica: medições somadas por região."""
+    return df.groupby('Região', observed=True)['Total Medições'].sum().reset_index()
+
+
+def resumo_regiao(df):
+    """analise_geografica: totais e médias por região."""
+    return df.groupby('Região', observed=True).agg({
+        'Total Medições': 'sum',
+        'ETAs Ativas': 'sum',
+        'Medições/ETA': 'mean',
+        'Municípios': 'sum'
+    }).round(1).reset_index()
+
+
+def resumo_periodo(df):
+    """evolucao_temporal: registros, intensidade e diversidade por região e período."""
+    return df.groupby(['Região', 'Período'], observed=True).agg({
+        'Total de Registros': 'sum',
+        'Intensidade (Reg/ETA)': 'mean',
+        'Diversidade (Par/ETA)': 'mean'
+    }).round(2).reset_index()
+
+
+def metricas_regiao(df):
+    """evolucao_temporal: médias e desvios mensais por região, com as colunas achatadas."""
+    resumo = df.groupby('Região', observed=True).agg({
+        'Total de Registros': ['sum', 'mean'],
+        'ETAs Ativas': 'mean',
+        'Parâmetros Distintos': 'mean',
+        'Intensidade (Reg/ETA)': ['mean', 'std'],
+        'Diversidade (Par/ETA)': ['mean', 'std']
+    }).round(2)
+    resumo.columns = ['_'.join(col).strip() for col in resumo.columns]
+    return resumo.reset_index()
+
+
+POS_AGREGACOES = {
+    'totais_regiao': totais_regiao,
+    'resumo_regiao': resumo_regiao,
+    'resumo_periodo': resumo_periodo,
+    'metricas_regiao': metricas_regiao,
+}
+
+
+def aplicar(pos, df):
+    """O resultado da pós-agregação `pos` sobre df (df inalterado se pos for None)."""
+    if pos is None:
+        return df
+    if df.empty:
+        return pd.DataFrame()
+    return POS_AGREGACOES[pos](df)
@@ -0,0 +1,319 @@
+import argparse
+import itertools
+import sqlite3
+import time
+from pathlib import Path
+
+import numpy as np
+
+import agregados
+import alteracoes
+import carga
+import conexoes
+import indices
+
+# Tamanhos de referência da tabela Medicao para os benchmarks de escala
+ESCALAS = {'1M': 1_000_000, '10M': 10_000_000, '100M': 100_000_000}
+
+# Municípios por UF (IBGE, 2022) e UFs de cada região
+MUNICIPIOS_POR_UF = {
+    'AC': 22, 'AL': 102, 'AP': 16, 'AM': 62, 'BA': 417, 'CE': 184, 'DF': 1, 'ES': 78,
+    'GO': 246, 'MA': 217, 'MT': 141, 'MS': 79, 'MG': 853, 'PA': 144, 'PB': 223, 'PR': 399,
+    'PE': 185, 'PI': 224, 'RJ': 92, 'RN': 167, 'RS': 497, 'RO': 52, 'RR': 15, 'SC': 295,
+    'SP': 645, 'SE': 75, 'TO': 139,
+}
+REGIOES = {
+    'Norte': ['AC', 'AM', 'AP', 'PA', 'RO', 'RR', 'TO'],
+    'Nordeste': ['AL', 'BA', 'CE', 'MA', 'PB', 'PE', 'PI', 'RN', 'SE'],
+    'Centro-Oeste': ['DF', 'GO', 'MS', 'MT'],
+    'Sudeste': ['ES', 'MG', 'RJ', 'SP'],
+    'Sul': ['PR', 'RS', 'SC'],
+}
+
+# Tecnologia de tratamento das ETAs e sua frequência (vazio = não informado)
+TECNOLOGIAS = [
+    ('Filtração rápida', 0.52), ('Simples desinfecção', 0.23), ('Filtração direta', 0.14),
+    ('Filtração lenta', 0.06), ('', 0.05),
+]
+# Operador do sistema de cada município: companhia estadual, autarquia municipal ou concessão
+OPERADORES = [('estadual', 0.70), ('municipal', 0.22), ('privado', 0.08)]
+GRUPOS_PRIVADOS = 12
+
+PONTOS = [
+    ('Saída', 'Saída do tratamento', 0.55),
+    ('Rede', 'Sistema de distribuição', 0.40),
+    ('Captação', 'Ponto de captação', 0.05),
+]
+
+# Parâmetros: (nome, unidade, frequência, campos). Cada campo é (nome, fração
+# das amostras que ele conta); os nomes são os mesmos usados em get_consultas().
+CAMPO_AMOSTRAS = 'Número de amostras'
+PARAMETROS = [
+    ('Cloro Residual Livre (mg/L)', 'mg/L', 0.26, [
+        (CAMPO_AMOSTRAS, 1.0),
+        ('Número de dados >= 2,0 mg/L e <= 5,0mg/L', 0.88),
+        ('Número de dados < 0,2 mg/L', 0.09),
+        ('Número de dados > 5,0 mg/L', 0.03),
+    ]),
+    ('Turbidez (uT)', 'uT', 0.22, [
+        (CAMPO_AMOSTRAS, 1.0),
+        ('Número de dados <= 5,0 uT', 0.95),
+        ('Número de dados > 5,0 uT', 0.05),
+    ]),
+    ('Cor (uH)', 'uH', 0.14, [
+        (CAMPO_AMOSTRAS, 1.0),
+        ('Número de dados <= 15,0 uH', 0.93),
+        ('Número de dados > 15,0 uH', 0.07),
+    ]),
+    ('pH', None, 0.14, [
+        (CAMPO_AMOSTRAS, 1.0),
+        ('Número de dados >= 6,0 e <= 9,0', 0.94),
+        ('Número de dados < 6,0', 0.04),
+        ('Número de dados > 9,0', 0.02),
+    ]),
+    ('Coliformes totais', None, 0.12, [
+        (CAMPO_AMOSTRAS, 1.0),
+        ('Número de amostras com presença', 0.04),
+    ]),
+    ('Escherichia coli', None, 0.08, [
+        (CAMPO_AMOSTRAS, 1.0),
+        ('Número de amostras com presença', 0.01),
+    ]),
+    ('Fluoreto (mg/L)', 'mg/L', 0.04, [
+        (CAMPO_AMOSTRAS, 1.0),
+        ('Número de dados <= 1,5 mg/L', 0.97),
+        ('Número de dados > 1,5 mg/L', 0.03),
+    ]),
+]
+# Crescimento anual do número de registros (adesão crescente ao sistema)
+CRESCIMENTO_ANUAL = 0.06
+
+
+def _cumulativa(pesos):
+    pesos = np.asarray(pesos, dtype=float)
+    return np.cumsum(pesos / pesos.sum())
+
+
+def _sortear(rng, cumulativa, n):
+    """Índices sorteados segundo a distribuição acumulada (mais rápido que rng.choice com p)."""
+    return np.minimum(np.searchsorted(cumulativa, rng.random(n), side='right'), len(cumulativa) - 1)
+
+
+def _dimensoes(conn, rng):
+    """Insere as tabelas de dimensão e devolve os arrays usados para sortear as medições."""
+    nomes_regiao = list(REGIOES)
+    conn.executemany('INSERT INTO Regiao (id_regiao, nome_regiao) VALUES (?, ?)',
+                     list(enumerate(nomes_regiao, 1)))
+    regiao_da_uf = {uf: nomes_regiao.index(regiao) + 1 for regiao, ufs in REGIOES.items() for uf in ufs}
+    ufs = sorted(MUNICIPIOS_POR_UF)
+    conn.executemany(
+        'INSERT INTO Estado (id_estado, uf, nome_estado, id_regiao) VALUES (?, ?, ?, ?)',
+        [(i, uf, carga.NOMES_ESTADOS[uf], regiao_da_uf[uf]) for i, uf in enumerate(ufs, 1)])
+
+    instituicoes, escritorios, municipios, etas = [], [], [], []
+
+    def instituicao(nome, tipo):
+        instituicoes.append((len(instituicoes) + 1, nome, tipo))
+        return len(instituicoes)
+
+    def escritorio(id_instituicao, nome):
+        escritorios.append((len(escritorios) + 1, nome, id_instituicao))
+        return len(escritorios)
+
+    privados = [instituicao(f'Concessionária Águas do Brasil {k}', 'Privada')
+                for k in range(1, GRUPOS_PRIVADOS + 1)]
+    escritorios_privados = {}
+    cum_operador = _cumulativa([p for _, p in OPERADORES])
+    cum_tecnologia = _cumulativa([p for _, p in TECNOLOGIAS])
+
+    for id_estado, uf in enumerate(ufs, 1):
+        total = MUNICIPIOS_POR_UF[uf]
+        estadual = instituicao(f'Companhia de Saneamento de {carga.NOMES_ESTADOS[uf]}', 'Pública')
+        regionais = [escritorio(estadual, f'Escritório Regional {k:02d} - {uf}')
+                     for k in range(1, max(1, total // 60) + 1)]
+        # Porte dos municípios: poucos grandes e muitos pequenos
+        portes = rng.lognormal(0.0, 1.0, total)
+        for k, porte in enumerate(portes, 1):
+            id_municipio = len(municipios) + 1
+            nome_municipio = f'Município {uf}-{k:03d}'
+            municipios.append((id_municipio, nome_municipio, id_estado))
+            operador = OPERADORES[_sortear(rng, cum_operador, 1)[0]][0]
+            if operador == 'estadual':
+                id_escritorio = regionais[(k - 1) % len(regionais)]
+            elif operador == 'municipal':
+                id_escritorio = escritorio(
+                    instituicao(f'Serviço Autônomo de Água e Esgoto de {nome_municipio}', 'Autarquia'),
+                    f'Sede - {nome_municipio}')
+            else:
+                grupo = privados[rng.integers(len(privados))]
+                if (grupo, uf) not in escritorios_privados:
+                    escritorios_privados[grupo, uf] = escritorio(grupo, f'Unidade {uf} - grupo {grupo}')
+                id_escritorio = escritorios_privados[grupo, uf]
+            for j in range(1 + rng.poisson(0.4 * porte)):
+                tecnologia = TECNOLOGIAS[_sortear(rng, cum_tecnologia, 1)[0]][0]
+                etas.append((len(etas) + 1, f'ETA {nome_municipio} {j + 1}', tecnologia or None,
+                             id_municipio, id_escritorio, porte))
+
+    conn.executemany('INSERT INTO Instituicao (id_instituicao, nome_instituicao, tipo_instituicao) '
+                     'VALUES (?, ?, ?)', instituicoes)
+    conn.executemany('INSERT INTO Escritorio_Regional (id_escritorio, nome_escritorio, id_instituicao) '
+                     'VALUES (?, ?, ?)', escritorios)
+    conn.executemany('INSERT INTO Municipio (id_municipio, nome_municipio, id_estado) VALUES (?, ?, ?)',
+                     municipios)
+    conn.executemany('INSERT INTO ETA (id_eta, nome_eta, tipo_filtracao, id_municipio, id_escritorio) '
+                     'VALUES (?, ?, ?, ?, ?)', [eta[:5] for eta in etas])
+    conn.executemany('INSERT INTO Ponto_Monitoramento (id_ponto, tipo_ponto, nome_ponto) VALUES (?, ?, ?)',
+                     [(i, tipo, nome) for i, (tipo, nome, _) in enumerate(PONTOS, 1)])
+
+    # Campos são compartilhados entre parâmetros (ex.: "Número de amostras")
+    campos = {}
+    largura = max(len(lista) for _, _, _, lista in PARAMETROS)
+    ids_campo = np.zeros((len(PARAMETROS), largura), dtype=np.int64)
+    fracoes = np.zeros((len(PARAMETROS), largura))
+    for i, (nome, unidade, _, lista) in enumerate(PARAMETROS):
+        conn.execute('INSERT INTO Parametro (id_parametro, nome_parametro, unidade_medida, categoria_parametro) '
+                     'VALUES (?, ?, ?, ?)', (i + 1, nome, unidade, carga.categoria_parametro(nome)))
+        for j, (campo, fracao) in enumerate(lista):
+            ids_campo[i, j] = campos.setdefault(campo, len(campos) + 1)
+            fracoes[i, j] = fracao
+    conn.executemany('INSERT INTO Campo (id_campo, nome_campo) VALUES (?, ?)',
+                     [(i, nome) for nome, i in campos.items()])
+    conn.commit()
+
+    portes = np.array([eta[5] for eta in etas])
+    # Metade das linhas de cada parâmetro é o total de amostras; o resto se
+    # divide igualmente entre as faixas de resultado
+    pesos_campo = np.where(ids_campo > 0, 1.0, 0.0)
+    pesos_campo[:, 0] = (pesos_campo.sum(axis=1) - 1).clip(min=1)
+    return {
+        'etas': len(etas),
+        'municipios': len(municipios),
+        'instituicoes': len(instituicoes),
+        # ETAs maiores enviam mais registros e têm mais amostras por mês
+        'cum_eta': _cumulativa(portes),
+        'amostras_eta': 4 + 6 * portes,
+        'cum_parametro': _cumulativa([p for _, _, p, _ in PARAMETROS]),
+        'cum_campo': np.cumsum(pesos_campo / pesos_campo.sum(axis=1, keepdims=True), axis=1),
+        'ids_campo': ids_campo,
+        'fracoes': fracoes,
+        'cum_ponto': _cumulativa([p for _, _, p in PONTOS]),
+    }
+
+
+def _medicoes(rng, dim, ano, mes, n):
+    """Colunas de n medições sorteadas de um período."""
+    eta = _sortear(rng, dim['cum_eta'], n)
+    parametro = _sortear(rng, dim['cum_parametro'], n)
+    faixa = (rng.random(n)[:, None] > dim['cum_campo'][parametro]).sum(axis=1)
+    faixa = np.minimum(faixa, dim['cum_campo'].shape[1] - 1)
+    ponto = _sortear(rng, dim['cum_ponto'], n)
+    valor = rng.poisson(dim['amostras_eta'][eta] * dim['fracoes'][parametro, faixa]).astype(float)
+    return zip(
+        (eta + 1).tolist(),
+        (parametro + 1).tolist(),
+        (ponto + 1).tolist(),
+        dim['ids_campo'][parametro, faixa].tolist(),
+        itertools.repeat(ano),
+        itertools.repeat(mes),
+        valor.tolist(),
+    )
+
+
+def gerar_banco(caminho, linhas, ano_inicial=2018, ano_final=2025, semente=42, rollups=True,
+                linhas_por_lote=carga.LINHAS_POR_LOTE, progresso=print):
+    """Cria um sisagua.db sintético com o esquema da carga e `linhas` medições.
+
+    As dimensões seguem a geografia real (regiões, UFs e número de municípios
+    por UF); as medições são sorteadas mês a mês, com ETAs de porte desigual
+    e adesão crescente ao longo dos anos. A mesma semente gera o mesmo banco.
+    """
+    rng = np.random.default_rng(semente)
+    conn = sqlite3.connect(caminho)
+    try:
+        conn.executescript(carga.ESQUEMA)
+        alteracoes.instalar(conn)
+        conn.commit()
+        conexoes.ativar_wal(conn)
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute('PRAGMA cache_size = -262144')
+
+        inicio = time.perf_counter()
+        dim = _dimensoes(conn, rng)
+        periodos = [(ano, mes) for ano in range(ano_inicial, ano_final + 1) for mes in range(1, 13)]
+        pesos = [(1 + CRESCIMENTO_ANUAL) ** (ano - ano_inicial) for ano, _ in periodos]
+        por_periodo = rng.multinomial(linhas, np.asarray(pesos) / sum(pesos))
+
+        inseridas, na_transacao = 0, 0
+        for (ano, mes), total in zip(periodos, por_periodo):
+            for parte in range(0, total, linhas_por_lote):
+                n = min(linhas_por_lote, total - parte)
+                conn.executemany(carga.SQL_MEDICAO, _medicoes(rng, dim, ano, mes, n))
+                inseridas += n
+                na_transacao += n
+                if na_transacao >= carga.LINHAS_POR_TRANSACAO:
+                    conn.commit()
+                    na_transacao = 0
+                    if progresso:
+                        decorrido = time.perf_counter() - inicio
+                        progresso(f'{inseridas:,} linhas ({inseridas / decorrido:,.0f} linhas/s)')
+        conn.commit()
+        segundos_medicoes = time.perf_counter() - inicio
+
+        inicio_indices = time.perf_counter()
+        indices.criar_indices(conn)
+        if rollups:
+            agregados.construir_rollups(conn)
+        conn.execute('PRAGMA synchronous = FULL')
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    finally:
+        conn.close()
+
+    return {
+        'medicoes': inseridas,
+        'etas': dim['etas'],
+        'municipios': dim['municipios'],
+        'instituicoes': dim['instituicoes'],
+        'periodos': len(periodos),
+        'segundos': segundos_medicoes,
+        'segundos_indices': time.perf_counter() - inicio_indices,
+        'linhas_por_segundo': inseridas / segundos_medicoes if segundos_medicoes else 0.0,
+        'bytes': Path(caminho).stat().st_size,
+    }
+
+
+def _linhas(valor):
+    if valor.upper() in ESCALAS:
+        return ESCALAS[valor.upper()]
+    try:
+        return int(valor.replace('_', ''))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'use um número ou uma das escalas {", ".join(ESCALAS)}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Gera um sisagua.db sintético para benchmarks de escala')
+    parser.add_argument('--banco', default='sisagua_sintetico.db')
+    parser.add_argument('--linhas', type=_linhas, default=ESCALAS['1M'],
+                        help=f'medições a gerar: um número ou {", ".join(ESCALAS)} (padrão: 1M)')
+    parser.add_argument('--ano-inicial', type=int, default=2018)
+    parser.add_argument('--ano-final', type=int, default=2025)
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--sem-rollups', action='store_true', help='não constrói rollup_medicao')
+    parser.add_argument('--substituir', action='store_true', help='apaga o banco se ele já existir')
+    args = parser.parse_args()
+
+    if Path(args.banco).exists():
+        if not args.substituir:
+            raise SystemExit(f'Erro: {args.banco} já existe (use --substituir para recriá-lo).')
+        for sufixo in ('', '-wal', '-shm'):
+            Path(f'{args.banco}{sufixo}').unlink(missing_ok=True)
+    if args.ano_final < args.ano_inicial:
+        raise SystemExit('Erro: --ano-final anterior a --ano-inicial.')
+
+    resumo = gerar_banco(args.banco, args.linhas, ano_inicial=args.ano_inicial, ano_final=args.ano_final,
+                         semente=args.semente, rollups=not args.sem_rollups)
+    print(f"{resumo['medicoes']:,} medições em {resumo['segundos']:.1f}s "
+          f"({resumo['linhas_por_segundo']:,.0f} linhas/s; índices e rollups: {resumo['segundos_indices']:.1f}s).")
+    print(f"{resumo['etas']:,} ETAs em {resumo['municipios']:,} municípios, "
+          f"{resumo['instituicoes']:,} instituições, {resumo['periodos']} meses; "
+          f"{resumo['bytes'] / 1024 ** 2:,.0f} MB em {args.banco}.")
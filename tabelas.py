@@ -0,0 +1,78 @@
+import functools
+import math
+
+# Tabelas paginadas sobre o resultado já calculado: a consulta de
+# get_consultas() roda uma vez (por run_consulta, com cache, rollups e poda de
+# partições) e busca, ordenação, páginas, totais e maiores itens são recortes
+# desse DataFrame. Só as linhas da página vão para o navegador.
+
+# Colunas de cada resultado exibido em tabela paginada: todas (na ordem da
+# consulta), as que identificam uma linha, as pesquisáveis e a ordenação padrão
+TABELAS = {
+    'etas_estado': {
+        'colunas': ['UF', 'Estado', 'Total ETAs', 'Municípios com ETA', 'ETAs por Município'],
+        'chave': ['UF', 'Estado'],
+        'busca': ['UF', 'Estado'],
+        'ordem': ('Total ETAs', True),
+    },
+    'medicoes_ponto': {
+        'colunas': ['Tipo', 'Ponto de Monitoramento', 'Total Medições', '% do Total'],
+        'chave': ['Tipo', 'Ponto de Monitoramento'],
+        'busca': ['Tipo', 'Ponto de Monitoramento'],
+        'ordem': ('Total Medições', True),
+    },
+    'performance_instituicao': {
+        'colunas': ['Instituição', 'Tipo', 'ETAs', 'Parâmetros', 'Medições', 'Med/ETA'],
+        'chave': ['Instituição', 'Tipo'],
+        'busca': ['Instituição', 'Tipo'],
+        'ordem': ('ETAs', True),
+    },
+    'analise_filtracao': {
+        'colunas': ['Tipo Filtração', 'Parâmetro', 'Faixa de Valores', 'Análises', 'ETAs', 'Porcentagem'],
+        'chave': ['Tipo Filtração', 'Parâmetro', 'Faixa de Valores'],
+        'busca': ['Tipo Filtração', 'Parâmetro', 'Faixa de Valores'],
+        'ordem': ('Tipo Filtração', False),
+    },
+}
+
+TAMANHO_PAGINA = 50
+
+
+def colunas_ordem(nome, ordem):
+    """Colunas que definem a posição de uma linha: a de ordenação e as da chave."""
+    return [ordem] + [coluna for coluna in TABELAS[nome]['chave'] if coluna != ordem]
+
+
+def filtrar(nome, df, busca=None):
+    """Linhas de `df` em que alguma coluna pesquisável contém `busca` (sem diferenciar maiúsculas)."""
+    if not busca or df.empty:
+        return df
+    colunas = [df[coluna].fillna('').astype(str) for coluna in TABELAS[nome]['busca']]
+    texto = functools.reduce(lambda a, b: a + ' ' + b, colunas)
+    return df[texto.str.contains(busca, case=False, regex=False)]
+
+
+def ordenar(nome, df, ordem=None, descendente=None):
+    """`df` na ordem pedida (padrão: a de TABELAS), desempatada pelas colunas da chave."""
+    if df.empty:
+        return df
+    padrao, padrao_desc = TABELAS[nome]['ordem']
+    ordem = ordem or padrao
+    descendente = padrao_desc if descendente is None else descendente
+    return df.sort_values(colunas_ordem(nome, ordem), ascending=not descendente, na_position='last', kind='stable')
+
+
+def paginas(total, limite=TAMANHO_PAGINA):
+    return max(math.ceil(total / limite), 1)
+
+
+def pagina(df, numero, limite=TAMANHO_PAGINA):
+    """Linhas da página `numero` (a partir de 0) de `df` já filtrado e ordenado."""
+    return df.iloc[numero * limite:(numero + 1) * limite]
+
+
+def top(df, coluna, n):
+    """As `n` linhas com maior `coluna`."""
+    if df.empty:
+        return df
+    return df.sort_values(coluna, ascending=False, kind='stable').head(n)
@@ -0,0 +1,17 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# Os módulos do painel ficam na raiz do repositório
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import sintetico  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def banco_sintetico(tmp_path_factory):
+    """sisagua.db sintético pequeno (2018–2025), sem rollups."""
+    caminho = tmp_path_factory.mktemp('sintetico') / 'sisagua.db'
+    sintetico.gerar_banco(caminho, 30_000, rollups=False, progresso=None)
+    return caminho
@@ -0,0 +1,54 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+import agregados
+import sintetico
+from consultas import montar_consulta
+
+COLUNAS = 'id_eta, id_parametro, id_ponto, id_campo, ano_referencia, mes_referencia, valor_medido'
+
+
+@pytest.fixture
+def conn(tmp_path):
+    caminho = tmp_path / 'alteracoes.db'
+    sintetico.gerar_banco(caminho, 5_000, ano_inicial=2024, ano_final=2025, progresso=None)
+    conn = sqlite3.connect(caminho)
+    yield conn
+    conn.close()
+
+
+def _geografica(conn, montar):
+    query, params = montar('analise_geografica', {})
+    return pd.read_sql_query(query, conn, params=params)
+
+
+def test_recarga_do_ultimo_mes_desatualiza_os_rollups(conn):
+    assert not agregados.rollups_desatualizados(conn)
+    # Como carga.py --substituir: o último mês sai e volta com o mesmo número de
+    # linhas (corrigidas), reaproveitando os mesmos rowids
+    periodo = (2025, 12)
+    linhas = conn.execute(f'SELECT {COLUNAS} FROM Medicao WHERE ano_referencia = ? AND mes_referencia = ?',
+                          periodo).fetchall()
+    antes = agregados.assinatura_origem(conn)
+    conn.execute('DELETE FROM Medicao WHERE ano_referencia = ? AND mes_referencia = ?', periodo)
+    conn.executemany(f'INSERT INTO Medicao ({COLUNAS}) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                     [(linha[0] % 7 + 1, *linha[1:]) for linha in linhas])
+    conn.commit()
+    depois = agregados.assinatura_origem(conn)
+    assert [linha[:3] for linha in depois] == [linha[:3] for linha in antes]
+
+    assert agregados.rollups_desatualizados(conn)
+    assert agregados.periodos_novos(conn) is None
+    assert agregados.atualizar_rollups(conn)['modo'] == 'completo'
+    assert_frame_equal(_geografica(conn, agregados.montar_consulta), _geografica(conn, montar_consulta))
+
+
+def test_update_desatualiza_os_rollups(conn):
+    conn.execute('UPDATE ETA SET id_municipio = id_municipio + 1 WHERE id_eta = 1')
+    conn.commit()
+    assert agregados.rollups_desatualizados(conn)
+    assert agregados.atualizar_rollups(conn)['modo'] == 'completo'
+    assert not agregados.rollups_desatualizados(conn)
@@ -0,0 +1,25 @@
+import threading
+
+import aquecimento
+
+
+def test_tarefas_rodam_marcadas_como_segundo_plano():
+    aquecedor = aquecimento.Aquecedor()
+    vistos, fim = [], threading.Event()
+    # Tarefas agendadas em momentos diferentes (como por reexecuções
+    # diferentes do painel) veem a mesma marca
+    aquecedor.agendar('a', lambda: vistos.append(aquecimento.em_segundo_plano()))
+    aquecedor.agendar('b', lambda: (vistos.append(aquecimento.em_segundo_plano()), fim.set()))
+    assert fim.wait(5)
+    assert vistos == [True, True]
+    assert not aquecimento.em_segundo_plano()
+
+
+def test_chave_pendente_nao_e_reagendada():
+    aquecedor = aquecimento.Aquecedor()
+    liberar, fim = threading.Event(), threading.Event()
+    assert aquecedor.agendar('lenta', liberar.wait, 5)
+    assert aquecedor.agendar('x', fim.set)
+    assert not aquecedor.agendar('x', fim.set)
+    liberar.set()
+    assert fim.wait(5)
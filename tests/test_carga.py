@@ -0,0 +1,93 @@
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+import carga
+import particoes
+
+# Extração de exemplo (latin-1, ';'): 5 linhas válidas de 2 ETAs em 2023 e 2024
+# e 3 rejeitadas (UF vazia, ano inválido, mês desconhecido)
+CSV = Path(__file__).parent / 'dados' / 'controle_mensal.csv'
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(tmp_path / 'carga.db')
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize('texto, esperado', [
+    ('1.234,5', 1234.5), ('1234.5', 1234.5), ('12,0', 12.0), (' 7 ', 7.0), ('', None), (None, None), ('abc', None),
+])
+def test_numero(texto, esperado):
+    assert carga._numero(texto) == esperado
+
+
+@pytest.mark.parametrize('texto, esperado', [
+    ('3', 3), ('Março', 3), ('  DEZEMBRO ', 12), ('marco', 3), ('Brumário', None), ('', None),
+])
+def test_mes(texto, esperado):
+    assert carga._mes(texto) == esperado
+
+
+def test_mapear_cabecalho():
+    cabecalho = ['VALOR', 'uf', 'Municipio', ' Nome da ETA /  UTA ', 'Parametro', 'Campo',
+                 'Ano de Referência', 'Mês de referência']
+    mapa = carga.mapear_cabecalho(cabecalho)
+    assert (mapa['valor'], mapa['uf'], mapa['eta'], mapa['mes']) == (0, 1, 3, 7)
+    assert mapa['regiao'] is None
+    with pytest.raises(ValueError, match='Valor'):
+        carga.mapear_cabecalho(cabecalho[1:])
+
+
+def test_carga_resolve_as_dimensoes(conn):
+    resumo = carga.carregar_csv(conn, [CSV], progresso=None)
+    assert (resumo['inseridas'], resumo['rejeitadas']) == (5, 3)
+    assert conn.execute('SELECT uf, nome_estado FROM Estado ORDER BY uf').fetchall() == [
+        ('BA', 'Bahia'), ('SP', 'São Paulo')]
+    assert conn.execute('SELECT COUNT(*) FROM ETA').fetchone()[0] == 2
+    assert dict(conn.execute('SELECT nome_parametro, categoria_parametro FROM Parametro')) == {
+        'Cloro Residual Livre (mg/L)': 'Químico', 'pH': 'Químico', 'Turbidez (uT)': 'Físico'}
+    medicoes = conn.execute('''
+        SELECT e.uf, eta.nome_eta, r.nome_regiao, p.nome_parametro, med.ano_referencia,
+               med.mes_referencia, med.valor_medido, pm.nome_ponto
+        FROM Medicao med
+        INNER JOIN ETA eta ON eta.id_eta = med.id_eta
+        INNER JOIN Municipio m ON m.id_municipio = eta.id_municipio
+        INNER JOIN Estado e ON e.id_estado = m.id_estado
+        INNER JOIN Regiao r ON r.id_regiao = e.id_regiao
+        INNER JOIN Parametro p ON p.id_parametro = med.id_parametro
+        LEFT JOIN Ponto_Monitoramento pm ON pm.id_ponto = med.id_ponto
+        ORDER BY med.id_medicao
+    ''').fetchall()
+    assert medicoes == [
+        ('SP', 'ETA Capivari', 'Sudeste', 'Cloro Residual Livre (mg/L)', 2023, 1, 1234.5, 'Saída do tratamento'),
+        ('SP', 'ETA Capivari', 'Sudeste', 'pH', 2023, 3, 12.5, 'Saída do tratamento'),
+        # 'sp' resolve para o mesmo estado e a mesma ETA
+        ('SP', 'ETA Capivari', 'Sudeste', 'pH', 2024, 3, 7.0, 'Saída do tratamento'),
+        ('BA', 'ETA Principal', 'Nordeste', 'Turbidez (uT)', 2024, 12, None, 'Sistema de distribuição'),
+        ('BA', 'ETA Principal', 'Nordeste', 'Turbidez (uT)', 2024, 12, None, None),
+    ]
+    escritorios = conn.execute('SELECT eta.nome_eta, eta.id_escritorio FROM ETA eta ORDER BY eta.nome_eta').fetchall()
+    assert escritorios[0][1] is not None and escritorios[1][1] is None
+
+
+def test_recarga_substituir_e_idempotente(conn):
+    carga.carregar_csv(conn, [CSV], progresso=None)
+    resumo = carga.carregar_csv(conn, [CSV], substituir=True, progresso=None)
+    assert resumo['periodos_substituidos'] == [(2023, 1), (2023, 3), (2024, 3), (2024, 12)]
+    assert resumo['dimensoes_novas'] == 0
+    assert conn.execute('SELECT COUNT(*) FROM Medicao').fetchone()[0] == 5
+    carga.carregar_csv(conn, [CSV], progresso=None)
+    assert conn.execute('SELECT COUNT(*) FROM Medicao').fetchone()[0] == 10
+
+
+def test_substituir_ano_fechado_e_recusado(conn, tmp_path):
+    carga.carregar_csv(conn, [CSV], progresso=None)
+    assert list(particoes.particionar(conn, tmp_path / 'carga.db')) == [2023]
+    with pytest.raises(ValueError, match='2023 é um ano fechado'):
+        carga.carregar_csv(conn, [CSV], substituir=True, progresso=None)
+    # Nada foi apagado nem inserido no ano aberto
+    assert conn.execute('SELECT COUNT(*) FROM main.Medicao').fetchone()[0] == 3
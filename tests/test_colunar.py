@@ -0,0 +1,39 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+import colunar
+from consultas import montar_consulta
+
+CONJUNTOS_FILTROS = [
+    {},
+    {'ano': 2022},
+    {'mes_inicio': 2, 'mes_fim': 4},
+    {'regiao': 'Sul', 'parametro': 'pH'},
+    {'uf': 'SP', 'ano': 2020},
+]
+
+
+@pytest.fixture(scope='module')
+def snapshot(banco_sintetico, tmp_path_factory):
+    diretorio = tmp_path_factory.mktemp('snapshot')
+    with sqlite3.connect(banco_sintetico) as conn:
+        colunar.exportar_snapshot(conn, diretorio)
+    return colunar.SnapshotColunar(diretorio)
+
+
+def test_medicao_fica_em_parquet(snapshot):
+    assert 'Medicao' not in snapshot.tabelas
+    med = snapshot._medicoes({'ano': 2022}, ['id_eta'])
+    assert list(med.columns) == ['id_eta']
+
+
+@pytest.mark.parametrize('filtros', CONJUNTOS_FILTROS)
+def test_snapshot_igual_ao_sqlite(banco_sintetico, snapshot, filtros):
+    conn = sqlite3.connect(banco_sintetico)
+    for nome in colunar.CONSULTAS:
+        query, params = montar_consulta(nome, filtros)
+        esperado = pd.read_sql_query(query, conn, params=params)
+        assert_frame_equal(snapshot.executar(nome, filtros), esperado, obj=nome)
@@ -0,0 +1,45 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import conexoes
+
+# Consulta longa o bastante para só terminar se for interrompida
+SQL_LONGA = '''
+    WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c)
+    SELECT COUNT(*) FROM (SELECT x FROM c LIMIT 1000000000)
+'''
+
+
+def test_cancelada_por_marca():
+    estado = {'execucao': 1}
+    cancelada = conexoes.cancelada_por_marca(lambda: estado['execucao'])
+    assert not cancelada()
+    # A marca é a do momento da criação: outra execução começa com a sua
+    estado['execucao'] = 2
+    assert cancelada()
+    assert not conexoes.cancelada_por_marca(lambda: estado['execucao'])()
+
+
+def test_consulta_abandonada_quando_a_marca_muda(banco_sintetico):
+    pool = conexoes.PoolConexoes(banco_sintetico, 1)
+    estado = {'execucao': 1}
+    # Criado na thread que pediu a consulta, verificado na que a executa
+    orcamento = conexoes.orcamento(None, conexoes.cancelada_por_marca(lambda: estado['execucao']))
+
+    def consultar():
+        with orcamento, pool.conexao() as conn:
+            return conn.execute(SQL_LONGA).fetchall()
+
+    with ThreadPoolExecutor(1) as executor:
+        futuro = executor.submit(consultar)
+        time.sleep(0.3)
+        assert not futuro.done()
+        estado['execucao'] += 1
+        with pytest.raises(conexoes.ConsultaInterrompida) as erro:
+            futuro.result(timeout=5)
+    assert erro.value.motivo == 'cancelada'
+    # A conexão voltou livre para o pool
+    with pool.conexao(timeout=1) as conn:
+        assert conn.execute('SELECT 1').fetchone() == (1,)
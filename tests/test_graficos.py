@@ -0,0 +1,34 @@
+import numpy as np
+import plotly.graph_objects as go
+
+import graficos
+
+N = 10_000
+
+
+def _figura(x, y, modo):
+    return graficos.otimizar_figura(go.Figure(go.Scatter(x=x, y=y, mode=modo)))
+
+
+def test_linha_ordenada_e_reduzida_preservando_extremos():
+    x = np.arange(N)
+    y = np.sin(x / 50.0)
+    y[1234] = 10.0
+    trace = _figura(x, y, 'lines').data[0]
+    assert trace.type == 'scattergl'
+    assert len(trace.x) <= graficos.MAX_PONTOS_SERIE + 2
+    assert 1234 in trace.x and max(trace.y) == 10.0
+    assert list(trace.x) == sorted(trace.x)
+
+
+def test_pontos_soltos_nao_sao_reduzidos():
+    rng = np.random.default_rng(0)
+    trace = _figura(rng.random(N), rng.random(N), 'markers').data[0]
+    assert trace.type == 'scattergl'
+    assert len(trace.x) == N
+
+
+def test_linha_fora_de_ordem_nao_e_reduzida():
+    x = np.random.default_rng(0).permutation(N)
+    trace = _figura(x, x * 2.0, 'lines').data[0]
+    assert len(trace.x) == N
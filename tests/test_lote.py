@@ -0,0 +1,37 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+import lote
+from consultas import montar_consulta
+
+NOMES = ['metricas_gerais', 'etas_estado', 'analise_geografica']
+
+
+def _original(conn, nome, filtros):
+    query, params = montar_consulta(nome, filtros)
+    return pd.read_sql_query(query, conn, params=params)
+
+
+def test_subplanos_sem_leitor_nao_sao_construidos():
+    # Com o rollup, analise_geografica não lê lote_medicao_eta
+    plano = lote._plano_lote(NOMES, usar_rollup=True)
+    assert lote._subplanos(plano) == ([], ['lote_eta_geo'])
+    plano = lote._plano_lote(NOMES, usar_rollup=False)
+    assert lote._subplanos(plano) == (['lote_eta_geo'], ['lote_medicao_eta'])
+    plano = lote._plano_lote(['analise_geografica'], usar_rollup=False)
+    assert lote._subplanos(plano) == ([], ['lote_eta_geo', 'lote_medicao_eta'])
+
+
+@pytest.mark.parametrize('nomes', [NOMES, ['analise_geografica'], ['etas_estado']])
+@pytest.mark.parametrize('filtros', [{}, {'ano': 2022}, {'uf': 'SP', 'ano': 2020}])
+def test_lote_igual_as_consultas_originais(banco_sintetico, nomes, filtros):
+    conn = sqlite3.connect(banco_sintetico)
+    resultados, tempos = lote.executar_lote(conn, nomes, filtros)
+    materializados = {sp for sp in lote.SUBPLANOS if sp in tempos}
+    assert materializados == set(lote._subplanos(lote._plano_lote(nomes, False))[0])
+    for nome in nomes:
+        assert_frame_equal(resultados[nome], _original(conn, nome, filtros), check_dtype=False)
+    assert not conn.execute("SELECT name FROM temp.sqlite_master").fetchall()
@@ -0,0 +1,28 @@
+import threading
+import time
+
+import pytest
+
+import conexoes
+import motores
+from test_conexoes import SQL_LONGA
+
+
+@pytest.fixture(scope='module')
+def motor(banco_sintetico):
+    motor = motores.MotorProcessos(banco_sintetico, processos=1)
+    yield motor
+    motor.fechar()
+
+
+def test_cancelamento_libera_o_trabalhador(motor):
+    cancelar = threading.Event()
+    threading.Timer(0.5, cancelar.set).start()
+    with pytest.raises(conexoes.ConsultaInterrompida) as erro:
+        with conexoes.orcamento(None, cancelar.is_set):
+            motor.executar(SQL_LONGA)
+    assert erro.value.motivo == 'cancelada'
+    # O único trabalhador abandonou a consulta longa e atende a seguinte
+    inicio = time.monotonic()
+    assert motor.executar('SELECT COUNT(*) AS n FROM ETA')['n'].iloc[0] > 0
+    assert time.monotonic() - inicio < 5
@@ -0,0 +1,56 @@
+import shutil
+import sqlite3
+
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+import conexoes
+import particoes
+import sintetico
+from consultas import montar_consulta
+
+NOMES = ['metricas_gerais', 'analise_geografica', 'evolucao_temporal']
+
+
+@pytest.fixture(scope='module')
+def bancos(tmp_path_factory):
+    """Banco de 2013 a 2025 particionado (12 anos fechados) e uma cópia inteira."""
+    diretorio = tmp_path_factory.mktemp('particoes')
+    inteiro = diretorio / 'inteiro.db'
+    sintetico.gerar_banco(inteiro, 13_000, ano_inicial=2013, ano_final=2025, rollups=False, progresso=None)
+    particionado = diretorio / 'particionado.db'
+    shutil.copy(inteiro, particionado)
+    with sqlite3.connect(particionado) as conn:
+        movidas = particoes.particionar(conn, particionado)
+    assert sorted(movidas) == list(range(2013, 2025))
+    return inteiro, particionado
+
+
+def test_arquivos_cabem_no_limite_de_anexos(bancos):
+    _, particionado = bancos
+    with sqlite3.connect(particionado) as conn:
+        arquivos = set(particoes.particoes(conn).values())
+        assert len(arquivos) == particoes.MAX_ARQUIVOS
+        # Os anos mais antigos dividem o primeiro arquivo, os recentes ficam sozinhos
+        assert particoes.particoes(conn)[2013] == particoes.particoes(conn)[2016]
+        assert particoes.particoes(conn)[2024] == 'particionado_medicao_2024.db'
+        # Sem espaço para outro arquivo: fechar mais um ano é recusado
+        with pytest.raises(ValueError):
+            particoes._agrupar([2025], particoes.MAX_ARQUIVOS - len(arquivos))
+
+
+@pytest.mark.parametrize('filtros', [{}, {'ano': 2014}, {'ano': 2024}, {'ano': 2025, 'regiao': 'Sul'}])
+def test_particionado_igual_ao_inteiro(bancos, filtros):
+    inteiro, particionado = bancos
+    pool = conexoes.PoolConexoes(particionado, 1)
+    original = sqlite3.connect(inteiro)
+    with pool.conexao() as conn:
+        assert len(particoes.esquemas_anexados(conn)) == particoes.MAX_ARQUIVOS
+        fechados = particoes.anos_fechados(conn)
+        registradas = particoes.particoes(conn)
+        for nome in NOMES:
+            query, params = montar_consulta(nome, filtros)
+            podada = particoes.podar(query, params, fechados, registradas)
+            esperado = pd.read_sql_query(query, original, params=params)
+            assert_frame_equal(pd.read_sql_query(podada, conn, params=params), esperado, obj=nome)
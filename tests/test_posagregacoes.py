@@ -0,0 +1,23 @@
+import pandas as pd
+
+import posagregacoes
+
+
+def test_categorias_sem_linhas_nao_viram_grupos():
+    # tipos.compactar (via _compactar no dashboard) converte textos repetidos em category, com categorias
+    # que o filtro pode ter esvaziado
+    df = pd.DataFrame({
+        'Região': pd.Categorical(['Sul', 'Sul', 'Norte'], categories=['Centro-Oeste', 'Norte', 'Sul']),
+        'Período': pd.Categorical(['2024-01', '2024-02', '2024-01'], categories=['2023-12', '2024-01', '2024-02']),
+        'Total Medições': [10, 20, 5],
+        'ETAs Ativas': [1, 2, 1],
+        'Medições/ETA': [10.0, 10.0, 5.0],
+        'Municípios': [1, 1, 1],
+        'Total de Registros': [10, 20, 5],
+        'Parâmetros Distintos': [3, 4, 2],
+        'Intensidade (Reg/ETA)': [10.0, 10.0, 5.0],
+        'Diversidade (Par/ETA)': [3.0, 2.0, 2.0],
+    })
+    for pos in ('totais_regiao', 'resumo_regiao', 'metricas_regiao'):
+        assert sorted(posagregacoes.aplicar(pos, df)['Região']) == ['Norte', 'Sul']
+    assert len(posagregacoes.aplicar('resumo_periodo', df)) == 3
@@ -0,0 +1,46 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+import tabelas
+from consultas import montar_consulta
+
+
+@pytest.fixture(scope='module')
+def resultados(banco_sintetico):
+    conn = sqlite3.connect(banco_sintetico)
+    resultados = {}
+    for nome in tabelas.TABELAS:
+        query, params = montar_consulta(nome, {})
+        resultados[nome] = pd.read_sql_query(query, conn, params=params)
+    return resultados
+
+
+@pytest.mark.parametrize('nome', tabelas.TABELAS)
+@pytest.mark.parametrize('descendente', [False, True])
+def test_paginas_cobrem_todas_as_linhas(resultados, nome, descendente):
+    df = resultados[nome]
+    # Páginas pequenas para que o resultado sintético ocupe várias
+    limite = 2
+    assert len(df) > limite
+    for ordem in tabelas.TABELAS[nome]['colunas']:
+        ordenado = tabelas.ordenar(nome, df, ordem, descendente)
+        paginas = [tabelas.pagina(ordenado, numero, limite) for numero in range(tabelas.paginas(len(df), limite))]
+        assert all(0 < len(p) <= limite for p in paginas)
+        juntas = pd.concat(paginas)
+        # Cada linha aparece uma vez, na ordem pedida
+        assert not juntas.index.duplicated().any()
+        assert_frame_equal(juntas.sort_index(), df)
+        valores = juntas[ordem].dropna()
+        assert valores.is_monotonic_decreasing if descendente else valores.is_monotonic_increasing
+
+
+def test_busca_e_top(resultados):
+    df = resultados['medicoes_ponto']
+    termo = df['Ponto de Monitoramento'].iloc[0][:4].lower()
+    encontradas = tabelas.filtrar('medicoes_ponto', df, termo)
+    assert len(encontradas) and encontradas['Ponto de Monitoramento'].str.lower().str.contains(termo).all()
+    maiores = tabelas.top(df, 'Total Medições', 10)
+    assert maiores['Total Medições'].tolist() == sorted(df['Total Medições'], reverse=True)[:10]
@@ -0,0 +1,99 @@
+import argparse
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+import particoes
+from consultas import get_consultas, montar_consulta
+
+# Tipo compacto de cada coluna dos resultados de get_consultas() (os rollups,
+# o lote e o snapshot usam os mesmos nomes). Textos repetidos viram category e
+# contagens, int32. Razões e percentuais continuam float64: são exibidos com
+# duas casas e, em float32, 25.96 vira 25.959999 nas tabelas e arredondamentos.
+TIPOS_COLUNAS = {
+    **dict.fromkeys([
+        'Tecnologia de Tratamento', 'Parâmetro de Qualidade', 'Unidade', 'Finalidade do Monitoramento',
+        'UF', 'Estado', 'Região', 'Tipo', 'Ponto de Monitoramento', 'Categoria', 'Parâmetro',
+        'Instituição', 'Tipo Filtração', 'Faixa de Valores', 'Período', 'tipo',
+    ], 'category'),
+    **dict.fromkeys([
+        'Qtd ETAs', 'Total ETAs', 'Municípios com ETA', 'Total Medições', 'Municípios', 'ETAs Ativas',
+        'ETAs', 'Parâmetros', 'Medições', 'Mês', 'Total de Registros', 'Parâmetros Distintos', 'valor',
+    ], 'int32'),
+}
+
+
+def _converter(serie, tipo):
+    """A série no tipo compacto, ou ela mesma quando a conversão perderia informação."""
+    if tipo == 'category':
+        # Só compensa quando os valores se repetem
+        if serie.dtype == 'category' or serie.nunique(dropna=False) * 2 > len(serie):
+            return serie
+        return serie.astype('category')
+    if not pd.api.types.is_numeric_dtype(serie) or pd.api.types.is_bool_dtype(serie):
+        return serie
+    if tipo == 'int32':
+        limites = np.iinfo(np.int32)
+        if serie.isna().any() or (len(serie) and (serie.min() < limites.min or serie.max() > limites.max)):
+            return serie
+        if pd.api.types.is_float_dtype(serie) and not (serie % 1 == 0).all():
+            return serie
+    return serie.astype(tipo)
+
+
+def compactar(df, tipos=TIPOS_COLUNAS):
+    """Converte as colunas conhecidas de um resultado para os tipos compactos."""
+    convertidas = {coluna: _converter(df[coluna], tipos[coluna]) for coluna in df.columns if coluna in tipos}
+    if not convertidas:
+        return df
+    return df.assign(**convertidas)
+
+
+def memoria(df):
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+
+class EconomiaMemoria:
+    """Memória dos resultados antes e depois da compactação, somada por processo."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.resultados = 0
+        self.bytes_antes = 0
+        self.bytes_depois = 0
+
+    def registrar(self, antes, depois):
+        with self._lock:
+            self.resultados += 1
+            self.bytes_antes += antes
+            self.bytes_depois += depois
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                'resultados': self.resultados,
+                'bytes_antes': self.bytes_antes,
+                'bytes_depois': self.bytes_depois,
+                'razao': self.bytes_antes / self.bytes_depois if self.bytes_depois else 1.0,
+            }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Memória dos resultados de get_consultas() antes e depois da compactação')
+    parser.add_argument('banco', nargs='?', default='sisagua.db')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.banco)
+    particoes.anexar(conn, args.banco)
+    total_antes = total_depois = 0
+    print(f"{'consulta':<28} {'antes (B)':>10} {'depois (B)':>11} {'razão':>6}")
+    for nome in get_consultas():
+        query, params = montar_consulta(nome)
+        df = pd.read_sql_query(query, conn, params=params)
+        antes, depois = memoria(df), memoria(compactar(df))
+        total_antes += antes
+        total_depois += depois
+        print(f'{nome:<28} {antes:>10,} {depois:>11,} {antes / depois:>5.1f}x')
+    print(f"{'total':<28} {total_antes:>10,} {total_depois:>11,} {total_antes / total_depois:>5.1f}x")